@@ -1,2 +1,13 @@
 from .dataset import *
-from .attributes import *
\ No newline at end of file
+from .writer import *
+from .pipeline import *
+from .sampler import *
+from .attributes import *
+from .shard import *
+from .tail import *
+from .stream import *
+from .prefetch import *
+from .backend import *
+from .convert import *
+from .compression import *
+from .profile import *
\ No newline at end of file
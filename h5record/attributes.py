@@ -1,22 +1,149 @@
+import io
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
 import h5py as h5
 import numpy as np
 
+from .flat import FlatColumn, create_flat, append_flat, stack_flat
+from .compression import compression_kwargs
+
 try:
     from PIL import Image as PImage
     from PIL import ImageSequence as PImageSequence
 except ImportError as e:
     pass
 
+# chunks of variable length data only store heap references, about 16 bytes per element
+VLEN_ROW_NBYTES = 16
+CHUNK_MAX_NBYTES = 1024 * 1024
+
+def auto_chunk_size(row_nbytes, data_length=None, max_nbytes=CHUNK_MAX_NBYTES):
+    '''
+        Pick the largest number of rows per chunk which fits in max_nbytes
+
+        capped at data_length so short datasets are one chunk, rows larger than max_nbytes
+        are stored one row per chunk
+    '''
+    assert max_nbytes > 0
+    row_nbytes = max(int(row_nbytes), 1)
+    rows = max(max_nbytes // row_nbytes, 1)
+    if data_length is not None:
+        rows = min(rows, max(data_length, 1))
+    return int(rows)
+
+def vlen_stack(values, dtype):
+    # pack transformed rows into a N x 1 object matrix which h5py writes as vlen elements
+    rows = [ row for value in values for row in value ]
+    block = np.empty((len(rows), 1), dtype=object)
+    for idx, row in enumerate(rows):
+        block[idx, 0] = np.asarray(row, dtype=dtype).flatten()
+    return block
+
+
+def dtype_name(dtype):
+    # readable name of numpy / h5py dtype, 'int64', 'vlen:int32' or 'string:utf-8'
+    string_info = h5.check_string_dtype(np.dtype(dtype))
+    if string_info is not None:
+        return 'string:' + string_info.encoding
+    vlen = h5.check_vlen_dtype(np.dtype(dtype))
+    if vlen is not None:
+        return 'vlen:' + np.dtype(vlen).name
+    return np.dtype(dtype).name
+
+
 class Attribute():
 
+    # rows per chunk, overrides the dataset chunk_size when set
+    chunk_size = None
+    # compression of this column (see compression_kwargs), overrides the dataset compression when set,
+    # False stores the column uncompressed
+    compression = None
+    # constructor arguments stored in the file to rebuild the attribute
+    config_keys = ('name', 'chunk_size', 'compression')
+
+    def config(self):
+        '''
+            Description of the attribute stored in the file, constructor arguments plus
+            class, dtype, storage and encoding for readers which do not rebuild the attribute
+        '''
+        config = { 'class': self.__class__.__name__, 'dtype': dtype_name(self.dtype),
+            'storage': getattr(self, 'storage', 'dataset') }
+        if hasattr(self, 'encoding'):
+            config['encoding'] = self.encoding
+        config['args'] = { key: getattr(self, key) for key in self.config_keys }
+        return config
+
     def append(self, h5, data):
         raise NotImplementedError
 
     def transform(self, data):
         raise NotImplementedError
 
-
-    def init_attributes(self, fout, value, compression, data_length):
+    def stack(self, values):
+        # merge a list of transformed rows into one block for a single slab write
+        return np.concatenate(values, axis=0)
+
+    def decode(self, raw_output):
+        # convert one stored row into the value returned by H5Dataset
+        return raw_output
+
+    def read(self, source, idx):
+        return self.decode(source[idx])
+
+    def restore(self, raw_output):
+        # inverse of decode, one stored row back to a value accepted by transform, used by converters
+        return self.decode(raw_output)
+
+    def read_slice(self, source, start, stop):
+        # read rows [start, stop) with a single hyperslab selection
+        return source[start:stop]
+
+
+    def row_nbytes(self, value):
+        # bytes of one transformed row, used by chunk auto tuning
+        value = np.asarray(value)
+        return value.nbytes // max(value.shape[0], 1)
+
+    def chunks(self, value, chunk_size, data_length):
+        '''
+            Chunk shape of the dataset, only first dimension is chunked
+
+            chunk_size: number of rows or 'auto' to derive from row byte size
+        '''
+        if self.chunk_size is not None:
+            chunk_size = self.chunk_size
+        if chunk_size is None:
+            return None
+        if chunk_size == 'auto':
+            chunk_size = auto_chunk_size(self.row_nbytes(value), data_length)
+        elif data_length is not None:
+            chunk_size = min(chunk_size, max(data_length, 1))
+        return (int(chunk_size), ) + tuple(self.max_shape[1:])
+
+    def filters(self, compression, dtype=None):
+        # create_dataset arguments of the column compression, picked over the dataset compression,
+        # lossy float scaleoffset is only applied when set on the column itself
+        lossy = self.compression is not None
+        if self.compression is not None:
+            compression = self.compression
+        if compression is False:
+            return {}
+        return compression_kwargs(compression, self.dtype if dtype is None else dtype, lossy=lossy)
+
+    def flat_chunks(self, values, chunk_size):
+        '''
+            Chunk length of offsets and values dataset for flat storage
+
+            values: 1D values of the first row
+        '''
+        rows = chunk_size if self.chunk_size is None else self.chunk_size
+        if rows is None or rows == 'auto':
+            return auto_chunk_size(self.row_nbytes(values)), auto_chunk_size(values.dtype.itemsize)
+        # explicit rows per chunk, values chunk holds about the same rows
+        return rows, rows * max(len(values), 1)
+
+    def init_attributes(self, fout, value, compression, data_length, chunk_size=None):
         value = self.transform(value)
         max_shape = list(self.max_shape)
         max_shape[0] = data_length
@@ -26,7 +153,8 @@ class Attribute():
         fout.create_dataset(self.name, data=value, shape=shape, 
             maxshape=max_shape, 
             dtype=self.dtype, 
-            compression=compression )
+            chunks=self.chunks(value, chunk_size, data_length),
+            **self.filters(compression) )
 
 
 class Integer(Attribute):
@@ -34,8 +162,10 @@ class Integer(Attribute):
         One dimensional data shape
     '''
     dtype = 'int64'
-    def __init__(self, name='label'):
+    def __init__(self, name='label', chunk_size=None, compression=None):
         self.name = name
+        self.chunk_size = chunk_size
+        self.compression = compression
         self.shape = (None, )
         self.max_shape = (None, )
 
@@ -52,8 +182,10 @@ class Float(Attribute):
         One dimensional data shape
     '''
     dtype = 'float32'
-    def __init__(self, name='label'):
+    def __init__(self, name='label', chunk_size=None, compression=None):
         self.name = name
+        self.chunk_size = chunk_size
+        self.compression = compression
         self.shape = (None, )
         self.max_shape = (None, )
 
@@ -75,11 +207,14 @@ class Float16(Float):
 class Image(Attribute):
 
     dtype = 'uint8'
-    def __init__(self, h, w, c=3, name='image'):
+    config_keys = ('h', 'w', 'c', 'name', 'chunk_size', 'compression')
+    def __init__(self, h, w, c=3, name='image', chunk_size=None, compression=None):
         self.c = c
         self.h = h
         self.w = w
         self.name = name
+        self.chunk_size = chunk_size
+        self.compression = compression
 
         self.shape = (None, self.c, self.h, self.w)
         self.max_shape = (None, self.c, self.h, self.w)
@@ -108,15 +243,126 @@ class Image(Attribute):
             data = np.expand_dims(data, axis=0)
         return data
 
+class EncodedImage(Image):
+    '''
+        Image stored as compressed jpeg / png / webp bytes instead of raw C x H x W pixels
+
+        rows are kept in one offset indexed byte dataset, reads decode back to C x H x W uint8,
+        batched reads decode on a thread pool as PIL releases the GIL while decoding
+
+        codec: 'jpeg', 'png' or 'webp'
+        quality: jpeg / webp quality, png is always lossless
+        num_threads: decode threads used by batched reads
+    '''
+    codecs = { 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP' }
+    # rows of the flat storage are returned as bytes
+    flat_kind = 'bytes'
+    config_keys = ('h', 'w', 'c', 'name', 'chunk_size', 'codec', 'quality', 'num_threads', 'compression')
+
+    def __init__(self, h, w, c=3, name='image', chunk_size=None, 
+        codec='jpeg', quality=90, num_threads=4, compression=None):
+        super().__init__(h, w, c=c, name=name, chunk_size=chunk_size, compression=compression)
+        assert codec in self.codecs, "codec must be one of {}".format(list(self.codecs))
+        assert c in [1, 3], "only grayscale or RGB image can be encoded"
+        self.codec = codec
+        self.quality = quality
+        self.num_threads = num_threads
+        self.storage = 'flat'
+        self.max_shape = (None, 1)
+        self._pool = None
+        self._pool_pid = None
+
+    def __getstate__(self):
+        # thread pool is created again in every process
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['_pool_pid'] = None
+        return state
+
+    @property
+    def pool(self):
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=self.num_threads)
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    def encode(self, data):
+        # C x H x W uint8 array to encoded bytes
+        data = np.asarray(data, dtype=np.uint8)
+        if self.c == 1:
+            img = PImage.fromarray(data[0], mode='L')
+        else:
+            img = PImage.fromarray(np.ascontiguousarray(np.transpose(data, (1, 2, 0))), mode='RGB')
+        buffer = io.BytesIO()
+        kwargs = {} if self.codec == 'png' else { 'quality': self.quality }
+        img.save(buffer, format=self.codecs[self.codec], **kwargs)
+        return buffer.getvalue()
+
+    def transform(self, data):
+        # encoded bytes are stored as is, arrays are encoded with the selected codec
+        if isinstance(data, (bytes, bytearray)):
+            return [ bytes(data) ]
+        data = np.asarray(data)
+        if len(data.shape) == 4:
+            return [ self.encode(row) for row in data ]
+        return [ self.encode(data) ]
+
+    def stack(self, values):
+        return stack_flat([ np.frombuffer(row, dtype=np.uint8)
+            for value in values for row in value ], np.uint8)
+
+    def append(self, h5, data):
+        values, lengths = data
+        return append_flat(h5, self.name, values, lengths)
+
+    def restore(self, raw_output):
+        # encoded bytes are copied as is instead of decoding and encoding again
+        return raw_output[0]
+
+    def decode(self, raw_output):
+        img = PImage.open(io.BytesIO(raw_output[0]))
+        img = img.convert('L' if self.c == 1 else 'RGB')
+        if img.size != (self.w, self.h):
+            img = img.resize((self.w, self.h))
+        np_img = np.array(img)
+        if len(np_img.shape) == 2:
+            np_img = np.expand_dims(np_img, -1)
+        return np.transpose(np_img, (2, 0, 1))
+
+    def read_slice(self, source, start, stop):
+        if isinstance(source, FlatColumn):
+            values, offsets = source.slab(start, stop)
+            buffer = values.tobytes()
+            rows = [ [ buffer[offsets[idx]:offsets[idx+1]] ] for idx in range(len(offsets) - 1) ]
+        else:
+            rows = source[start:stop]
+        output = np.empty((len(rows), self.c, self.h, self.w), dtype=np.uint8)
+        for idx, np_img in enumerate(self.pool.map(self.decode, rows)):
+            output[idx] = np_img
+        return output
+
+    def row_nbytes(self, value):
+        return np.dtype('uint64').itemsize
+
+    def init_attributes(self, fout, value, compression, data_length, chunk_size=None):
+        values, _ = self.stack([ self.transform(value) ])
+        row_chunks, value_chunks = self.flat_chunks(values, chunk_size)
+        create_flat(fout, self.name, values, self.flat_kind, self.filters(compression, values.dtype), data_length,
+            row_chunks, value_chunks, offset_dtype='uint64')
+
+
 class ImageSequence(Attribute):
     dtype = h5.special_dtype(vlen=np.dtype('uint8'))
     img_channel = 3
+    config_keys = ('h', 'w', 'c', 'name', 'chunk_size', 'compression')
 
-    def __init__(self, h, w, c=3, name='img_seq'):
+    def __init__(self, h, w, c=3, name='img_seq', chunk_size=None, compression=None):
         self.c = c
         self.h = h
         self.w = w
         self.name = name
+        self.chunk_size = chunk_size
+        self.compression = compression
 
         self.shape = (1, 1, )
         self.max_shape = (None, 1, )
@@ -147,12 +393,36 @@ class ImageSequence(Attribute):
             data = np.array([data.flatten() ], dtype=self.dtype)
         return data
 
+    def stack(self, values):
+        return vlen_stack(values, h5.check_vlen_dtype(self.dtype))
+
+    def decode(self, raw_output):
+        # heavy reshaping is needed as variable length dimension (last dimension)
+        # is always treated as np.array
+        # rendering high dimension shape becomes a np.object matrix
+        # 
+        return raw_output[0].reshape(
+            self.img_channel, self.w, self.h, -1  )
+
+    def restore(self, raw_output):
+        return np.asarray(raw_output[0]).flatten()
+
+    def read_slice(self, source, start, stop):
+        raw_output = source[start:stop]
+        output = np.empty(len(raw_output), dtype=object)
+        for idx, row in enumerate(raw_output):
+            output[idx] = self.decode(row)
+        return output
+
     def append(self, h5, data):
         h5[self.name].resize( h5[self.name].shape[0]+data.shape[0], axis=0)
-        h5[self.name][-1] = data
+        h5[self.name][-data.shape[0]:] = data
         return h5
 
-    def init_attributes(self, fout, value, compression, data_length):
+    def row_nbytes(self, value):
+        return VLEN_ROW_NBYTES
+
+    def init_attributes(self, fout, value, compression, data_length, chunk_size=None):
         max_shape = self.max_shape
         max_shape = list(self.max_shape)
         max_shape[0] = data_length
@@ -162,22 +432,40 @@ class ImageSequence(Attribute):
             shape=self.shape,
             maxshape=max_shape,
             dtype=self.dtype, 
-            compression=compression )
+            chunks=self.chunks(value, chunk_size, data_length),
+            **self.filters(compression) )
         dset[0] = value
 
 
 class Sequence(Attribute):
 
     dtype = h5.special_dtype(vlen=np.dtype('int32'))
-
-    def __init__(self, name='sequence', sub_attributes=None):
+    config_keys = ('name', 'sub_attributes', 'chunk_size', 'storage', 'compression')
+
+    def __init__(self, name='sequence', sub_attributes=None, chunk_size=None, storage='vlen', compression=None):
+        '''
+            storage:
+                'vlen' stores each row as HDF5 variable length element
+                'flat' stores all rows in one 1D values dataset with int64 offsets, 
+                which is faster to read and compress
+            compression: HDF5 filters only see the heap references of vlen rows, use flat
+                storage for the values to be compressed
+        '''
+        assert storage in ['vlen', 'flat'], "storage must be vlen or flat"
+        assert storage == 'vlen' or sub_attributes is None, "sub attributes only support vlen storage"
         self.name = name
+        self.chunk_size = chunk_size
+        self.storage = storage
+        self.compression = compression
         self.shape = (1, 1, )
         self.sub_attributes = sub_attributes
         self.max_shape = (None, 1, )
 
 
     def append(self, h5, data):
+        if self.storage == 'flat':
+            values, lengths = data
+            return append_flat(h5, self.name, values, lengths)
         if isinstance(data, dict):
             for key in self.sub_attributes:
                 np_seq = data[key]
@@ -192,6 +480,16 @@ class Sequence(Attribute):
 
         return h5
 
+    def restore(self, raw_output):
+        return np.asarray(raw_output[0])
+
+    def stack(self, values):
+        if self.storage == 'flat':
+            return stack_flat([ row for value in values for row in value ], h5.check_vlen_dtype(self.dtype))
+        if isinstance(values[0], dict):
+            return { key: vlen_stack([ value[key] for value in values ], h5.check_vlen_dtype(self.dtype))
+                for key in self.sub_attributes }
+        return vlen_stack(values, h5.check_vlen_dtype(self.dtype))
 
     def transform(self, data):
         if isinstance(data, dict):
@@ -211,7 +509,21 @@ class Sequence(Attribute):
         else:
             raise ValueError("invalid data type: {}".format(type(data)))
 
-    def init_attributes(self, fout, value, compression, data_length):
+    def row_nbytes(self, value):
+        if self.storage == 'flat':
+            # offsets dataset holds one int64 per row
+            return np.dtype('int64').itemsize
+        return VLEN_ROW_NBYTES
+
+    def init_attributes(self, fout, value, compression, data_length, chunk_size=None):
+        if self.storage == 'flat':
+            dtype = h5.check_vlen_dtype(self.dtype)
+            values, _ = stack_flat(self.transform(value), dtype)
+            row_chunks, value_chunks = self.flat_chunks(values, chunk_size)
+            create_flat(fout, self.name, values, 'array', self.filters(compression, values.dtype), data_length,
+                row_chunks, value_chunks)
+            return
+
         max_shape = self.max_shape
         max_shape = list(self.max_shape)
         max_shape[0] = data_length
@@ -221,7 +533,8 @@ class Sequence(Attribute):
             shape=self.shape,
             maxshape=max_shape,
             dtype=self.dtype, 
-            compression=compression )
+            chunks=self.chunks(value, chunk_size, data_length),
+            **self.filters(compression) )
         dset[0] = value
 
 # hard to define how small float should be
@@ -236,13 +549,28 @@ class String(Attribute):
 
     encoding = 'utf-8'
     dtype = h5.string_dtype(encoding='utf-8')
-
-    def __init__(self, name='string'):
+    flat_kind = 'bytes'
+    config_keys = ('name', 'chunk_size', 'storage', 'compression')
+
+    def __init__(self, name='string', chunk_size=None, storage='vlen', compression=None):
+        '''
+            storage:
+                'vlen' stores each row as HDF5 variable length string
+                'flat' stores utf-8 bytes of all rows in one uint8 dataset with uint64 offsets,
+                batch read is a single slab read and compress much better
+        '''
+        assert storage in ['vlen', 'flat'], "storage must be vlen or flat"
         self.name = name
+        self.chunk_size = chunk_size
+        self.storage = storage
+        self.compression = compression
         self.max_shape = (None, 1)
         self.shape = None
 
     def append(self, h5, data):
+        if self.storage == 'flat':
+            values, lengths = data
+            return append_flat(h5, self.name, values, lengths)
         buf_size = len(data)
         h5[self.name].resize((h5[self.name].shape[0]+buf_size), axis=0)
         h5[self.name][-buf_size:] = data
@@ -252,7 +580,50 @@ class String(Attribute):
         assert isinstance(data, str)
         return [data]
 
-    def init_attributes(self, fout, value, compression, data_length):
+    def stack(self, values):
+        if self.storage == 'flat':
+            return stack_flat([ np.frombuffer(row.encode(self.encoding), dtype=np.uint8)
+                for value in values for row in value ], np.uint8)
+        return np.array([ row for value in values for row in value ], dtype=object).reshape(-1, 1)
+
+    def decode(self, raw_output):
+        return raw_output[0].decode(self.encoding)
+
+    def read_slice(self, source, start, stop):
+        if isinstance(source, FlatColumn):
+            return self.decode_slab(*source.slab(start, stop))
+        raw_output = source[start:stop]
+        output = np.empty(len(raw_output), dtype=object)
+        for idx, row in enumerate(raw_output):
+            output[idx] = row[0].decode(self.encoding)
+        return output
+
+    def decode_slab(self, values, offsets):
+        # split one contiguous byte buffer into strings
+        buffer = values.tobytes()
+        output = np.empty(len(offsets) - 1, dtype=object)
+        if buffer.isascii():
+            # byte offsets equal character offsets, decode the whole slab once
+            text = buffer.decode('ascii')
+            output[:] = [ text[offsets[idx]:offsets[idx+1]] for idx in range(len(output)) ]
+        else:
+            output[:] = [ buffer[offsets[idx]:offsets[idx+1]].decode(self.encoding) 
+                for idx in range(len(output)) ]
+        return output
+
+    def row_nbytes(self, value):
+        if self.storage == 'flat':
+            return np.dtype('uint64').itemsize
+        return VLEN_ROW_NBYTES
+
+    def init_attributes(self, fout, value, compression, data_length, chunk_size=None):
+        if self.storage == 'flat':
+            values, _ = self.stack([ self.transform(value) ])
+            row_chunks, value_chunks = self.flat_chunks(values, chunk_size)
+            create_flat(fout, self.name, values, self.flat_kind, self.filters(compression, values.dtype), data_length,
+                row_chunks, value_chunks, offset_dtype='uint64')
+            return
+
         value = self.transform(value)
         max_shape = list(self.max_shape)
         max_shape[0] = data_length
@@ -263,4 +634,44 @@ class String(Attribute):
         fout.create_dataset(self.name, data=value, shape=shape, 
             maxshape=max_shape, 
             dtype=self.dtype, 
-            compression=compression )
+            chunks=self.chunks(value, chunk_size, data_length),
+            **self.filters(compression) )
+
+
+def attribute_classes(base=Attribute):
+    # every subclass by class name, attributes defined outside h5record are found once imported
+    classes = {}
+    for cls in base.__subclasses__():
+        classes[cls.__name__] = cls
+        classes.update(attribute_classes(cls))
+    return classes
+
+
+def attribute_from_config(config):
+    classes = attribute_classes()
+    if config['class'] not in classes:
+        raise ValueError("attribute class {} is not defined, import the module which defines it".format(
+            config['class']))
+    return classes[config['class']](**config['args'])
+
+
+def write_schema(fout, schema, keys=None):
+    '''
+        Store the schema as a JSON list in the 'schema' attribute of the file
+    '''
+    keys = list(schema.keys()) if keys is None else keys
+    fout.attrs['schema'] = json.dumps([ schema[key].config() for key in keys ])
+
+
+def read_schema(fin, columns=None):
+    '''
+        Rebuild the schema dictionary stored by write_schema, None when the file has no schema
+
+        fin: open h5py file or group
+        columns: only build the attributes of these columns, other classes need not be importable
+    '''
+    if 'schema' not in fin.attrs:
+        return None
+    configs = json.loads(fin.attrs['schema'])
+    return { config['args']['name']: attribute_from_config(config) for config in configs
+        if columns is None or config['args']['name'] in columns }
@@ -0,0 +1,642 @@
+import os
+import json
+import pickle
+import shutil
+import struct
+import threading
+import h5py as h5
+import numpy as np
+
+from .flat import FlatColumn, is_flat, num_rows
+
+
+class Backend:
+    '''
+        Storage of H5Record columns
+
+        open(mode): 'r' read, 'w' create (existing data is removed), 'a' append
+        create_column(attribute, value, ...): create a column from the first (untransformed) row
+        append(attribute, block): bulk append rows stacked by attribute.stack
+        keys(), backend[key]: stored columns, a column returns rows in the same layout as an h5py dataset
+        attrs: metadata such as the stored schema
+        len(backend): number of rows
+    '''
+    name = None
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def open(self, mode='r'):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def keys(self):
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        raise NotImplementedError
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    @property
+    def attrs(self):
+        raise NotImplementedError
+
+    def create_column(self, attribute, value, compression=None, data_length=None, chunk_size=None):
+        raise NotImplementedError
+
+    def append(self, attribute, block):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def start_swmr(self):
+        # allow readers to open the storage while rows are still appended
+        pass
+
+    def capacity(self):
+        # maximum number of rows, None when unlimited
+        return None
+
+    def check_schema(self, schema):
+        '''
+            Check stored columns against the schema before appending, returns number of stored rows
+        '''
+        stored = set(self.keys())
+        if stored != set(schema.keys()):
+            raise ValueError("schema columns {} do not match stored columns {}".format(
+                sorted(schema.keys()), sorted(stored)))
+        return len(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class HDF5Backend(Backend):
+    '''
+        Every column is a resizable HDF5 dataset (or a group of flat values and offsets) in one file
+    '''
+    name = 'hdf5'
+
+    def __init__(self, filename, rdcc_nbytes=None, rdcc_nslots=None, rdcc_w0=None):
+        super().__init__(filename)
+        self.rdcc = { 'rdcc_nbytes': rdcc_nbytes, 'rdcc_nslots': rdcc_nslots, 'rdcc_w0': rdcc_w0 }
+        self.fout = None
+
+    def open(self, mode='r'):
+        if mode == 'r':
+            self.fout = h5.File(self.filename, 'r', swmr=True, **self.rdcc)
+        else:
+            self.fout = h5.File(self.filename, mode, libver='latest', **self.rdcc)
+        return self
+
+    def close(self):
+        if self.fout is not None:
+            self.fout.close()
+            self.fout = None
+
+    def keys(self):
+        return self.fout.keys()
+
+    def __getitem__(self, key):
+        return self.fout[key]
+
+    @property
+    def attrs(self):
+        return self.fout.attrs
+
+    def create_column(self, attribute, value, compression=None, data_length=None, chunk_size=None):
+        attribute.init_attributes(self.fout, value, compression, data_length, chunk_size)
+
+    def append(self, attribute, block):
+        attribute.append(self.fout, block)
+
+    def __len__(self):
+        keys = list(self.fout.keys())
+        return num_rows(self.fout[keys[0]]) if keys else 0
+
+    def flush(self):
+        self.fout.flush()
+
+    def start_swmr(self):
+        self.fout.swmr_mode = True
+
+    def capacity(self):
+        return max_rows(self.fout)
+
+    def check_schema(self, schema):
+        '''
+            Check names, storage, row shape and row count of the stored HDF5 columns before appending,
+            returns number of stored rows
+        '''
+        super().check_schema(schema)
+        rows = None
+        for key, attribute in schema.items():
+            node = self.fout[key]
+            flat = getattr(attribute, 'storage', 'vlen') == 'flat'
+            if flat != is_flat(node):
+                raise ValueError("column {} is stored as {} but schema uses {} storage".format(
+                    key, 'flat' if is_flat(node) else 'dataset', 'flat' if flat else 'dataset'))
+            if not flat and hasattr(attribute, 'max_shape'):
+                expected = tuple(attribute.max_shape[1:])
+                if len(expected) != len(node.shape[1:]) or any( size is not None and size != stored_size
+                    for size, stored_size in zip(expected, node.shape[1:]) ):
+                    raise ValueError("column {} has row shape {}, schema expects {}".format(
+                        key, node.shape[1:], expected))
+            column_rows = num_rows(node)
+            if rows is not None and column_rows != rows:
+                raise ValueError("column {} has {} rows, other columns have {}".format(key, column_rows, rows))
+            rows = column_rows
+        return rows
+
+
+def max_rows(fout):
+    # maximum number of rows allowed by the dataset maxshape (data_length), None when unlimited
+    limits = []
+    for key in fout.keys():
+        node = fout[key]
+        if is_flat(node):
+            limit = node['offsets'].maxshape[0]
+            limits.append(None if limit is None else limit - 1)
+        else:
+            limits.append(node.maxshape[0])
+    limits = [ limit for limit in limits if limit is not None ]
+    return min(limits) if limits else None
+
+
+def raw_rows(attribute, block):
+    '''
+        Split a block stacked by attribute.stack into rows in the layout h5py returns them
+
+        variable length rows become 1 element object arrays, strings are stored as utf-8 bytes
+    '''
+    if isinstance(block, dict):
+        raise ValueError("sequence sub attributes are only supported by the hdf5 backend")
+    if isinstance(block, tuple):
+        values, lengths = block
+        offsets = np.concatenate([ [0], np.cumsum(lengths) ])
+        column = FlatColumn(values, offsets, kind=getattr(attribute, 'flat_kind', 'array'))
+        return [ column[idx] for idx in range(len(lengths)) ]
+
+    block = np.asarray(block)
+    if block.dtype != object:
+        return list(block)
+    rows = []
+    for row in block:
+        row = np.array(row, dtype=object).reshape(-1)
+        for idx, value in enumerate(row):
+            if isinstance(value, str):
+                row[idx] = value.encode('utf-8')
+        rows.append(row)
+    return rows
+
+
+def stack_rows(rows, shape=(), dtype=None):
+    # inverse of raw_rows, N rows into a block sliced from h5py
+    if len(rows) == 0:
+        return np.empty((0, ) + tuple(shape), dtype=dtype)
+    if isinstance(rows[0], np.ndarray) and rows[0].dtype == object:
+        output = np.empty((len(rows), ) + rows[0].shape, dtype=object)
+        for idx, row in enumerate(rows):
+            output[idx] = row
+        return output
+    return np.stack([ np.asarray(row) for row in rows ])
+
+
+class LMDBAttrs:
+    # metadata entries stored under __meta__/ keys, values are JSON strings like HDF5 attributes
+    prefix = b'__meta__/'
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        with self.backend.env.begin() as txn:
+            value = txn.get(self.prefix + key.encode('utf-8'))
+        return default if value is None else value.decode('utf-8')
+
+    def __setitem__(self, key, value):
+        with self.backend.env.begin(write=True) as txn:
+            txn.put(self.prefix + key.encode('utf-8'), str(value).encode('utf-8'))
+
+
+class LMDBColumn:
+    '''
+        One column of LMDBBackend, supports column[idx] and column[start:stop] like an h5py dataset
+    '''
+    def __init__(self, backend, key):
+        self.backend = backend
+        self.key = key
+        self.name = key
+        self.chunks = None
+        self._sample = None
+
+    @property
+    def sample(self):
+        # first row, decides shape and dtype of the column
+        if self._sample is None and len(self.backend) > 0:
+            self._sample = np.asarray(self.backend.row(0)[self.key])
+        return self._sample
+
+    @property
+    def shape(self):
+        sample = self.sample
+        return (len(self.backend), ) + (() if sample is None else sample.shape)
+
+    @property
+    def dtype(self):
+        sample = self.sample
+        return np.dtype(object) if sample is None else sample.dtype
+
+    def __len__(self):
+        return len(self.backend)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self.backend))
+            assert step == 1, "only contiguous slice is supported"
+            rows = self.backend.rows(start, stop)
+            sample = self.sample
+            return stack_rows([ row[self.key] for row in rows ],
+                () if sample is None else sample.shape, self.dtype)
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self.backend)
+        if idx < 0 or idx >= len(self.backend):
+            raise IndexError("index {} out of range for column of size {}".format(idx, len(self.backend)))
+        return self.backend.row(idx)[self.key]
+
+
+# LMDB allows one environment per path and process, handles of a process share it
+_environments = {}
+_environments_lock = threading.Lock()
+
+
+def _file_id(filename):
+    # identity of the database file, a directory removed and created again is a new environment
+    try:
+        stat = os.stat(os.path.join(filename, 'data.mdb'))
+    except OSError:
+        return None
+    return (stat.st_dev, stat.st_ino)
+
+
+def _open_environment(filename, writable, **kwargs):
+    '''
+        Shared environment entry of filename in this process, released with _close_environment
+    '''
+    try:
+        import lmdb
+    except ImportError:
+        raise ImportError("lmdb backend requires the lmdb package, pip install lmdb")
+    key = os.path.abspath(filename)
+    with _environments_lock:
+        entry = _environments.get(key)
+        if entry is not None and entry['pid'] != os.getpid():
+            # environment inherited through fork can not be used or reopened until it is closed here
+            try:
+                entry['env'].close()
+            except Exception:
+                pass
+            entry = None
+        if entry is not None and entry['file_id'] != _file_id(filename):
+            # database was removed, its remaining handles close the old environment
+            entry = None
+        if entry is not None and writable and not entry['writable']:
+            raise RuntimeError("{} is open read only in this process, close its readers before writing".format(filename))
+        if entry is None:
+            # readers open it writable when possible, so a writer in the same process can share it
+            readonly = not writable and not os.access(filename, os.W_OK)
+            env = lmdb.open(filename, readonly=readonly, subdir=True, create=writable, **kwargs)
+            entry = { 'pid': os.getpid(), 'writable': not readonly, 'refcount': 0,
+                'env': env, 'file_id': _file_id(filename) }
+            _environments[key] = entry
+        entry['refcount'] += 1
+        return entry
+
+
+def _close_environment(filename, entry):
+    with _environments_lock:
+        if entry['pid'] != os.getpid():
+            return
+        entry['refcount'] -= 1
+        if entry['refcount'] > 0:
+            return
+        if _environments.get(os.path.abspath(filename)) is entry:
+            del _environments[os.path.abspath(filename)]
+    entry['env'].close()
+
+
+def _environment_in_use(filename):
+    entry = _environments.get(os.path.abspath(filename))
+    return entry is not None and entry['pid'] == os.getpid() and entry['file_id'] == _file_id(filename)
+
+
+class LMDBBackend(Backend):
+    '''
+        Row keyed LMDB store, every row is one pickled dictionary of column name to stored row
+
+        rows are kept in the same layout as h5py returns them so attributes decode them unchanged,
+        the schema and column names are kept as metadata, requires the lmdb package
+
+        map_size: maximum size of the database, only reserved as address space
+        lock: readers take the LMDB lock, disable only when no writer runs at the same time
+
+        handles of one process (datasets, select() views, prefetch threads, a writer) share one
+        LMDB environment opened with the settings of the first handle, a forked DataLoader worker
+        closes the inherited environment and opens its own
+    '''
+    name = 'lmdb'
+    row_key = struct.Struct('>Q')
+
+    def __init__(self, filename, map_size=1 << 40, readahead=False, max_readers=1024, lock=True):
+        super().__init__(filename)
+        self.map_size = map_size
+        self.readahead = readahead
+        self.max_readers = max_readers
+        self.lock = lock
+        self.env = None
+        self.environment = None
+        self.columns = []
+        self.num_entries = 0
+        self.pending = {}
+        self.cached_row = (None, None)
+        self.cached_rows = (None, None, None)
+
+    def open(self, mode='r'):
+        if mode == 'w' and os.path.exists(self.filename):
+            if _environment_in_use(self.filename):
+                raise RuntimeError("{} is open in this process, close it before overwriting".format(self.filename))
+            shutil.rmtree(self.filename)
+        self.environment = _open_environment(self.filename, mode != 'r', map_size=self.map_size,
+            lock=self.lock, readahead=self.readahead, max_readers=self.max_readers)
+        self.env = self.environment['env']
+        self.columns = json.loads(self.attrs.get('columns', '[]'))
+        self.num_entries = int(self.attrs.get('num_entries', '0'))
+        return self
+
+    def close(self):
+        if self.env is not None:
+            if len(self.pending):
+                self.write_pending()
+            _close_environment(self.filename, self.environment)
+            self.env = None
+            self.environment = None
+
+    def keys(self):
+        return list(self.columns)
+
+    def __getitem__(self, key):
+        if key not in self.columns:
+            raise KeyError(key)
+        return LMDBColumn(self, key)
+
+    @property
+    def attrs(self):
+        return LMDBAttrs(self)
+
+    def __len__(self):
+        return self.num_entries
+
+    def create_column(self, attribute, value, compression=None, data_length=None, chunk_size=None):
+        # compression and chunking do not apply, the first row is written with the next rows
+        self.columns.append(attribute.name)
+        self.attrs['columns'] = json.dumps(self.columns)
+        self.pending[attribute.name] = raw_rows(attribute, attribute.stack([ attribute.transform(value) ]))
+
+    def append(self, attribute, block):
+        self.pending.setdefault(attribute.name, []).extend(raw_rows(attribute, block))
+        self.write_pending()
+
+    def write_pending(self):
+        # rows are written once every column of the batch arrived
+        if set(self.pending.keys()) != set(self.columns):
+            return
+        sizes = set( len(rows) for rows in self.pending.values() )
+        if len(sizes) != 1:
+            return
+        size = sizes.pop()
+        with self.env.begin(write=True) as txn:
+            for idx in range(size):
+                row = { key: self.pending[key][idx] for key in self.columns }
+                txn.put(self.row_key.pack(self.num_entries + idx), pickle.dumps(row, protocol=pickle.HIGHEST_PROTOCOL))
+            self.num_entries += size
+            txn.put(LMDBAttrs.prefix + b'num_entries', str(self.num_entries).encode('utf-8'))
+        self.pending = {}
+
+    def flush(self):
+        self.write_pending()
+        self.env.sync()
+
+    def row(self, idx):
+        # every column of a row reads the same record, the last one is kept
+        if self.cached_row[0] != idx:
+            with self.env.begin(buffers=True) as txn:
+                self.cached_row = (idx, pickle.loads(txn.get(self.row_key.pack(idx))))
+        return self.cached_row[1]
+
+    def rows(self, start, stop):
+        # batched read of rows [start, stop) with one cursor scan, shared by the columns of a batch
+        if self.cached_rows[:2] != (start, stop):
+            rows = []
+            if stop > start:
+                with self.env.begin(buffers=True) as txn:
+                    cursor = txn.cursor()
+                    cursor.set_key(self.row_key.pack(start))
+                    for _, value in cursor:
+                        rows.append(pickle.loads(value))
+                        if len(rows) >= stop - start:
+                            break
+            self.cached_rows = (start, stop, rows)
+        return self.cached_rows[2]
+
+
+class NumpyBackend(Backend):
+    '''
+        Directory of raw column files read with np.memmap, no compression and no HDF5 library lock
+
+        fixed shape columns are one <name>.data.bin file of rows, variable length columns
+        (String, Sequence, ImageSequence, EncodedImage) are <name>.values.bin plus int64 <name>.offsets.bin,
+        dtype, row shape and number of committed rows are kept in h5record.json
+
+        rows become visible to readers when the metadata is written on flush or close
+    '''
+    name = 'numpy'
+    meta_name = 'h5record.json'
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.meta = None
+        self.files = {}
+        self.readonly = True
+
+    def path(self, key, part):
+        return os.path.join(self.filename, '{}.{}.bin'.format(key, part))
+
+    def open(self, mode='r'):
+        if mode == 'w' and os.path.exists(self.filename):
+            shutil.rmtree(self.filename)
+        self.readonly = mode == 'r'
+        meta_path = os.path.join(self.filename, self.meta_name)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                self.meta = json.load(f)
+        elif self.readonly:
+            raise FileNotFoundError("{} is not a numpy backend directory".format(self.filename))
+        else:
+            os.makedirs(self.filename, exist_ok=True)
+            self.meta = { 'columns': {}, 'num_entries': 0, 'attrs': {} }
+        if not self.readonly:
+            # uncommitted bytes of an interrupted write are dropped
+            for key, spec in self.meta['columns'].items():
+                self.truncate(key, spec)
+        return self
+
+    def truncate(self, key, spec):
+        rows = self.meta['num_entries']
+        spec['rows'] = rows
+        if spec['layout'] == 'dense':
+            sizes = { 'data': rows * int(np.prod(spec['shape'], dtype=np.int64)) * np.dtype(spec['dtype']).itemsize }
+        else:
+            offsets = np.fromfile(self.path(key, 'offsets'), dtype=np.int64, count=rows + 1)
+            spec['num_values'] = int(offsets[-1])
+            sizes = { 'offsets': (rows + 1) * 8, 'values': spec['num_values'] * np.dtype(spec['dtype']).itemsize }
+        for part, size in sizes.items():
+            with open(self.path(key, part), 'r+b') as f:
+                f.truncate(size)
+
+    def file(self, key, part):
+        if (key, part) not in self.files:
+            self.files[(key, part)] = open(self.path(key, part), 'ab')
+        return self.files[(key, part)]
+
+    def close(self):
+        if self.meta is not None and not self.readonly:
+            self.flush()
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        self.meta = None
+
+    def keys(self):
+        return list(self.meta['columns'].keys())
+
+    @property
+    def attrs(self):
+        return self.meta['attrs']
+
+    def __len__(self):
+        return self.meta['num_entries']
+
+    def create_column(self, attribute, value, compression=None, data_length=None, chunk_size=None):
+        # compression and chunking do not apply
+        block = attribute.stack([ attribute.transform(value) ])
+        spec = { 'rows': 0 }
+        if isinstance(block, tuple) or np.asarray(block).dtype == object:
+            kind = getattr(attribute, 'flat_kind', 'array')
+            if not isinstance(block, tuple) and isinstance(raw_rows(attribute, block)[0][0], bytes):
+                kind = 'bytes'
+            values, _ = flat_block(attribute, block)
+            spec.update({ 'layout': 'flat', 'dtype': values.dtype.str, 'kind': kind, 'num_values': 0 })
+            np.zeros(1, dtype=np.int64).tofile(self.file(attribute.name, 'offsets'))
+        else:
+            dtype = np.dtype(attribute.dtype)
+            spec.update({ 'layout': 'dense', 'dtype': dtype.str, 'shape': list(np.asarray(block).shape[1:]) })
+        self.meta['columns'][attribute.name] = spec
+        self.append(attribute, block)
+
+    def append(self, attribute, block):
+        spec = self.meta['columns'][attribute.name]
+        if spec['layout'] == 'dense':
+            block = np.ascontiguousarray(block, dtype=spec['dtype'])
+            self.file(attribute.name, 'data').write(block.tobytes())
+            spec['rows'] += len(block)
+            return
+        values, lengths = flat_block(attribute, block)
+        values = np.ascontiguousarray(values, dtype=spec['dtype'])
+        offsets = spec['num_values'] + np.cumsum(lengths, dtype=np.int64)
+        self.file(attribute.name, 'values').write(values.tobytes())
+        self.file(attribute.name, 'offsets').write(offsets.tobytes())
+        spec['num_values'] += len(values)
+        spec['rows'] += len(lengths)
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+        columns = self.meta['columns'].values()
+        self.meta['num_entries'] = min( spec['rows'] for spec in columns ) if len(columns) else 0
+        # readers never see a partially written metadata file
+        meta_path = os.path.join(self.filename, self.meta_name)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def __getitem__(self, key):
+        spec = self.meta['columns'][key]
+        rows = self.meta['num_entries']
+        if spec['layout'] == 'dense':
+            shape = (rows, ) + tuple(spec['shape'])
+            if rows == 0:
+                return np.empty(shape, dtype=spec['dtype'])
+            return np.memmap(self.path(key, 'data'), dtype=spec['dtype'], mode='r', shape=shape)
+        offsets = np.memmap(self.path(key, 'offsets'), dtype=np.int64, mode='r', shape=(rows + 1, ))
+        num_values = int(offsets[-1])
+        if num_values == 0:
+            values = np.empty(0, dtype=spec['dtype'])
+        else:
+            values = np.memmap(self.path(key, 'values'), dtype=spec['dtype'], mode='r', shape=(num_values, ))
+        return FlatColumn(values, offsets, kind=spec['kind'])
+
+
+def flat_block(attribute, block):
+    # values and lengths of a stacked block of variable length rows
+    if isinstance(block, tuple):
+        return block
+    rows = [ row[0] for row in raw_rows(attribute, block) ]
+    rows = [ np.frombuffer(row, dtype=np.uint8) if isinstance(row, bytes) else np.asarray(row).reshape(-1)
+        for row in rows ]
+    lengths = np.array([ len(row) for row in rows ], dtype=np.int64)
+    values = np.concatenate(rows) if rows else np.zeros(0, dtype=np.uint8)
+    return values, lengths
+
+
+BACKENDS = { 'hdf5': HDF5Backend, 'lmdb': LMDBBackend, 'numpy': NumpyBackend }
+
+
+def backend_name(filename, backend=None):
+    '''
+        Backend used for a path, '.lmdb' paths and LMDB directories use lmdb,
+        '.numpy' paths and directories with h5record.json use numpy, others hdf5
+    '''
+    if backend is not None:
+        if backend not in BACKENDS:
+            raise ValueError("unknown backend {}, available {}".format(backend, list(BACKENDS)))
+        return backend
+    if str(filename).endswith('.lmdb') or os.path.exists(os.path.join(str(filename), 'data.mdb')):
+        return 'lmdb'
+    if str(filename).endswith('.numpy') or os.path.exists(os.path.join(str(filename), NumpyBackend.meta_name)):
+        return 'numpy'
+    return 'hdf5'
+
+
+def open_backend(filename, mode='r', backend=None, **kwargs):
+    return BACKENDS[backend_name(filename, backend)](filename, **kwargs).open(mode)
@@ -0,0 +1,234 @@
+'''
+    Benchmark write and read speed of H5Record on synthetic data
+
+    python -m h5record.benchmark --modalities image string --rows 5000 \
+        --compression none lzf gzip --chunk-size auto 64 --workers 0 4 --to-memory --output results.json
+
+    every record of the JSON output is one measurement:
+    {'modality': 'image', 'compression': 'lzf', 'chunk_size': 'auto', 'operation': 'batched',
+     'num_workers': 4, 'to_memory': False, 'rows': 5000, 'seconds': 1.2, 'rows_per_second': 4166.7,
+     'file_bytes': 20512345}
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import h5py as h5
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, BatchSampler
+
+from .dataset import H5Dataset
+from .writer import H5Writer
+from .attributes import Image, ImageSequence, Integer, Sequence, String
+
+MODALITIES = ('image', 'string', 'sequence', 'image_sequence')
+OPERATIONS = ('sequential', 'random', 'batched')
+
+
+def make_schema(modality, image_size=64):
+    if modality == 'image':
+        column = Image(name='data', h=image_size, w=image_size)
+    elif modality == 'string':
+        column = String(name='data')
+    elif modality == 'sequence':
+        column = Sequence(name='data')
+    elif modality == 'image_sequence':
+        column = ImageSequence(name='data', h=image_size, w=image_size)
+    else:
+        raise ValueError("unknown modality {}, expected one of {}".format(modality, MODALITIES))
+    return ( column, Integer(name='label') )
+
+
+def make_rows(modality, num_rows, image_size=64, seed=0):
+    '''
+        Synthetic rows of one modality, images are smooth gradients plus noise so compression
+        behaves closer to natural images than pure noise would
+    '''
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 200, image_size, dtype=np.float32)
+    base = (gradient[None, :, None] + gradient[None, None, :]) / 2
+    words = [ 'the', 'quick', 'brown', 'fox', 'jumps', 'over', 'lazy', 'dog', 'h5record', 'chunk' ]
+    for idx in range(num_rows):
+        if modality == 'image':
+            data = (base + rng.integers(0, 32, (3, image_size, image_size))).astype(np.uint8)
+        elif modality == 'string':
+            data = ' '.join( words[word] for word in rng.integers(0, len(words), int(rng.integers(8, 64))) )
+        elif modality == 'sequence':
+            data = rng.integers(0, 30000, int(rng.integers(16, 512))).astype(np.int32)
+        elif modality == 'image_sequence':
+            frames = int(rng.integers(2, 8))
+            data = (base[..., None] + rng.integers(0, 32, (3, image_size, image_size, frames))).astype(np.uint8).flatten()
+        else:
+            raise ValueError("unknown modality {}, expected one of {}".format(modality, MODALITIES))
+        yield { 'data': data, 'label': idx }
+
+
+def identity_collate(rows):
+    # measure reads only, rows are not converted into tensors
+    return rows
+
+
+def benchmark_write(modality, filename, num_rows, compression=None, chunk_size='auto',
+    image_size=64, buffer_size=1000, seed=0):
+    rows = list(make_rows(modality, num_rows, image_size, seed))
+    start = time.perf_counter()
+    with H5Writer(make_schema(modality, image_size), filename, compression=compression,
+        chunk_size=chunk_size, buffer_size=buffer_size) as writer:
+        for row in rows:
+            writer.write(row)
+    seconds = time.perf_counter() - start
+    return { 'operation': 'write', 'num_workers': 0, 'to_memory': False, 'rows': num_rows,
+        'seconds': seconds, 'rows_per_second': num_rows / seconds, 'file_bytes': os.path.getsize(filename) }
+
+
+def benchmark_read(dataset, operation, num_workers=0, batch_size=64, seed=0):
+    '''
+        Read every row once through a DataLoader
+
+        sequential: one row per fetch in file order
+        random: one row per fetch in random order
+        batched: random batches of batch_size rows, read with one batched call per batch
+    '''
+    num_rows = len(dataset)
+    if operation == 'sequential':
+        indices = list(range(num_rows))
+    elif operation in ['random', 'batched']:
+        indices = np.random.default_rng(seed).permutation(num_rows).tolist()
+    else:
+        raise ValueError("unknown operation {}, expected one of {}".format(operation, OPERATIONS))
+
+    if operation == 'batched':
+        loader = DataLoader(dataset, batch_sampler=BatchSampler(indices, batch_size, drop_last=False),
+            num_workers=num_workers, collate_fn=identity_collate)
+    else:
+        loader = DataLoader(dataset, batch_size=None, sampler=indices,
+            num_workers=num_workers, collate_fn=identity_collate)
+
+    start = time.perf_counter()
+    for _ in loader:
+        pass
+    seconds = time.perf_counter() - start
+    return { 'operation': operation, 'num_workers': num_workers, 'rows': num_rows,
+        'seconds': seconds, 'rows_per_second': num_rows / seconds }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'h5py': h5.version.version,
+        'hdf5': h5.version.hdf5_version,
+        'torch': torch.__version__,
+    }
+
+
+def run_benchmark(modalities=MODALITIES, num_rows=2000, compressions=(None, 'lzf', 'gzip'),
+    chunk_sizes=('auto', ), workers=(0, ), to_memory=(False, ), operations=OPERATIONS,
+    batch_size=64, image_size=64, workdir=None, seed=0, verbose=0):
+    '''
+        Write one file per modality, compression and chunk size, then read it back with every
+        operation, worker count and to_memory setting
+
+        returns {'environment': {...}, 'config': {...}, 'results': [record, ...]}
+    '''
+    config = { 'modalities': list(modalities), 'num_rows': num_rows,
+        'compressions': list(compressions), 'chunk_sizes': list(chunk_sizes), 'workers': list(workers),
+        'to_memory': list(to_memory), 'operations': list(operations), 'batch_size': batch_size,
+        'image_size': image_size, 'seed': seed }
+    remove_workdir = workdir is None
+    workdir = tempfile.mkdtemp(prefix='h5record-benchmark-') if workdir is None else workdir
+    os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    def record(setting, result):
+        result = dict(setting, **result)
+        results.append(result)
+        if verbose:
+            print('{modality:<15} {compression!s:<8} {chunk_size!s:<6} {operation:<10} workers={num_workers} '
+                'to_memory={to_memory!s:<5} {rows_per_second:>12.1f} rows/s'.format(**result))
+
+    try:
+        for modality in modalities:
+            for compression in compressions:
+                for chunk_size in chunk_sizes:
+                    filename = os.path.join(workdir, '{}-{}-{}.h5'.format(modality,
+                        compression_label(compression), chunk_size))
+                    setting = { 'modality': modality, 'compression': compression, 'chunk_size': chunk_size }
+                    write = benchmark_write(modality, filename, num_rows, compression, chunk_size,
+                        image_size, seed=seed)
+                    record(setting, write)
+
+                    for memory in to_memory:
+                        dataset = H5Dataset.open(filename, to_memory=memory)
+                        for operation in operations:
+                            for num_workers in workers:
+                                read = benchmark_read(dataset, operation, num_workers, batch_size, seed)
+                                record(setting, dict(read, to_memory=memory, file_bytes=write['file_bytes']))
+                        dataset.close()
+                    os.remove(filename)
+    finally:
+        if remove_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return { 'environment': environment(), 'config': config, 'results': results }
+
+
+def compression_label(compression):
+    if compression is None:
+        return 'none'
+    if isinstance(compression, dict):
+        return '_'.join( '{}{}'.format(key, value) for key, value in sorted(compression.items()) )
+    return str(compression)
+
+
+def parse_compression(value):
+    # 'none', a filter name or a JSON dict of create_dataset arguments
+    if value.lower() == 'none':
+        return None
+    if value.startswith('{'):
+        return json.loads(value)
+    return value
+
+
+def parse_chunk_size(value):
+    return value if value == 'auto' else int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark write and read speed of H5Record')
+    parser.add_argument('--modalities', nargs='+', default=list(MODALITIES), choices=MODALITIES)
+    parser.add_argument('--rows', type=int, default=2000, help='rows written per file')
+    parser.add_argument('--compression', nargs='+', type=parse_compression, default=[None, 'lzf', 'gzip'],
+        help="'none', filter name or JSON dict such as '{\"compression\": \"gzip\", \"shuffle\": true}'")
+    parser.add_argument('--chunk-size', nargs='+', type=parse_chunk_size, default=['auto'])
+    parser.add_argument('--workers', nargs='+', type=int, default=[0], help='DataLoader worker counts')
+    parser.add_argument('--to-memory', action='store_true', help='read with to_memory=True as well')
+    parser.add_argument('--operations', nargs='+', default=list(OPERATIONS), choices=OPERATIONS)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--image-size', type=int, default=64)
+    parser.add_argument('--workdir', default=None, help='directory of the benchmark files, a temporary one by default')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='JSON file of the results, stdout by default')
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(modalities=args.modalities, num_rows=args.rows, compressions=args.compression,
+        chunk_sizes=args.chunk_size, workers=args.workers,
+        to_memory=(False, True) if args.to_memory else (False, ), operations=args.operations,
+        batch_size=args.batch_size, image_size=args.image_size, workdir=args.workdir, seed=args.seed,
+        verbose=1 if args.output is not None else 0)
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
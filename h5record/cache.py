@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def array_nbytes(array):
+    # object arrays only report pointer size, count the referenced rows as well
+    if array.dtype != object:
+        return array.nbytes
+    nbytes = array.nbytes
+    for value in array.flat:
+        if isinstance(value, np.ndarray):
+            nbytes += value.nbytes
+        elif isinstance(value, (bytes, str)):
+            nbytes += len(value)
+    return nbytes
+
+
+class ChunkCache:
+    '''
+        LRU cache of decompressed chunks keyed by (column, chunk id)
+
+        capacity: maximum bytes of chunks kept in memory
+        each DataLoader worker owns its own cache, so the budget is per worker
+    '''
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.chunks = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, loader):
+        with self.lock:
+            if key in self.chunks:
+                self.hits += 1
+                self.chunks.move_to_end(key)
+                return self.chunks[key][0]
+            self.misses += 1
+
+        chunk = loader()
+        nbytes = array_nbytes(chunk)
+        if nbytes > self.capacity:
+            # chunk never fits, do not flush the whole cache for it
+            return chunk
+
+        with self.lock:
+            if key not in self.chunks:
+                self.chunks[key] = (chunk, nbytes)
+                self.nbytes += nbytes
+            while self.nbytes > self.capacity:
+                _, (_, evicted_nbytes) = self.chunks.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+                self.evictions += 1
+        return chunk
+
+    def clear(self):
+        with self.lock:
+            self.chunks.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'nbytes': self.nbytes,
+            'capacity': self.capacity,
+            'chunks': len(self.chunks),
+        }
+
+
+class CachedColumn:
+    '''
+        Read only view of a chunked h5py dataset which serves rows from ChunkCache
+
+        supports integer and slice access on the first axis, same as used by Attribute.read
+    '''
+    def __init__(self, dataset, cache, key=None):
+        self.dataset = dataset
+        self.cache = cache
+        self.key = dataset.name if key is None else key
+        self.chunk_rows = dataset.chunks[0]
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+        self.chunks = dataset.chunks
+
+    def __len__(self):
+        return self.shape[0]
+
+    def chunk(self, chunk_id):
+        start = chunk_id * self.chunk_rows
+        return self.cache.get((self.key, chunk_id),
+            lambda: self.dataset[start:start+self.chunk_rows])
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(self.shape[0])
+            if step != 1:
+                return self.dataset[idx]
+            if stop <= start:
+                return self.dataset[start:start]
+            first, last = start // self.chunk_rows, (stop - 1) // self.chunk_rows
+            blocks = []
+            for chunk_id in range(first, last + 1):
+                offset = chunk_id * self.chunk_rows
+                blocks.append(self.chunk(chunk_id)[max(start - offset, 0):stop - offset])
+            # rows are copied so that caller can not modify the cached chunk
+            return blocks[0].copy() if len(blocks) == 1 else np.concatenate(blocks, axis=0)
+
+        idx = int(idx)
+        if idx < 0:
+            idx += self.shape[0]
+        if idx < 0 or idx >= self.shape[0]:
+            raise IndexError("index {} out of range for column of size {}".format(idx, self.shape[0]))
+        row = self.chunk(idx // self.chunk_rows)[idx % self.chunk_rows]
+        return row.copy() if isinstance(row, np.ndarray) else row
@@ -0,0 +1,207 @@
+import io
+import time
+import h5py as h5
+import numpy as np
+
+from .flat import FlatColumn, is_vlen
+
+try:
+    # registers blosc, lz4, zstd, bitshuffle ... filters with the HDF5 library when installed
+    import hdf5plugin
+except ImportError as e:
+    pass
+
+# filters built into HDF5 / h5py
+BUILTIN_FILTERS = { 'gzip': h5.h5z.FILTER_DEFLATE, 'lzf': 32000, 'szip': h5.h5z.FILTER_SZIP }
+# registered ids of common plugin filters, usable once the library has loaded them
+PLUGIN_FILTERS = { 'bzip2': 307, 'blosc': 32001, 'lz4': 32004, 'bshuf': 32008, 'zstd': 32015, 'blosc2': 32026 }
+COMPRESSION_KEYS = ('compression', 'compression_opts', 'shuffle', 'scaleoffset', 'fletcher32')
+
+
+def available_filters():
+    '''
+        Compression filters usable by this h5py build, {name: filter id}
+    '''
+    filters = {}
+    for name, filter_id in list(BUILTIN_FILTERS.items()) + list(PLUGIN_FILTERS.items()):
+        if h5.h5z.filter_avail(filter_id):
+            filters[name] = filter_id
+    return filters
+
+
+def compression_kwargs(compression, dtype=None, lossy=False):
+    '''
+        Keyword arguments of h5py create_dataset for a compression setting
+
+        compression: None or False, filter name ('gzip', 'lzf', 'szip', 'zstd' ...), registered filter id
+            or dict of create_dataset arguments:
+            {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True, 'scaleoffset': 0}
+        dtype: dtype of the dataset, scaleoffset is only kept for integer types and fletcher32
+            is dropped for variable length types
+        lossy: keep scaleoffset on float types as well, where it is the number of decimal digits kept
+            (0 rounds to integers), only meant for a setting given to one Float column
+
+        raises ValueError for unknown or unavailable filters
+    '''
+    if compression is None or compression is False:
+        return {}
+    if not isinstance(compression, dict):
+        compression = { 'compression': compression }
+    for key in compression:
+        if key not in COMPRESSION_KEYS:
+            raise ValueError("unknown compression setting {}, expected one of {}".format(key, COMPRESSION_KEYS))
+
+    kwargs = dict(compression)
+    codec = kwargs.get('compression')
+    if isinstance(codec, str) and codec in PLUGIN_FILTERS:
+        codec = kwargs['compression'] = PLUGIN_FILTERS[codec]
+    if codec is not None:
+        filter_id = BUILTIN_FILTERS.get(codec, codec)
+        if not isinstance(filter_id, int):
+            raise ValueError("unknown compression {}, available: {}".format(codec, list(available_filters())))
+        if not h5.h5z.filter_avail(filter_id):
+            raise ValueError("compression {} is not available in this HDF5 build, available: {}".format(
+                codec, list(available_filters())))
+    if isinstance(codec, int) and 'compression_opts' in kwargs and kwargs['compression_opts'] is not None:
+        # plugin filters take a tuple of unsigned ints
+        opts = kwargs['compression_opts']
+        kwargs['compression_opts'] = tuple(opts) if isinstance(opts, (list, tuple)) else (opts, )
+
+    if dtype is not None and kwargs.get('scaleoffset') is not None:
+        dtype = np.dtype(dtype)
+        kinds = 'iuf' if lossy else 'iu'
+        if is_vlen(dtype) or dtype.kind not in kinds:
+            # lossless scale offset only exists for integers, floats are rounded to decimal digits
+            del kwargs['scaleoffset']
+    if dtype is not None and kwargs.get('fletcher32') and is_vlen(np.dtype(dtype)):
+        # HDF5 can not checksum variable length elements, flat storage keeps it on its values
+        del kwargs['fletcher32']
+    return kwargs
+
+
+def describe_compression(dataset):
+    '''
+        Compression setting of an existing h5py dataset in the form accepted by compression_kwargs
+    '''
+    setting = {}
+    if dataset.compression is not None:
+        setting['compression'] = dataset.compression
+        if dataset.compression_opts is not None:
+            setting['compression_opts'] = dataset.compression_opts
+    else:
+        plugins = { filter_id: name for name, filter_id in PLUGIN_FILTERS.items() }
+        for filter_id in dataset._filters:
+            if str(filter_id).isdigit() and int(filter_id) in plugins:
+                setting['compression'] = plugins[int(filter_id)]
+    if dataset.shuffle:
+        setting['shuffle'] = True
+    if dataset.scaleoffset is not None:
+        setting['scaleoffset'] = dataset.scaleoffset
+    if dataset.fletcher32:
+        setting['fletcher32'] = True
+    return setting or None
+
+
+def default_candidates(dtype):
+    # settings tried by advise_compression, fastest to decode first
+    # False rather than None, a column compression of None inherits the dataset compression
+    candidates = [ False, 'lzf', { 'compression': 'lzf', 'shuffle': True } ]
+    for level in [1, 4, 9]:
+        candidates.append({ 'compression': 'gzip', 'compression_opts': level, 'shuffle': True })
+    if np.dtype(dtype).kind in 'iu':
+        candidates.append({ 'scaleoffset': 0 })
+        candidates.append({ 'compression': 'gzip', 'compression_opts': 4, 'shuffle': True, 'scaleoffset': 0 })
+    filters = available_filters()
+    for name in ['lz4', 'zstd', 'blosc']:
+        if name in filters:
+            candidates.append({ 'compression': name, 'shuffle': True })
+    return candidates
+
+
+def sample_column(source, rows, samples):
+    '''
+        Raw rows read from evenly spaced windows of a column
+
+        fixed size columns return an array of rows, variable length columns the concatenated values
+    '''
+    size = len(source)
+    window = max(rows // samples, 1)
+    starts = np.unique(np.linspace(0, max(size - window, 0), min(samples, max(size, 1))).astype(np.int64))
+    if isinstance(source, FlatColumn):
+        return np.concatenate([ source.slab(int(start), int(min(start + window, size)))[0] for start in starts ])
+    blocks = [ source[int(start):int(min(start + window, size))] for start in starts ]
+    block = np.concatenate(blocks, axis=0)
+    if block.dtype == object:
+        values = [ np.frombuffer(row[0], dtype=np.uint8) if isinstance(row[0], bytes) else np.asarray(row[0]).reshape(-1)
+            for row in block ]
+        return np.concatenate(values) if values else np.zeros(0, dtype=np.uint8)
+    return block
+
+
+def measure(block, compression, chunk_rows, repeats=3):
+    # stored bytes and best decode time of a block written with one compression setting
+    with h5.File(io.BytesIO(), 'w') as fout:
+        chunks = (max(min(chunk_rows, len(block)), 1), ) + tuple(block.shape[1:])
+        dset = fout.create_dataset('sample', data=block, chunks=chunks,
+            **compression_kwargs(compression, block.dtype))
+        nbytes = dset.id.get_storage_size()
+        seconds = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            dset[:]
+            elapsed = time.perf_counter() - start
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+    return nbytes, seconds
+
+
+def advise_compression(dataset, columns=None, target_ratio=0.5, sample_rows=4096, samples=8,
+    candidates=None, repeats=3):
+    '''
+        Recommend a compression setting per column from sample rows
+
+        every candidate is written to an in memory file, the fastest to decode among those with
+        compressed size <= target_ratio * raw size is picked, when none reaches the target the
+        smallest one is picked
+
+        advice = advise_compression(H5Dataset.open('data.h5'), target_ratio=0.5)
+        for key, column in advice.items():
+            schema[key].compression = column['compression']
+
+        dataset: H5Dataset
+        columns: columns to test, all selected columns by default
+        sample_rows: rows read per column, split into samples evenly spaced windows
+        candidates: list of settings accepted by compression_kwargs, default depends on the column dtype
+
+        returns {column: {'compression': setting, 'ratio': 0.31, 'decode_mb_s': 812.0, 'candidates': [...]}},
+        an uncompressed setting is returned as False so it also holds under a dataset compression,
+        variable length columns are measured on their values which is what flat storage compresses
+    '''
+    columns = dataset.column_names if columns is None else columns
+    advice = {}
+    for key in columns:
+        block = sample_column(dataset.column(key), sample_rows, samples)
+        if block.nbytes == 0:
+            advice[key] = { 'compression': False, 'ratio': 1.0, 'decode_mb_s': None, 'candidates': [] }
+            continue
+        row_nbytes = max(block.nbytes // max(len(block), 1), 1)
+        # chunks of about 1MB as written by the default chunk_size='auto'
+        chunk_rows = max((1 << 20) // row_nbytes, 1)
+
+        results = []
+        for compression in (default_candidates(block.dtype) if candidates is None else candidates):
+            compression = False if compression is None else compression
+            try:
+                nbytes, seconds = measure(block, compression, chunk_rows, repeats)
+            except (ValueError, TypeError):
+                # filter does not apply to this dtype
+                continue
+            results.append({ 'compression': compression, 'ratio': nbytes / block.nbytes,
+                'decode_mb_s': block.nbytes / max(seconds, 1e-9) / 1e6 })
+
+        passing = [ result for result in results if result['ratio'] <= target_ratio ]
+        if passing:
+            best = max(passing, key=lambda result: result['decode_mb_s'])
+        else:
+            best = min(results, key=lambda result: (result['ratio'], -result['decode_mb_s']))
+        advice[key] = dict(best, candidates=results)
+    return advice
@@ -0,0 +1,32 @@
+from .dataset import H5Dataset
+from .writer import H5Writer
+
+
+def convert(src, dst, backend=None, columns=None, block_rows=1024, src_backend=None, **writer_kwargs):
+    '''
+        Copy a dataset into another file or backend, such as HDF5 to LMDB and back
+
+        rows are read in blocks of block_rows and restored to the values accepted by the
+        attributes (Attribute.restore), encoded images and strings are copied without decoding
+
+        convert('data.h5', 'data.lmdb')
+        convert('data.h5', 'data.numpy')
+        convert('data.lmdb', 'data.h5', compression='gzip', chunk_size='auto')
+
+        src: path of a dataset with a stored schema
+        backend: backend of dst, picked from the dst path when None
+        columns: columns to copy, all by default
+        writer_kwargs: compression, chunk_size, buffer_size ... passed to H5Writer
+    '''
+    source = H5Dataset.open(src, columns=columns, backend=src_backend)
+    schema = { key: source.schema[key] for key in source.column_names }
+    try:
+        with H5Writer(schema, dst, backend=backend, **writer_kwargs) as writer:
+            for start in range(0, len(source), block_rows):
+                stop = min(start + block_rows, len(source))
+                raw = { key: source.column(key)[start:stop] for key in schema }
+                for idx in range(stop - start):
+                    writer.write({ key: schema[key].restore(raw[key][idx]) for key in schema })
+    finally:
+        source.close()
+    return writer.num_entries
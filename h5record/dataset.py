@@ -1,10 +1,19 @@
+import json
+import time
 import h5py as h5
 import numpy as np
 from torch.utils.data.dataset import Dataset
+from torch.utils.data import get_worker_info
 import os
-from .attributes import (
-    String, ImageSequence
-)
+from .writer import H5Writer
+from .attributes import read_schema
+from .backend import backend_name, open_backend
+from .cache import ChunkCache, CachedColumn, array_nbytes
+from .compression import compression_kwargs, describe_compression
+from .flat import FlatColumn, is_vlen, is_flat, num_rows, open_flat
+from .memmap import memmap_column
+from .profile import ReadProfile
+from .shm import SharedMemoryStore
 
 class AtomicFile:
     '''
@@ -31,98 +40,530 @@ class AtomicFile:
         self.pos += len(b)
         return b
 
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
 class H5Dataset(Dataset):
 
     def __init__(self, schema, save_filename, data_iter=None,
-        data_length=None, chunk_size=300, compression=None, 
+        data_length=None, chunk_size='auto', compression=None, 
         transform=None, append_mode=False, verbose=0, 
-        to_memory=False, multiprocess=False):
+        to_memory=False, multiprocess=False, buffer_size=1000,
+        chunk_cache_nbytes=0, rdcc_nbytes=None, rdcc_nslots=None, rdcc_w0=None,
+        mmap=False, shared_memory=False, columns=None, backend=None, profile=False):
 
         '''
         Note: 
-            * data length must be known value otherwise chunk size will not be enabled
+            * data length is the maximum size of dataset, None allows unlimited size
             * chunk size affects reading speed, usually a size of 100-500 is suitable value
+              'auto' picks the most rows per chunk which fit in 1MB, capped at data length, one row when rows are larger,
+              chunk size of each attribute can be overridden by Attribute(chunk_size=...)
             * compression algorithm affects reading speed, so if storage is not your concern is recommended not to enable
+              it accepts a filter name ('gzip', 'lzf', 'szip' or a registered plugin such as 'zstd') or a dict
+              {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True, 'scaleoffset': 0}
+              (scaleoffset applies to integer columns here, on Float columns it is lossy and only used
+              when set with Float(compression=...)),
+              compression of each attribute can be overridden by Attribute(compression=...),
+              see advise_compression() to pick a setting per column
         multiprocess: 
+            file is opened lazily in every process so this is usually not needed,
             if such error occur  "OSError: Can't read data (address of object past end of allocation)"
             set it to True
+        buffer_size:
+            number of rows buffered in memory before written to file during preprocess
+        chunk_cache_nbytes:
+            byte budget of decompressed chunks kept in a LRU cache per worker, 0 disables the cache
+        rdcc_nbytes, rdcc_nslots, rdcc_w0:
+            HDF5 raw data chunk cache settings, passed to h5py.File (default 1MB, 521 slots)
+        mmap:
+            read uncompressed fixed shape columns (Integer, Float, Image) as views of the memory mapped file,
+            returned arrays are read only, other columns are read through h5py
+        to_memory:
+            True loads every column in memory, a list of column names pins only those columns,
+            an integer is a byte budget and the columns which fit (smallest first) are pinned,
+            other columns are still read from file, see memory_report()
+        shared_memory:
+            with to_memory, columns are loaded once into shared memory and DataLoader workers
+            attach to the same copy instead of holding one each, returned arrays are read only
+        columns:
+            names of the columns to read, other columns are never opened, read or loaded by to_memory,
+            the schema only needs to describe these columns when the file exists, see read_columns()
+        backend:
+            'hdf5', 'lmdb' or 'numpy' storage, picked from the filename when None ('.lmdb' uses lmdb,
+            '.numpy' uses numpy),
+            mmap, chunk cache and SWMR refresh only apply to hdf5
+        append_mode:
+            rows of data_iter are appended to an existing file after checking the schema against
+            the stored columns, a file created with data_length can only grow up to data_length rows
+        profile:
+            True records per column read latency, bytes and rows, transform time and chunk cache hits
+            of the main process and every DataLoader worker (an integer is the number of workers tracked
+            separately, default 64), see profile_stats() and ProfileReporter, off by default
         '''
 
         # normalized schema design to dictionary
         if isinstance(schema, list) or isinstance(schema, tuple):
             schema = {  s.name: s  for s in schema }
         self.schema = schema
+        self.selected = None if columns is None else list(columns)
         self.save_filename = save_filename
+        self.backend = backend_name(save_filename, backend)
         self.data_length = data_length # dataset maximum size
         self.transform = transform # transform function before returned by index access
-        self.append_mode = append_mode # force append ?
+        self.append_mode = append_mode # add rows of data_iter to an existing file
 
-        self.chunk_size = None if data_length is None else chunk_size
-        assert compression in [None, 'lzf', 'gzip', 'szip']
+        assert chunk_size is None or chunk_size == 'auto' or chunk_size > 0
+        self.chunk_size = chunk_size
+        compression_kwargs(compression) # raises ValueError for unknown filters
         self.compression = compression
-        if not os.path.exists(self.save_filename):
+        self.buffer_size = buffer_size
+        if not os.path.exists(self.save_filename) or (append_mode and data_iter is not None):
+            assert schema is not None, "schema is needed to write {}".format(save_filename)
             self.preprocess(data_iter)
 
-        if multiprocess: # this is a backup method to ensure multiprocessing support on old file
-            self.reader = h5.File(AtomicFile(self.save_filename), 'r')
+        self.multiprocess = multiprocess
+        self.rdcc = { 'rdcc_nbytes': rdcc_nbytes, 'rdcc_nslots': rdcc_nslots, 'rdcc_w0': rdcc_w0 }
+        self.chunk_cache_nbytes = chunk_cache_nbytes
+        self.mmap = mmap
+        self.memory = None
+        self.profile = None
+        self._reader = None
+        self._reader_pid = None
+        self._atomic_file = None
+
+        if self.schema is None:
+            # schema and row count come from the same metadata read
+            self.schema = read_schema(self.reader, self.selected)
+            if self.schema is None:
+                raise ValueError("{} has no stored schema, pass the schema explicitly".format(save_filename))
+        for key in self.selected or []:
+            if key not in self.schema:
+                raise KeyError("column {} is not in schema".format(key))
+
+        first_key = self.column_names[0]
+        self.num_entries = num_rows(self.reader[first_key])
+        if profile:
+            self.enable_profile(64 if profile is True else profile)
+
+        self.memory_budget = None
+        self.memory_skipped = []
+        if to_memory is not False and to_memory is not None:
+            memory_keys = self.select_memory_columns(to_memory)
+            if shared_memory:
+                self.memory = SharedMemoryStore.load(self.reader, memory_keys)
+            else:
+                # warning this may use all your memory
+                temp = {}
+                for key in memory_keys:
+                    temp[key] = load_column(self.reader[key])
+                self.memory = temp
+
+        # file handle is opened again lazily inside every worker process
+        self.close()
+
+    @classmethod
+    def open(cls, save_filename, columns=None, **kwargs):
+        '''
+            Open a file with the schema stored at write time
+
+            dataset = H5Dataset.open('data.h5', columns=['label'], to_memory=True)
+        '''
+        return cls(None, save_filename, columns=columns, **kwargs)
+
+    @property
+    def column_names(self):
+        # columns read by this dataset, every schema column unless columns were selected
+        if self.selected is None:
+            return list(self.schema.keys())
+        return [ key for key in self.selected if key in self.schema ]
+
+    @property
+    def reader(self):
+        '''
+            h5py file handle (Backend for other storages) owned by the current process
+
+            handles inherited through fork are never reused, a new one is opened 
+            when the process id changes, which makes the dataset safe for DataLoader workers
+        '''
+        if self._reader is None or self._reader_pid != os.getpid():
+            self.open_reader()
+        return self._reader
+
+    def open_reader(self):
+        if self.backend != 'hdf5':
+            self._reader = open_backend(self.save_filename, 'r', self.backend)
+        elif self.multiprocess: # this is a backup method to ensure multiprocessing support on old file
+            self._atomic_file = AtomicFile(self.save_filename)
+            self._reader = h5.File(self._atomic_file, 'r', **self.rdcc)
         else:
-            self.reader = h5.File(self.save_filename, 'r', swmr=True)
+            self._reader = h5.File(self.save_filename, 'r', swmr=True, **self.rdcc)
+        self._reader_pid = os.getpid()
+        self.columns = {}
+        self.file_map = None
+        self.chunk_cache = None
+        if self.chunk_cache_nbytes > 0:
+            self.chunk_cache = ChunkCache(self.chunk_cache_nbytes)
+        return self
+
+    def close(self):
+        if self._reader is not None and self._reader_pid == os.getpid():
+            self._reader.close()
+            if self._atomic_file is not None:
+                # h5py does not close file objects it was given
+                self._atomic_file.close()
+        self._reader = None
+        self._reader_pid = None
+        self._atomic_file = None
+        self.columns = {}
+        self.file_map = None
+        self.chunk_cache = None
+
+    def select_memory_columns(self, to_memory):
+        # resolve to_memory argument into list of columns loaded in memory
+        if to_memory is True:
+            return list(self.column_names)
+        if isinstance(to_memory, (list, tuple, set)):
+            for key in to_memory:
+                if key not in self.column_names:
+                    raise KeyError("column {} is not selected".format(key))
+            return [ key for key in self.column_names if key in to_memory ]
+
+        assert isinstance(to_memory, int) and to_memory >= 0, "to_memory must be bool, list of columns or byte budget"
+        self.memory_budget = to_memory
+        sizes = { key: estimate_nbytes(self.reader[key]) for key in self.column_names }
+        memory_keys, used = [], 0
+        for key in sorted(sizes, key=sizes.get):
+            if used + sizes[key] <= to_memory:
+                memory_keys.append(key)
+                used += sizes[key]
+            else:
+                self.memory_skipped.append(key)
+        return memory_keys
+
+    def memory_report(self):
+        '''
+            Columns pinned in memory and their size in bytes
+
+            {'columns': {'label': 800}, 'nbytes': 800, 'budget': 1024, 'on_disk': ['image']}
+        '''
+        columns = {}
+        if isinstance(self.memory, SharedMemoryStore):
+            columns = self.memory.nbytes()
+        elif self.memory is not None:
+            columns = { key: array_nbytes(value.values) + array_nbytes(value.offsets) 
+                if isinstance(value, FlatColumn) else array_nbytes(value) 
+                for key, value in self.memory.items() }
+        return {
+            'columns': columns,
+            'nbytes': sum(columns.values()),
+            'budget': self.memory_budget,
+            'on_disk': [ key for key in self.column_names if key not in columns ],
+        }
 
-        first_key = list(self.schema.keys())[0]
-        self.num_entries = self.reader[first_key].shape[0]
+    def release_memory(self):
+        # drop in memory columns, shared memory is unlinked once no dataset in this process use it
+        if isinstance(self.memory, SharedMemoryStore):
+            self.memory.release()
+        self.memory = None
+        self.columns = {}
 
+    def select(self, columns):
+        '''
+            View of the dataset which only reads the given columns
+
+            the view opens its own file handle, columns pinned in memory are shared with this dataset
+        '''
+        for key in columns:
+            if key not in self.column_names:
+                raise KeyError("column {} is not selected".format(key))
+        view = self.__class__.__new__(self.__class__)
+        view.__dict__.update(self.__getstate__())
+        view.selected = list(columns)
+        if isinstance(self.memory, SharedMemoryStore):
+            view.memory = self.memory.select(columns)
+        elif isinstance(self.memory, dict):
+            view.memory = { key: value for key, value in self.memory.items() if key in columns }
+        return view
 
-        if to_memory:
-            # warning this may use all your memory
-            temp = {}
-            for key in self.schema.keys():
-                temp[key] = self.reader[key][:]
-            self.reader = temp
+    def __getstate__(self):
+        # h5py objects can not be pickled, spawned workers reopen the file
+        state = self.__dict__.copy()
+        state['_reader'] = None
+        state['_reader_pid'] = None
+        state['_atomic_file'] = None
+        state['columns'] = {}
+        state['file_map'] = None
+        state['chunk_cache'] = None
+        return state
 
     def preprocess(self, data_iter):
-        idx = 0
-        for data in data_iter:
-            if idx == 0:
-                with h5.File(self.save_filename, 'w', libver='latest') as fout:
-                    fout.swmr_mode = True 
-                    for key, value in data.items():
-                        attribute = self.schema[key]
-                        attribute.init_attributes(fout, value, 
-                            self.compression, self.data_length)
-            else:
-                with h5.File(self.save_filename, 'a', libver='latest') as fout:
-                    fout.swmr_mode = True 
-                    for key, value in data.items():
-                        attribute = self.schema[key]
-                        value = attribute.transform(value)
-                        attribute.append(fout, value)
+        # in append mode rows are added after the stored ones, other datasets see them after refresh(),
+        # use H5Writer(append=True, swmr=True) to keep appending while readers are open
+        with H5Writer(self.schema, self.save_filename, 
+            compression=self.compression, data_length=self.data_length,
+            chunk_size=self.chunk_size, buffer_size=self.buffer_size,
+            append=self.append_mode, backend=self.backend) as writer:
+            for data in data_iter:
+                writer.write(data)
+        return writer.num_entries
 
-            idx += 1
+    def refresh(self):
+        '''
+            Pick up rows appended by another writer since the file was opened, returns number of rows
+
+            the writer must already be in SWMR mode when readers open the file (H5Writer(append=True, swmr=True)),
+            fixed size and flat columns refresh their extents in place, variable length (vlen) data
+            lives in the HDF5 global heap which SWMR does not cover, so files with vlen columns are reopened,
+            columns pinned in memory are not extended and must be released first
+        '''
+        if self.memory is not None:
+            raise RuntimeError("release_memory() before refresh, pinned columns do not grow")
+        reader = self.reader
+        datasets = []
+        if isinstance(reader, h5.File):
+            reader.visititems(lambda name, node: datasets.append(node) if isinstance(node, h5.Dataset) else None)
+        if isinstance(reader, h5.File) and reader.swmr_mode and not any( is_vlen(dataset.dtype) for dataset in datasets ):
+            for dataset in datasets:
+                dataset.refresh()
+            # wrapped columns and cached chunks still have the old extent
+            self.columns = {}
+            self.file_map = None
+            if self.chunk_cache is not None:
+                self.chunk_cache = ChunkCache(self.chunk_cache_nbytes)
+        else:
+            self.close()
+            reader = self.reader
+        first_key = self.column_names[0]
+        self.num_entries = num_rows(reader[first_key])
+        return self.num_entries
 
     def __len__(self):
         return self.num_entries
 
+    def column(self, key):
+        # data source of a column, h5py dataset or in memory array
+        if self.profile is not None:
+            return self.profile.wrap(key, self.raw_column(key))
+        return self.raw_column(key)
+
+    def raw_column(self, key):
+        if self.memory is not None and key in self.memory:
+            return self.memory[key]
+        reader = self.reader
+        if key not in self.columns:
+            node = reader[key]
+            if is_flat(node):
+                self.columns[key] = open_flat(node, self.wrap_dataset)
+            elif isinstance(node, h5.Dataset):
+                self.columns[key] = self.wrap_dataset(node)
+            else:
+                # column of another backend
+                self.columns[key] = node
+        return self.columns[key]
+
+    def wrap_dataset(self, dataset):
+        # serve dataset through memory map or chunk cache when enabled
+        if self.mmap:
+            if self.file_map is None:
+                self.file_map = np.memmap(self.save_filename, dtype=np.uint8, mode='r')
+            mapped = memmap_column(self.save_filename, dataset, self.file_map)
+            if mapped is not None:
+                return mapped
+        if self.chunk_cache is not None and dataset.chunks:
+            return CachedColumn(dataset, self.chunk_cache)
+        return dataset
+
+    def cache_stats(self):
+        # hit and miss counters of the chunk cache in this process
+        if self.chunk_cache is None:
+            return None
+        return self.chunk_cache.stats()
+
+    def enable_profile(self, num_workers=64):
+        # counters live in shared memory, create them before the DataLoader starts its workers
+        self.profile = ReadProfile(self.column_names, num_workers + 1)
+        return self.profile
+
+    def profile_stats(self, per_worker=False):
+        '''
+            Read path statistics summed over this process and DataLoader workers, see ReadProfile.stats
+        '''
+        if self.profile is None:
+            return None
+        return self.profile.stats(per_worker=per_worker)
+
+    def reset_profile(self):
+        if self.profile is not None:
+            self.profile.reset()
+
 
     def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.get_batch(range(self.num_entries)[idx])
+        if isinstance(idx, (list, tuple, range, np.ndarray)):
+            return self.get_batch(idx)
+
+        if self.profile is not None:
+            return self.profiled_getitem(idx)
+
         data = {}
-        for key in self.schema.keys():
-            raw_output = self.reader[key][idx]
+        for key in self.column_names:
             attribute = self.schema[key]
-            if isinstance(attribute, String):
-                data[key] = raw_output[0].decode(attribute.encoding )
-            elif isinstance(attribute, ImageSequence):
-                # heavy reshaping is needed as variable length dimension (last dimension)
-                # is always treated as np.array
-                # rendering high dimension shape becomes a np.object matrix
-                # 
-                data[key] = raw_output[0].reshape(
-                    attribute.img_channel, attribute.w, attribute.h, -1  )
-            else:
-                data[key] = raw_output
+            data[key] = attribute.read(self.column(key), idx)
 
         if self.transform is not None:
             return self.transform(data)
         
         return data
 
+    def profiled_getitem(self, idx):
+        # same as __getitem__ for one row with timers around every column and the transform
+        data = {}
+        for key in self.column_names:
+            start = time.perf_counter()
+            data[key] = self.schema[key].read(self.column(key), idx)
+            self.profile.record_column(key, time.perf_counter() - start, 1)
+        self.profile.record_cache(self.chunk_cache)
+
+        if self.transform is not None:
+            start = time.perf_counter()
+            data = self.transform(data)
+            self.profile.record_transform(time.perf_counter() - start)
+        return data
+
+    def __getitems__(self, indices):
+        '''
+            Batched fetch used by pytorch DataLoader, returns list of rows 
+            same as [ dataset[idx] for idx in indices ] but read with batched slab reads
+        '''
+        batch = self.get_batch(indices)
+        rows = []
+        for idx in range(len(indices)):
+            data = { key: value[idx] for key, value in batch.items() }
+            if self.transform is not None:
+                if self.profile is not None:
+                    start = time.perf_counter()
+                    data = self.transform(data)
+                    self.profile.record_transform(time.perf_counter() - start)
+                else:
+                    data = self.transform(data)
+            rows.append(data)
+        return rows
 
+    def get_batch(self, indices):
+        '''
+            Read a batch of rows and return dictionary of stacked numpy arrays in request order
+
+            indices are sorted and deduplicated, merged into contiguous runs 
+            and each column is read with one slab read per run
+            transform is not applied as it works on a single row
+        '''
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        indices = np.where(indices < 0, indices + self.num_entries, indices)
+        if len(indices) > 0 and (indices.min() < 0 or indices.max() >= self.num_entries):
+            raise IndexError("index out of range for dataset of size {}".format(self.num_entries))
+
+        unique, inverse = np.unique(indices, return_inverse=True)
+        runs = contiguous_runs(unique)
+
+        batch = {}
+        for key in self.column_names:
+            if self.profile is not None:
+                started = time.perf_counter()
+            attribute = self.schema[key]
+            source = self.column(key)
+            if len(runs) == 0:
+                blocks = [ attribute.read_slice(source, 0, 0) ]
+            else:
+                blocks = [ attribute.read_slice(source, start, stop) for start, stop in runs ]
+            # scatter back to request order, duplicated index share the same row
+            batch[key] = np.concatenate(blocks, axis=0)[inverse]
+            if self.profile is not None:
+                self.profile.record_column(key, time.perf_counter() - started, len(indices))
+        if self.profile is not None:
+            self.profile.record_cache(self.chunk_cache)
+        return batch
+
+
+def read_columns(filename):
+    '''
+        Columns stored in a file, read from metadata only
+
+        {'label': {'storage': 'dataset', 'shape': (100,), 'dtype': dtype('int64'), 'compression': None},
+         'text': {'storage': 'flat', 'rows': 100, 'kind': 'bytes', 'dtype': dtype('uint8'),
+            'compression': {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True}}}
+
+        files written with a stored schema also have the attribute 'config' of every column
+    '''
+    columns = {}
+    with h5.File(filename, 'r') as fin:
+        configs = {}
+        if 'schema' in fin.attrs:
+            configs = { config['args']['name']: config for config in json.loads(fin.attrs['schema']) }
+        for key, node in fin.items():
+            if is_flat(node):
+                columns[key] = { 'storage': 'flat', 'rows': num_rows(node),
+                    'kind': open_flat(node).kind, 'dtype': node['values'].dtype,
+                    'compression': describe_compression(node['values']) }
+            else:
+                columns[key] = { 'storage': 'dataset', 'shape': node.shape, 'dtype': node.dtype,
+                    'compression': describe_compression(node) }
+            if key in configs:
+                columns[key]['config'] = configs[key]
+    return columns
+
+
+def load_column(node):
+    # in memory copy of a column, memory mapped columns are copied out of the page cache
+    if is_flat(node):
+        return open_flat(node, lambda dset: dset[:])
+    if isinstance(node, FlatColumn):
+        return FlatColumn(np.array(node.values), np.array(node.offsets), kind=node.kind)
+    return np.array(node[:])
+
+
+def estimate_nbytes(source, samples=100):
+    '''
+        Bytes needed to hold a column in memory
+
+        variable length columns are estimated from evenly spaced sample rows plus offsets
+    '''
+    if is_flat(source):
+        return sum( estimate_nbytes(source[name]) for name in ['values', 'offsets'] )
+    if isinstance(source, FlatColumn):
+        return array_nbytes(source.values) + array_nbytes(source.offsets)
+    if not is_vlen(source.dtype):
+        return int(np.prod(source.shape)) * source.dtype.itemsize
+    rows = source.shape[0]
+    if rows == 0:
+        return 0
+    sample_indices = np.unique(np.linspace(0, rows - 1, min(samples, rows)).astype(np.int64))
+    sample_nbytes = array_nbytes(np.stack([ source[int(idx)] for idx in sample_indices ]))
+    return int(sample_nbytes / len(sample_indices) * rows) + 8 * (rows + 1)
+
+
+def worker_init_fn(worker_id):
+    '''
+        Open a fresh file handle for the dataset of a DataLoader worker
+
+        DataLoader(dataset, num_workers=4, worker_init_fn=worker_init_fn)
+    '''
+    worker_info = get_worker_info()
+    dataset = worker_info.dataset
+    if isinstance(dataset, H5Dataset):
+        dataset.open_reader()
+
+
+def contiguous_runs(indices):
+    '''
+        Merge sorted unique indices into list of [start, stop) runs
+        [1, 2, 3, 7, 8] => [(1, 4), (7, 9)]
+    '''
+    if len(indices) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    starts = np.concatenate([ [0], breaks ])
+    stops = np.concatenate([ breaks, [len(indices)] ])
+    return [ (int(indices[start]), int(indices[stop-1]) + 1) for start, stop in zip(starts, stops) ]
@@ -0,0 +1,149 @@
+import h5py as h5
+import numpy as np
+
+
+def is_vlen(dtype):
+    return h5.check_vlen_dtype(dtype) is not None or h5.check_string_dtype(dtype) is not None
+
+
+def is_flat(node):
+    # flat columns are stored as a group of values and offsets datasets
+    return isinstance(node, h5.Group) and 'values' in node and 'offsets' in node
+
+
+def num_rows(node):
+    if is_flat(node):
+        return node['offsets'].shape[0] - 1
+    return node.shape[0]
+
+
+def open_flat(group, wrap=None):
+    # FlatColumn over the datasets of a flat group, wrap converts each dataset (cache, mmap)
+    values, offsets = group['values'], group['offsets']
+    if wrap is not None:
+        values, offsets = wrap(values), wrap(offsets)
+    kind = group.attrs.get('kind', 'array')
+    if isinstance(kind, bytes):
+        kind = kind.decode('utf-8')
+    return FlatColumn(values, offsets, kind=kind)
+
+
+def create_flat(fout, name, values, kind, filters, data_length,
+    row_chunks, value_chunks, offset_dtype='int64'):
+    '''
+        Create flat group with the first row
+
+        values: 1D array of the first row
+        filters: compression arguments of create_dataset, applied to values and offsets
+        row_chunks: offsets per chunk
+        value_chunks: values per chunk
+    '''
+    group = fout.create_group(name)
+    group.attrs['storage'] = 'flat'
+    group.attrs['kind'] = kind
+    max_offsets = None if data_length is None else data_length + 1
+    if max_offsets is not None:
+        row_chunks = min(row_chunks, max_offsets)
+    group.create_dataset('values', data=values, maxshape=(None, ),
+        chunks=(max(int(value_chunks), 1), ), **filters)
+    # scale offset settings are meant for the values dtype
+    offset_filters = { key: value for key, value in filters.items() if key != 'scaleoffset' }
+    group.create_dataset('offsets', data=np.array([0, len(values)], dtype=offset_dtype),
+        maxshape=(max_offsets, ), chunks=(max(int(row_chunks), 1), ), **offset_filters)
+    return group
+
+
+def append_flat(fout, name, values, lengths):
+    '''
+        Append rows to a flat group with one slab write for values and one for offsets
+    '''
+    group = fout[name]
+    values_dset, offsets_dset = group['values'], group['offsets']
+    if len(values) > 0:
+        values_dset.resize(values_dset.shape[0] + len(values), axis=0)
+        values_dset[-len(values):] = values
+    if len(lengths) > 0:
+        offsets = values_dset.shape[0] - len(values) + np.cumsum(lengths)
+        offsets_dset.resize(offsets_dset.shape[0] + len(lengths), axis=0)
+        offsets_dset[-len(lengths):] = offsets
+    return fout
+
+
+def stack_flat(rows, dtype):
+    # concatenate rows into values and lengths for append_flat
+    rows = [ np.asarray(row, dtype=dtype).reshape(-1) for row in rows ]
+    lengths = np.array([ len(row) for row in rows ], dtype=np.int64)
+    values = np.concatenate(rows) if rows else np.zeros(0, dtype=dtype)
+    return values, lengths
+
+
+def flatten_vlen(raw_output):
+    '''
+        Convert N x 1 variable length rows into flat values and N+1 offsets
+
+        strings are stored as utf-8 bytes, other rows keep their element dtype
+    '''
+    rows = [ row[0] for row in raw_output ]
+    lengths = np.zeros(len(rows) + 1, dtype=np.int64)
+    if len(rows) and isinstance(rows[0], (bytes, str)):
+        rows = [ np.frombuffer(row.encode('utf-8') if isinstance(row, str) else row, dtype=np.uint8)
+            for row in rows ]
+        kind = 'bytes'
+    else:
+        rows = [ np.asarray(row).reshape(-1) for row in rows ]
+        kind = 'array'
+    lengths[1:] = [ len(row) for row in rows ]
+    offsets = np.cumsum(lengths)
+    values = np.concatenate(rows) if rows else np.zeros(0, dtype=np.uint8)
+    return values, offsets, kind
+
+
+class FlatColumn:
+    '''
+        Variable length column stored as flat values and offsets
+
+        row i is values[offsets[i]:offsets[i+1]], rows are returned in the same
+        layout as h5py vlen rows so Attribute.decode works unchanged
+    '''
+    def __init__(self, values, offsets, kind='array'):
+        self.values = values
+        self.offsets = offsets
+        self.kind = kind
+        self.shape = (len(offsets) - 1, 1)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def value(self, values):
+        return values.tobytes() if self.kind == 'bytes' else values
+
+    def slab(self, start, stop):
+        '''
+            Values of rows [start, stop) with one read and offsets relative to the returned values
+        '''
+        stop = max(start, stop)
+        offsets = np.asarray(self.offsets[start:stop+1]).astype(np.int64)
+        if stop == start:
+            return np.asarray(self.values[0:0]), np.zeros(1, dtype=np.int64)
+        values = np.asarray(self.values[int(offsets[0]):int(offsets[-1])])
+        return values, offsets - offsets[0]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(self.shape[0])
+            assert step == 1, "only contiguous slice is supported"
+            values, offsets = self.slab(start, stop)
+            output = np.empty((len(offsets) - 1, 1), dtype=object)
+            for idx in range(len(offsets) - 1):
+                output[idx, 0] = self.value(values[offsets[idx]:offsets[idx+1]])
+            return output
+
+        idx = int(idx)
+        if idx < 0:
+            idx += self.shape[0]
+        if idx < 0 or idx >= self.shape[0]:
+            raise IndexError("index {} out of range for column of size {}".format(idx, self.shape[0]))
+        start, stop = self.offsets[idx:idx+2]
+        output = np.empty(1, dtype=object)
+        output[0] = self.value(np.asarray(self.values[int(start):int(stop)]))
+        return output
@@ -0,0 +1,102 @@
+import numpy as np
+
+
+def is_mappable(dataset):
+    '''
+        Dataset can be read directly from the file bytes:
+        fixed size numeric type and no filter (compression, shuffle, scaleoffset, checksum)
+    '''
+    if dataset.dtype.kind not in 'biuf' or dataset.dtype.hasobject:
+        return False
+    if dataset.compression is not None or dataset.shuffle or dataset.fletcher32:
+        return False
+    if dataset.scaleoffset is not None:
+        return False
+    if dataset.chunks is not None and tuple(dataset.chunks[1:]) != tuple(dataset.shape[1:]):
+        # only chunking along the first axis keeps a chunk as a block of whole rows
+        return False
+    return True
+
+
+def memmap_column(filename, dataset, file_map=None):
+    '''
+        Zero copy view of an uncompressed column, returns None when not possible
+
+        contiguous dataset is exposed as np.memmap at the dataset offset
+        chunked dataset is exposed as ChunkedMemmap built from the chunk index
+    '''
+    if not is_mappable(dataset):
+        return None
+    if dataset.chunks is None:
+        offset = dataset.id.get_offset()
+        if offset is None: # storage not allocated yet
+            return None
+        return np.memmap(filename, dtype=dataset.dtype, mode='r',
+            offset=offset, shape=dataset.shape)
+
+    if file_map is None:
+        file_map = np.memmap(filename, dtype=np.uint8, mode='r')
+    column = ChunkedMemmap(dataset, file_map)
+    if not column.allocated:
+        return None
+    return column
+
+
+class ChunkedMemmap:
+    '''
+        Rows of a chunked, unfiltered dataset served as views of the memory mapped file
+
+        chunk offsets are looked up once from the HDF5 chunk index,
+        returned arrays are read only views, no h5py call is involved after init
+    '''
+    def __init__(self, dataset, file_map):
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+        self.chunks = dataset.chunks
+        self.chunk_rows = dataset.chunks[0]
+        num_chunks = (self.shape[0] + self.chunk_rows - 1) // self.chunk_rows
+        chunk_shape = tuple(dataset.chunks)
+        chunk_nbytes = int(np.prod(chunk_shape)) * self.dtype.itemsize
+
+        offsets = [ None ] * num_chunks
+        def collect(info):
+            chunk_id = info.chunk_offset[0] // self.chunk_rows
+            if chunk_id < num_chunks and info.size == chunk_nbytes:
+                offsets[chunk_id] = info.byte_offset
+
+        if hasattr(dataset.id, 'chunk_iter'):
+            dataset.id.chunk_iter(collect)
+        else:
+            for index in range(dataset.id.get_num_chunks()):
+                collect(dataset.id.get_chunk_info(index))
+
+        self.allocated = all( offset is not None for offset in offsets )
+        self.blocks = []
+        if self.allocated:
+            self.blocks = [ np.ndarray(chunk_shape, dtype=self.dtype,
+                buffer=file_map, offset=offset) for offset in offsets ]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(self.shape[0])
+            if stop <= start:
+                return np.empty((0, ) + self.shape[1:], dtype=self.dtype)
+            if step != 1:
+                return np.stack([ self[i] for i in range(start, stop, step) ])
+            first, last = start // self.chunk_rows, (stop - 1) // self.chunk_rows
+            if first == last:
+                offset = first * self.chunk_rows
+                return self.blocks[first][start - offset:stop - offset]
+            return np.concatenate([
+                self.blocks[chunk_id][max(start - chunk_id * self.chunk_rows, 0):stop - chunk_id * self.chunk_rows]
+                for chunk_id in range(first, last + 1) ], axis=0)
+
+        idx = int(idx)
+        if idx < 0:
+            idx += self.shape[0]
+        if idx < 0 or idx >= self.shape[0]:
+            raise IndexError("index {} out of range for column of size {}".format(idx, self.shape[0]))
+        return self.blocks[idx // self.chunk_rows][idx % self.chunk_rows]
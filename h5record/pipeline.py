@@ -0,0 +1,129 @@
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from .writer import H5Writer
+
+
+def _process_chunk(preprocess_fn, schema, items):
+    # runs inside worker process, rows are transformed here so the writer only stacks them
+    rows = []
+    for item in items:
+        data = preprocess_fn(item)
+        if data is None:
+            continue
+        rows.append({ key: schema[key].transform(value) for key, value in data.items() })
+    return rows
+
+
+class Progress:
+    '''
+        Throughput report of an ingest, printed every interval seconds when verbose
+    '''
+    def __init__(self, total=None, interval=10, verbose=1, stream=sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.verbose = verbose
+        self.stream = stream
+        self.rows = 0
+        self.start = time.time()
+        self.last_report = self.start
+
+    def update(self, rows):
+        self.rows += rows
+        now = time.time()
+        if self.verbose and now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.time() - self.start
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        total = '' if self.total is None else '/{}'.format(self.total)
+        self.stream.write('{}{} rows, {:.2f} rows/s\n'.format(self.rows, total, self.rows_per_second))
+        self.stream.flush()
+
+
+def build_dataset(schema, save_filename, items, preprocess_fn, num_workers=4,
+    max_in_flight=None, items_per_task=64, ordered=True,
+    compression=None, data_length=None, chunk_size='auto', buffer_size=1000,
+    verbose=1, report_interval=10, mp_context=None):
+    '''
+        Build H5Record file from raw items with preprocessing on a process pool
+
+        items: iterator of raw items, such as file paths
+        preprocess_fn: picklable function which maps a raw item to a row dictionary
+            (for example reading image with Image.read_image), return None to skip the item
+        num_workers: number of preprocessing processes
+        max_in_flight: maximum tasks submitted but not yet written, default 2 x num_workers,
+            the items iterator is only consumed when a slot is free
+        items_per_task: number of items sent to a worker at once
+        ordered: keep rows in the same order as items, otherwise rows are written as they finish
+        mp_context: multiprocessing context of the process pool
+
+        returns Progress with number of rows written and throughput
+    '''
+    if max_in_flight is None:
+        max_in_flight = 2 * num_workers
+    assert max_in_flight > 0 and items_per_task > 0
+
+    if isinstance(schema, list) or isinstance(schema, tuple):
+        schema = {  s.name: s  for s in schema }
+    progress = Progress(total=data_length, interval=report_interval, verbose=verbose)
+
+    items = iter(items)
+
+    def tasks():
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= items_per_task:
+                yield batch
+                batch = []
+        if len(batch):
+            yield batch
+
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context) as executor, \
+        H5Writer(schema, save_filename, compression=compression,
+            data_length=data_length, chunk_size=chunk_size, buffer_size=buffer_size) as writer:
+
+        def write(rows):
+            for row in rows:
+                writer.write(row, transformed=True)
+            progress.update(len(rows))
+
+        # first row creates the datasets from the raw value, it is processed here
+        for item in items:
+            data = preprocess_fn(item)
+            if data is not None:
+                writer.write(data)
+                progress.update(1)
+                break
+
+        in_flight = deque()
+        def drain():
+            # write the oldest task when ordered, otherwise whichever finished first
+            if ordered:
+                write(in_flight.popleft().result())
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                in_flight.remove(future)
+                write(future.result())
+
+        for task in tasks():
+            # backpressure, wait for a slot before reading more items
+            while len(in_flight) >= max_in_flight:
+                drain()
+            in_flight.append(executor.submit(_process_chunk, preprocess_fn, schema, task))
+
+        while len(in_flight):
+            drain()
+
+    if verbose:
+        progress.report()
+    return progress
@@ -0,0 +1,94 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from torch.utils.data import IterableDataset, get_worker_info
+
+
+def clone_dataset(dataset):
+    # shallow copy of H5Dataset without file handles, it opens its own on first read
+    clone = dataset.__class__.__new__(dataset.__class__)
+    clone.__dict__.update(dataset.__getstate__())
+    return clone
+
+
+class H5PrefetchDataset(IterableDataset):
+    '''
+        Read the upcoming batches of a batch sampler on background threads
+
+        up to depth batches are read ahead (batched column reads, decode and transform)
+        while the consumer works on the current one, batches are returned in sampler order
+
+        batches = BatchSampler(H5ChunkShuffleSampler(dataset), batch_size=128, drop_last=False)
+        prefetch = H5PrefetchDataset(dataset, batches, depth=4, collate_fn=default_collate)
+        for batch in DataLoader(prefetch, batch_size=None, num_workers=2):
+            pass
+
+        dataset: H5Dataset
+        batch_sampler: iterable of lists of indices, such as BatchSampler or H5ShardSampler
+        depth: maximum number of batches read ahead and held in memory
+        num_threads: reader threads per process
+        thread_handles: every thread opens its own file handle (and chunk cache),
+            otherwise threads share the handle of the process, h5py serializes calls in both cases
+            but decoding, transform and collate run concurrently
+        collate_fn: applied to the list of rows on the reader thread, list of rows is returned when None
+
+        with DataLoader workers batch k is read by worker k % num_workers, the same
+        assignment DataLoader itself uses for a batch_sampler
+    '''
+    def __init__(self, dataset, batch_sampler, depth=4, num_threads=2,
+        thread_handles=True, collate_fn=None):
+        assert depth > 0 and num_threads > 0
+        self.dataset = dataset
+        self.batch_sampler = batch_sampler
+        self.depth = depth
+        self.num_threads = num_threads
+        self.thread_handles = thread_handles
+        self.collate_fn = collate_fn
+
+    def set_epoch(self, epoch):
+        for sampler in [ self.batch_sampler, getattr(self.batch_sampler, 'sampler', None) ]:
+            if hasattr(sampler, 'set_epoch'):
+                sampler.set_epoch(epoch)
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker_id, num_workers = 0, 1
+        if worker_info is not None:
+            worker_id, num_workers = worker_info.id, worker_info.num_workers
+
+        local = threading.local()
+        clones = []
+        lock = threading.Lock()
+        def read(indices):
+            dataset = self.dataset
+            if self.thread_handles:
+                if not hasattr(local, 'dataset'):
+                    local.dataset = clone_dataset(self.dataset)
+                    with lock:
+                        clones.append(local.dataset)
+                dataset = local.dataset
+            rows = dataset.__getitems__(indices)
+            return rows if self.collate_fn is None else self.collate_fn(rows)
+
+        in_flight = deque()
+        executor = ThreadPoolExecutor(max_workers=self.num_threads)
+        try:
+            for batch_id, indices in enumerate(self.batch_sampler):
+                if batch_id % num_workers != worker_id:
+                    continue
+                # bounded read ahead, wait for the oldest batch before submitting more
+                while len(in_flight) >= self.depth:
+                    yield in_flight.popleft().result()
+                in_flight.append(executor.submit(read, list(indices)))
+            while len(in_flight):
+                yield in_flight.popleft().result()
+        finally:
+            # consumer may stop early, drop batches which have not started
+            for future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=True)
+            for clone in clones:
+                clone.close()
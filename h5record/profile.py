@@ -0,0 +1,275 @@
+import os
+import sys
+import time
+import bisect
+import threading
+import numpy as np
+from torch.utils.data import get_worker_info
+
+from .cache import array_nbytes
+from .flat import FlatColumn
+from .shm import SharedArray
+
+# upper bounds in seconds of the latency histogram buckets, the last bucket is everything above 1s
+LATENCY_BUCKETS = (1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 1e-1, 3e-1, 1.0)
+# counters of a column (and of transform), followed by the histogram
+FIELDS = ('calls', 'rows', 'bytes', 'seconds', 'read_seconds')
+CACHE_FIELDS = ('hits', 'misses', 'evictions')
+
+
+def bucket_label(idx):
+    if idx == len(LATENCY_BUCKETS):
+        return '>1s'
+    bound = LATENCY_BUCKETS[idx]
+    if bound < 1e-3:
+        return '<={:g}us'.format(bound * 1e6)
+    if bound < 1:
+        return '<={:g}ms'.format(bound * 1e3)
+    return '<={:g}s'.format(bound)
+
+
+class ProfiledSource:
+    '''
+        Column source which adds the time and bytes of every raw read to the column counters
+
+        time spent here is HDF5 read + decompression (or memory copy), the rest of the column
+        time is decoding in the attribute (String decode, ImageSequence reshape, image decode)
+    '''
+    def __init__(self, source, profile, key):
+        self.source = source
+        self.profile = profile
+        self.key = key
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+    def __len__(self):
+        return len(self.source)
+
+    def __getitem__(self, idx):
+        start = time.perf_counter()
+        output = self.source[idx]
+        self.profile.record_read(self.key, time.perf_counter() - start, output)
+        return output
+
+
+class ReadProfile:
+    '''
+        Read path counters of H5Dataset kept in shared memory
+
+        every process (main process and each DataLoader worker) adds to its own slot,
+        so workers never contend and the main process sums the slots at any time
+
+        num_slots: main process plus DataLoader workers tracked separately,
+            workers beyond that share slots and may lose some updates
+    '''
+    def __init__(self, column_names, num_slots=65):
+        assert num_slots > 1
+        self.column_names = list(column_names)
+        self.index = { key: idx for idx, key in enumerate(self.column_names) }
+        self.transform_index = len(self.column_names)
+        self.num_fields = len(FIELDS) + len(LATENCY_BUCKETS) + 1
+        self.counters = SharedArray.create(
+            np.zeros((num_slots, len(self.column_names) + 1, self.num_fields), dtype=np.float64), writeable=True)
+        self.cache = SharedArray.create(np.zeros((num_slots, len(CACHE_FIELDS)), dtype=np.float64), writeable=True)
+        self.init_process()
+
+    def init_process(self):
+        self.lock = threading.Lock()
+        self.sources = {}
+        self.slot = None
+        self.slot_pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        state['sources'] = {}
+        state['slot'] = None
+        state['slot_pid'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.init_process()
+
+    @property
+    def num_slots(self):
+        return self.counters.shape[0]
+
+    def current_slot(self):
+        if self.slot_pid != os.getpid():
+            worker_info = get_worker_info()
+            if worker_info is None:
+                self.slot = 0
+            else:
+                self.slot = 1 + worker_info.id % (self.num_slots - 1)
+            self.slot_pid = os.getpid()
+        return self.slot
+
+    def wrap(self, key, source):
+        '''
+            Profiled view of a column source, flat columns keep their FlatColumn type
+            so attributes still read them with one slab read
+        '''
+        cached = self.sources.get(key)
+        if cached is not None and cached[0] is source:
+            return cached[1]
+        if isinstance(source, FlatColumn):
+            wrapped = FlatColumn(ProfiledSource(source.values, self, key),
+                ProfiledSource(source.offsets, self, key), kind=source.kind)
+        else:
+            wrapped = ProfiledSource(source, self, key)
+        self.sources[key] = (source, wrapped)
+        return wrapped
+
+    def add(self, row, seconds, rows=0, nbytes=0, read_seconds=0.0, calls=1):
+        counters = self.counters.array[self.current_slot(), row]
+        with self.lock:
+            counters[0] += calls
+            counters[1] += rows
+            counters[2] += nbytes
+            counters[3] += seconds
+            counters[4] += read_seconds
+            if calls:
+                counters[len(FIELDS) + bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def record_read(self, key, seconds, output):
+        if isinstance(output, np.ndarray):
+            nbytes = array_nbytes(output)
+        elif isinstance(output, (bytes, bytearray)):
+            nbytes = len(output)
+        else:
+            nbytes = 0
+        self.add(self.index[key], 0.0, nbytes=nbytes, read_seconds=seconds, calls=0)
+
+    def record_column(self, key, seconds, rows):
+        self.add(self.index[key], seconds, rows=rows)
+
+    def record_transform(self, seconds):
+        self.add(self.transform_index, seconds, rows=1)
+
+    def record_cache(self, chunk_cache):
+        # chunk cache counters are per process, the latest values are copied into the slot
+        if chunk_cache is not None:
+            self.cache.array[self.current_slot()] = [ chunk_cache.hits, chunk_cache.misses, chunk_cache.evictions ]
+
+    def reset(self):
+        self.counters.array[...] = 0
+        self.cache.array[...] = 0
+
+    def release(self):
+        self.counters.release()
+        self.cache.release()
+
+    def summary(self, counters):
+        calls, rows, nbytes, seconds, read_seconds = [ float(value) for value in counters[:len(FIELDS)] ]
+        histogram = counters[len(FIELDS):]
+        stats = {
+            'calls': int(calls),
+            'rows': int(rows),
+            'bytes': int(nbytes),
+            'seconds': seconds,
+            'read_seconds': read_seconds,
+            'decode_seconds': max(seconds - read_seconds, 0.0),
+            'mean_latency': seconds / calls if calls else 0.0,
+            'histogram': { bucket_label(idx): int(count) for idx, count in enumerate(histogram) if count },
+        }
+        return stats
+
+    def slot_stats(self, counters, cache):
+        columns = { key: self.summary(counters[idx]) for key, idx in self.index.items() }
+        transform = self.summary(counters[self.transform_index])
+        hits, misses, evictions = [ int(value) for value in cache ]
+        return {
+            'rows': max([ column['rows'] for column in columns.values() ] + [0]),
+            'seconds': sum( column['seconds'] for column in columns.values() ) + transform['seconds'],
+            'columns': columns,
+            'transform': { key: transform[key] for key in ['calls', 'seconds', 'mean_latency', 'histogram'] },
+            'cache': { 'hits': hits, 'misses': misses, 'evictions': evictions,
+                'hit_rate': hits / (hits + misses) if hits + misses else None },
+        }
+
+    def stats(self, per_worker=False):
+        '''
+            Counters summed over the main process and every DataLoader worker
+
+            {'rows': 1024, 'seconds': 2.1,
+             'columns': {'image': {'calls': 16, 'rows': 1024, 'bytes': 12582912, 'seconds': 1.6,
+                'read_seconds': 1.2, 'decode_seconds': 0.4, 'mean_latency': 0.1, 'histogram': {'<=300ms': 16}}},
+             'transform': {'calls': 1024, 'seconds': 0.5, ...},
+             'cache': {'hits': 30, 'misses': 2, 'evictions': 0, 'hit_rate': 0.94}}
+
+            per_worker: add 'workers' with the same statistics of every slot which was used,
+                keyed by 'main' and 'worker_<id>'
+        '''
+        counters = np.array(self.counters.array)
+        cache = np.array(self.cache.array)
+        stats = self.slot_stats(counters.sum(axis=0), cache.sum(axis=0))
+        if per_worker:
+            stats['workers'] = {}
+            for slot in range(self.num_slots):
+                if counters[slot].any() or cache[slot].any():
+                    name = 'main' if slot == 0 else 'worker_{}'.format(slot - 1)
+                    stats['workers'][name] = self.slot_stats(counters[slot], cache[slot])
+        return stats
+
+
+def format_profile(stats):
+    '''
+        One line summary of ReadProfile.stats()
+
+        rows=1024 image 1.60s (read 75%) 7.5MB/s | label 0.01s (read 90%) 0.8MB/s | transform 0.50s | cache hit 94%
+    '''
+    parts = []
+    for key, column in stats['columns'].items():
+        read_share = column['read_seconds'] / column['seconds'] if column['seconds'] else 0.0
+        throughput = column['bytes'] / column['seconds'] / 1e6 if column['seconds'] else 0.0
+        parts.append('{} {:.2f}s (read {:.0%}) {:.1f}MB/s'.format(key, column['seconds'], read_share, throughput))
+    if stats['transform']['calls']:
+        parts.append('transform {:.2f}s'.format(stats['transform']['seconds']))
+    if stats['cache']['hit_rate'] is not None:
+        parts.append('cache hit {:.0%}'.format(stats['cache']['hit_rate']))
+    return 'rows={} '.format(stats['rows']) + ' | '.join(parts)
+
+
+class ProfileReporter:
+    '''
+        Write format_profile of a dataset every interval seconds from a background thread
+
+        with ProfileReporter(dataset, interval=60):
+            for batch in DataLoader(dataset, batch_size=32, num_workers=4):
+                pass
+    '''
+    def __init__(self, dataset, interval=60, stream=sys.stderr):
+        assert dataset.profile is not None, "dataset was created without profile=True"
+        self.dataset = dataset
+        self.interval = interval
+        self.stream = stream
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def report(self):
+        self.stream.write(format_profile(self.dataset.profile_stats()) + '\n')
+        self.stream.flush()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
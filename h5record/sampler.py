@@ -0,0 +1,122 @@
+import math
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+from .flat import is_flat
+
+
+def chunk_rows(dataset, columns=None):
+    '''
+        Rows per chunk of the datasets behind H5Dataset
+
+        the column with the largest rows in bytes sets the unit, it dominates the bytes read and
+        decompressed. With chunk_size='auto' every chunk is about 1MB, so small columns (Integer, Float)
+        hold far more rows per chunk and would make the unit huge, their chunks are few and stay in the
+        HDF5 chunk cache. Flat columns use their values chunk and the mean row length.
+        Contiguous datasets return 1
+    '''
+    reader = dataset.reader
+    if columns is None:
+        columns = dataset.column_names
+    largest = (0, 0, 1)
+    for key in columns:
+        node = reader[key]
+        if is_flat(node):
+            values, offsets = node['values'], node['offsets']
+            if not values.chunks:
+                continue
+            num_values, rows = values.shape[0], offsets.shape[0] - 1
+            row_values = num_values / rows if rows > 0 and num_values > 0 else 1
+            nbytes = values.chunks[0] * values.dtype.itemsize
+            rows_per_chunk = max(int(values.chunks[0] / row_values), 1)
+        else:
+            chunks = getattr(node, 'chunks', None)
+            if not chunks:
+                continue
+            nbytes = int(np.prod(chunks)) * node.dtype.itemsize
+            rows_per_chunk = chunks[0]
+        largest = max(largest, (nbytes / rows_per_chunk, nbytes, rows_per_chunk))
+    return largest[2]
+
+
+class H5ChunkShuffleSampler(Sampler):
+    '''
+        Shuffle sampler which preserves chunk locality
+
+        order of chunks is shuffled, then rows are shuffled inside a window of
+        window chunks, so each decompressed chunk is consumed within the window
+
+        follows DistributedSampler interface, call set_epoch at the start of every epoch
+        to get a different ordering
+
+        dataset: H5Dataset
+        window: number of chunks mixed together
+        chunk_size: rows per chunk, read from file when None
+        columns: columns whose chunks set chunk_size, the columns read by the dataset when None,
+            the column with the largest rows in bytes is used
+    '''
+    def __init__(self, dataset, window=4, chunk_size=None, num_replicas=None,
+        rank=None, shuffle=True, seed=0, drop_last=False, columns=None):
+
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+        if rank >= num_replicas or rank < 0:
+            raise ValueError("Invalid rank {}, rank should be in the interval [0, {}]".format(
+                rank, num_replicas - 1))
+        assert window > 0, "window must be a positive number"
+
+        self.num_entries = len(dataset)
+        self.chunk_size = chunk_rows(dataset, columns) if chunk_size is None else chunk_size
+        self.window = window
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.shuffle = shuffle
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+
+        self.num_chunks = int(math.ceil(self.num_entries / self.chunk_size))
+        if self.drop_last:
+            self.num_samples = self.num_entries // self.num_replicas
+        else:
+            self.num_samples = int(math.ceil(self.num_entries / self.num_replicas))
+        self.total_size = self.num_samples * self.num_replicas
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return self.num_samples
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        chunk_order = np.arange(self.num_chunks)
+        if self.shuffle:
+            chunk_order = rng.permutation(self.num_chunks)
+
+        # rows of every window of chunks are kept together, only shuffled inside the window
+        windows = []
+        for start in range(0, self.num_chunks, self.window):
+            window = np.concatenate([ self.chunk_indices(chunk_id)
+                for chunk_id in chunk_order[start:start+self.window] ])
+            if self.shuffle:
+                window = rng.permutation(window)
+            windows.append(window)
+        indices = np.concatenate(windows) if windows else np.arange(0)
+
+        if self.drop_last:
+            indices = indices[:self.total_size]
+        elif len(indices) < self.total_size:
+            # pad by wrapping around so every replica gets the same number of rows
+            indices = np.resize(indices, self.total_size)
+
+        # every replica reads a contiguous span, only windows on the border are shared
+        indices = indices[self.rank * self.num_samples:(self.rank + 1) * self.num_samples]
+        return iter(indices.tolist())
+
+    def chunk_indices(self, chunk_id):
+        start = chunk_id * self.chunk_size
+        return np.arange(start, min(start + self.chunk_size, self.num_entries))
@@ -0,0 +1,207 @@
+import os
+import json
+import h5py as h5
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from torch.utils.data import Sampler
+
+from .writer import H5Writer
+from .flat import is_flat, num_rows
+
+
+def shard_filenames(save_filename, num_shards):
+    # data.h5 => data-00000-of-00004.h5, ...
+    stem, ext = os.path.splitext(save_filename)
+    return [ '{}-{:05d}-of-{:05d}{}'.format(stem, idx, num_shards, ext or '.h5')
+        for idx in range(num_shards) ]
+
+
+def _write_shard(schema, shard_filename, items, preprocess_fn, writer_kwargs):
+    with H5Writer(schema, shard_filename, **writer_kwargs) as writer:
+        for item in items:
+            data = item if preprocess_fn is None else preprocess_fn(item)
+            if data is not None:
+                writer.write(data)
+    return writer.num_entries
+
+
+def build_sharded_dataset(schema, save_filename, shard_items, preprocess_fn=None,
+    filenames=None, num_workers=None, mp_context=None, **writer_kwargs):
+    '''
+        Write one H5Record file per shard in parallel and join them with a virtual dataset file
+
+        shard_items: list of picklable iterables, one per shard, of rows
+            (or raw items when preprocess_fn is given)
+        filenames: path of each shard, can be on different disks,
+            default is data-00000-of-00004.h5 next to save_filename
+        writer_kwargs: compression, chunk_size, buffer_size ... passed to H5Writer
+
+        the returned index file can be opened by H5Dataset like a normal file
+    '''
+    if isinstance(schema, list) or isinstance(schema, tuple):
+        schema = {  s.name: s  for s in schema }
+    if filenames is None:
+        filenames = shard_filenames(save_filename, len(shard_items))
+    assert len(filenames) == len(shard_items), "one filename is needed for every shard"
+
+    num_workers = len(shard_items) if num_workers is None else num_workers
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context) as executor:
+        futures = [ executor.submit(_write_shard, schema, filename, items, preprocess_fn, writer_kwargs)
+            for filename, items in zip(filenames, shard_items) ]
+        for future in futures:
+            future.result()
+
+    return create_virtual_index(save_filename, filenames)
+
+
+def create_virtual_index(save_filename, shard_filenames):
+    '''
+        Create index file which concatenates every column of the shards with h5py.VirtualLayout
+
+        flat columns concatenate their values virtually, offsets are rebased and stored in the index file
+        (8 bytes per row), shard row ranges are kept in the 'shards' attribute
+    '''
+    index_dir = os.path.dirname(os.path.abspath(save_filename))
+    shards = []
+    for filename in shard_filenames:
+        with h5.File(filename, 'r') as fin:
+            keys = list(fin.keys())
+            if len(keys) == 0: # nothing was written to this shard
+                continue
+            shards.append({
+                'filename': filename,
+                # relative path so shards next to the index file can be moved together
+                'source': os.path.relpath(os.path.abspath(filename), index_dir),
+                'rows': num_rows(fin[keys[0]]),
+                'layout': { key: dataset_spec(fin[key]) for key in keys },
+            })
+    if len(shards) == 0:
+        raise ValueError("all shards are empty")
+
+    start = 0
+    for shard in shards:
+        shard['start'], shard['stop'] = start, start + shard['rows']
+        start = shard['stop']
+
+    with h5.File(save_filename, 'w', libver='latest') as fout:
+        for key, spec in shards[0]['layout'].items():
+            if spec['flat']:
+                group = fout.create_group(key)
+                for name, value in spec['attrs'].items():
+                    group.attrs[name] = value
+                virtual_concat(group, 'values', [ (shard['source'], key + '/values',
+                    shard['layout'][key]['values']) for shard in shards ])
+
+                # offsets of every shard start from 0, shift by the values before the shard
+                offsets, base = [ np.zeros(1, dtype=spec['offsets']['dtype']) ], 0
+                for shard in shards:
+                    with h5.File(shard['filename'], 'r') as fin:
+                        shard_offsets = fin[key + '/offsets'][1:]
+                    offsets.append(shard_offsets + np.array(base, dtype=shard_offsets.dtype))
+                    base += shard['layout'][key]['values']['shape'][0]
+                group.create_dataset('offsets', data=np.concatenate(offsets))
+            else:
+                virtual_concat(fout, key, [ (shard['source'], key, shard['layout'][key])
+                    for shard in shards ])
+
+        with h5.File(shards[0]['filename'], 'r') as fin:
+            if 'schema' in fin.attrs:
+                fout.attrs['schema'] = fin.attrs['schema']
+        fout.attrs['shards'] = json.dumps([ { 'filename': shard['source'],
+            'start': shard['start'], 'stop': shard['stop'] } for shard in shards ])
+    return save_filename
+
+
+def dataset_spec(node):
+    if is_flat(node):
+        return {
+            'flat': True,
+            'attrs': dict(node.attrs),
+            'values': dataset_spec(node['values']),
+            'offsets': dataset_spec(node['offsets']),
+        }
+    return { 'flat': False, 'shape': node.shape, 'dtype': node.dtype }
+
+
+def virtual_concat(parent, name, sources):
+    # sources: list of (filename, dataset name, spec), concatenated on the first axis
+    first = sources[0][2]
+    total = sum( spec['shape'][0] for _, _, spec in sources )
+    layout = h5.VirtualLayout(shape=(total, ) + tuple(first['shape'][1:]), dtype=first['dtype'])
+    start = 0
+    for filename, dataset_name, spec in sources:
+        if tuple(spec['shape'][1:]) != tuple(first['shape'][1:]):
+            raise ValueError("shard {} column {} has shape {}, expected {}".format(
+                filename, dataset_name, spec['shape'], first['shape']))
+        rows = spec['shape'][0]
+        if rows > 0:
+            layout[start:start+rows] = h5.VirtualSource(filename, dataset_name, shape=spec['shape'])
+        start += rows
+    return parent.create_virtual_dataset(name, layout)
+
+
+def read_shards(filename):
+    '''
+        Shard row ranges of an index file, None for a normal file
+
+        [{'filename': 'data-00000-of-00002.h5', 'start': 0, 'stop': 100}, ...]
+    '''
+    with h5.File(filename, 'r') as fin:
+        if 'shards' not in fin.attrs:
+            return None
+        return json.loads(fin.attrs['shards'])
+
+
+class H5ShardSampler(Sampler):
+    '''
+        Batch sampler which keeps every DataLoader worker on its own shards
+
+        DataLoader hands batch k to worker k % num_workers, so batch k is drawn from shards
+        assigned to that worker (shard i belongs to worker i % num_workers) and each worker
+        process only opens its own shard files. Once a worker runs out of rows the remaining
+        batches are emitted in turn and may cross shards.
+
+        DataLoader(dataset, batch_sampler=H5ShardSampler(dataset, 32, num_workers=4), num_workers=4)
+    '''
+    def __init__(self, dataset, batch_size, num_workers=1, shuffle=True, seed=0, drop_last=False):
+        shards = read_shards(dataset.save_filename)
+        if shards is None:
+            shards = [ { 'start': 0, 'stop': len(dataset) } ]
+        self.shards = shards
+        self.batch_size = batch_size
+        self.num_workers = max(num_workers, 1)
+        self.shuffle = shuffle
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def worker_batches(self, rng):
+        batches = []
+        for worker_id in range(self.num_workers):
+            indices = [ np.arange(shard['start'], shard['stop'])
+                for shard in self.shards[worker_id::self.num_workers] ]
+            indices = np.concatenate(indices) if indices else np.arange(0)
+            if self.shuffle:
+                indices = rng.permutation(indices)
+            worker_batches = [ indices[start:start+self.batch_size].tolist()
+                for start in range(0, len(indices), self.batch_size) ]
+            if self.drop_last and len(worker_batches) and len(worker_batches[-1]) < self.batch_size:
+                worker_batches = worker_batches[:-1]
+            batches.append(worker_batches)
+        return batches
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        batches = self.worker_batches(rng)
+        position = 0
+        while any( len(worker_batches) > position for worker_batches in batches ):
+            for worker_batches in batches:
+                if len(worker_batches) > position:
+                    yield worker_batches[position]
+            position += 1
+
+    def __len__(self):
+        return sum( len(worker_batches) for worker_batches in self.worker_batches(np.random.default_rng(0)) )
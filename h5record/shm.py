@@ -0,0 +1,220 @@
+import os
+import atexit
+import threading
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+from .flat import FlatColumn, flatten_vlen, is_vlen, is_flat, open_flat
+
+
+# segments created by this process and number of arrays still referencing them
+_refcounts = {}
+_segments = {}
+_owners = {}
+_lock = threading.Lock()
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 registers attached segments to the resource tracker,
+        # which would unlink them when a worker exits
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+def _acquire(name):
+    with _lock:
+        _refcounts[name] = _refcounts.get(name, 0) + 1
+
+
+def _release(name):
+    with _lock:
+        if name not in _refcounts:
+            return
+        _refcounts[name] -= 1
+        if _refcounts[name] > 0:
+            return
+        del _refcounts[name]
+        segment = _segments.pop(name)
+        _owners.pop(name)
+    _unlink(segment)
+
+
+def _unlink(segment):
+    try:
+        segment.close()
+    except BufferError:
+        # arrays returned to the caller still map the segment, memory is freed once they are gone
+        pass
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+
+
+@atexit.register
+def _cleanup():
+    # forked processes inherit the registry, only the creator unlinks
+    for name, segment in list(_segments.items()):
+        if _owners.get(name) == os.getpid():
+            _unlink(segment)
+    _segments.clear()
+    _refcounts.clear()
+    _owners.clear()
+
+
+class SharedArray:
+    '''
+        numpy array backed by a named shared memory segment
+
+        the creating process owns the segment and unlinks it once the last reference is released,
+        other processes attach by name as zero copy read only views, writeable arrays are shared
+        counters which every process updates in place
+    '''
+    def __init__(self, name, shape, dtype, owner, writeable=False):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = owner
+        self.writeable = writeable
+        self.segment = None
+        self.array = None
+
+    @classmethod
+    def create(cls, array, writeable=False):
+        array = np.ascontiguousarray(array)
+        # zero sized segment is not allowed
+        segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = cls(segment.name, array.shape, array.dtype, os.getpid(), writeable)
+        with _lock:
+            _segments[segment.name] = segment
+            _owners[segment.name] = os.getpid()
+        _acquire(segment.name)
+        shared.segment = segment
+        shared.array = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+        shared.array[...] = array
+        shared.array.flags.writeable = writeable
+        return shared
+
+    def attach(self):
+        if self.owner == os.getpid():
+            _acquire(self.name)
+            self.segment = _segments[self.name]
+        else:
+            self.segment = _attach(self.name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.segment.buf)
+        self.array.flags.writeable = self.writeable
+        return self
+
+    def release(self):
+        if self.segment is None:
+            return
+        self.array = None
+        if self.owner == os.getpid():
+            _release(self.name)
+        else:
+            # forked or spawned workers only drop their mapping
+            try:
+                self.segment.close()
+            except BufferError:
+                pass
+        self.segment = None
+
+    def __getstate__(self):
+        return { 'name': self.name, 'shape': self.shape, 'dtype': self.dtype.str, 'owner': self.owner,
+            'writeable': self.writeable }
+
+    def __setstate__(self, state):
+        self.__init__(state['name'], state['shape'], state['dtype'], state['owner'], state.get('writeable', False))
+        self.attach()
+
+    def __del__(self):
+        try:
+            self.release()
+        except Exception:
+            pass
+
+
+class SharedMemoryStore:
+    '''
+        In memory copy of columns placed in shared memory, used by H5Dataset(to_memory=True, shared_memory=True)
+
+        columns are decompressed once by the main process, DataLoader workers attach to the same
+        segments through fork or pickling, variable length columns are stored as values + offsets
+    '''
+    def __init__(self):
+        self.arrays = {}
+        self.columns = {}
+
+    @classmethod
+    def load(cls, reader, keys):
+        store = cls()
+        for key in keys:
+            source = reader[key]
+            if is_flat(source):
+                kind = open_flat(source).kind
+                store.arrays[key] = (kind, SharedArray.create(source['values'][:]),
+                    SharedArray.create(source['offsets'][:]))
+            elif isinstance(source, FlatColumn):
+                store.arrays[key] = (source.kind, SharedArray.create(np.asarray(source.values)),
+                    SharedArray.create(np.asarray(source.offsets)))
+            elif is_vlen(source.dtype):
+                values, offsets, kind = flatten_vlen(source[:])
+                store.arrays[key] = (kind, SharedArray.create(values), SharedArray.create(offsets))
+            else:
+                store.arrays[key] = ('dense', SharedArray.create(source[:]))
+        store.build()
+        return store
+
+    def build(self):
+        for key, spec in self.arrays.items():
+            if spec[0] == 'dense':
+                self.columns[key] = spec[1].array
+            else:
+                self.columns[key] = FlatColumn(spec[1].array, spec[2].array, kind=spec[0])
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def keys(self):
+        return self.columns.keys()
+
+    def select(self, keys):
+        '''
+            Store of a subset of the columns on the same segments, every array is attached again
+            so releasing the subset does not release the columns of this store
+        '''
+        store = self.__class__()
+        for key, spec in self.arrays.items():
+            if key in keys:
+                store.arrays[key] = (spec[0], ) + tuple( SharedArray(shared.name, shared.shape, shared.dtype,
+                    shared.owner, shared.writeable).attach() for shared in spec[1:] )
+        store.build()
+        return store
+
+    def nbytes(self):
+        return { key: sum( shared.array.nbytes for shared in spec[1:] )
+            for key, spec in self.arrays.items() }
+
+    def release(self):
+        self.columns = {}
+        for spec in self.arrays.values():
+            for shared in spec[1:]:
+                shared.release()
+
+    def __getstate__(self):
+        return { 'arrays': self.arrays }
+
+    def __setstate__(self, state):
+        self.arrays = state['arrays']
+        self.columns = {}
+        self.build()
@@ -0,0 +1,92 @@
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data import IterableDataset, get_worker_info
+
+from .sampler import chunk_rows
+
+
+class H5IterableDataset(IterableDataset):
+    '''
+        Stream rows of H5Dataset in large sequential blocks
+
+        every block is read with a single slab read per column, blocks are split across
+        torch.distributed ranks and then DataLoader workers, so each process reads its own
+        disjoint blocks front to back, suited to one pass jobs (feature extraction, eval, conversion)
+
+        stream = H5IterableDataset(H5Dataset(schema, 'data.h5'), block_rows=4096)
+        for batch in DataLoader(stream, batch_size=256, num_workers=4):
+            pass
+
+        dataset: H5Dataset
+        block_rows: rows per read, never exceeded, rounded down to a multiple of the chunk size of the column
+            with the largest rows (see chunk_rows) so its chunks are decompressed once, kept as given when
+            smaller than one chunk
+        shuffle_buffer: rows kept in a buffer from which rows are drawn at random, 0 keeps file order,
+            when enabled the order of blocks is shuffled as well
+        seed: seed of the shuffle, combined with the epoch given to set_epoch
+    '''
+    def __init__(self, dataset, block_rows=4096, shuffle_buffer=0, seed=0,
+        num_replicas=None, rank=None):
+
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+        if rank >= num_replicas or rank < 0:
+            raise ValueError("Invalid rank {}, rank should be in the interval [0, {}]".format(
+                rank, num_replicas - 1))
+        assert block_rows > 0 and shuffle_buffer >= 0
+
+        self.dataset = dataset
+        chunk_size = chunk_rows(dataset)
+        self.block_rows = block_rows // chunk_size * chunk_size if block_rows >= chunk_size else block_rows
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def blocks(self, num_workers=1, worker_id=0):
+        # (start, stop) of blocks read by one worker of this rank
+        num_entries = len(self.dataset)
+        starts = np.arange(0, num_entries, self.block_rows)
+        if self.shuffle_buffer > 0:
+            # same permutation on every rank and worker, each picks a disjoint subset
+            starts = np.random.default_rng(self.seed + self.epoch).permutation(starts)
+        starts = starts[self.rank * num_workers + worker_id::self.num_replicas * num_workers]
+        return [ (int(start), int(min(start + self.block_rows, num_entries))) for start in starts ]
+
+    def __len__(self):
+        # rows read by this rank over all of its workers
+        return sum( stop - start for start, stop in self.blocks() )
+
+    def rows(self, blocks):
+        for start, stop in blocks:
+            for row in self.dataset.__getitems__(range(start, stop)):
+                yield row
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker_id, num_workers = 0, 1
+        if worker_info is not None:
+            worker_id, num_workers = worker_info.id, worker_info.num_workers
+        rows = self.rows(self.blocks(num_workers, worker_id))
+        if self.shuffle_buffer == 0:
+            yield from rows
+            return
+
+        rng = np.random.default_rng((self.seed + self.epoch, self.rank, worker_id))
+        buffer = []
+        for row in rows:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(row)
+                continue
+            # swap a random buffered row out for the new one
+            idx = int(rng.integers(len(buffer)))
+            yield buffer[idx]
+            buffer[idx] = row
+        for idx in rng.permutation(len(buffer)):
+            yield buffer[idx]
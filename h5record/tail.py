@@ -0,0 +1,78 @@
+import time
+from torch.utils.data import IterableDataset, get_worker_info
+
+
+class H5TailDataset(IterableDataset):
+    '''
+        Iterate rows of a file which is still being written
+
+        rows are yielded in order as the writer commits them, the dataset extent is refreshed
+        every poll_interval seconds while no new rows are available
+
+        the writer has to run in SWMR mode before the file is opened here:
+
+            # ingest process
+            with H5Writer(schema, 'data.h5', swmr=True, flush_interval=5) as writer:
+                for row in rows:
+                    writer.write(row)
+
+            # training process
+            stream = H5TailDataset(H5Dataset(schema, 'data.h5'), timeout=600)
+            for batch in DataLoader(stream, batch_size=32, num_workers=2):
+                pass
+
+        dataset: H5Dataset opened on the file
+        start: first row to read
+        block_rows: rows read with one batched read, DataLoader workers take turns on blocks
+        poll_interval: seconds between refresh while waiting for new rows
+        timeout: stop after this many seconds without new rows, None blocks forever
+        max_rows: stop after this row, for example the known size of the ingest
+    '''
+    def __init__(self, dataset, start=0, block_rows=64, poll_interval=1.0, timeout=None, max_rows=None):
+        assert block_rows > 0 and poll_interval > 0
+        self.dataset = dataset
+        self.start = start
+        self.block_rows = block_rows
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_rows = max_rows
+
+    def blocks(self):
+        '''
+            Yield (start, stop) of committed blocks in order, waiting for the writer when needed
+
+            a partial block at the end is only yielded once the writer is idle past timeout,
+            so every worker computes the same block boundaries
+        '''
+        position = self.start
+        available = len(self.dataset)
+        last_update = time.time()
+        while self.max_rows is None or position < self.max_rows:
+            end = available if self.max_rows is None else min(available, self.max_rows)
+            if end - position >= self.block_rows or (end > position and end == self.max_rows):
+                stop = min(position + self.block_rows, end)
+                yield position, stop
+                position = stop
+                continue
+
+            if self.timeout is not None and time.time() - last_update >= self.timeout:
+                if end > position:
+                    yield position, end
+                return
+            time.sleep(self.poll_interval)
+            size = self.dataset.refresh()
+            if size > available:
+                available = size
+                last_update = time.time()
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker_id, num_workers = 0, 1
+        if worker_info is not None:
+            worker_id, num_workers = worker_info.id, worker_info.num_workers
+
+        for block_id, (start, stop) in enumerate(self.blocks()):
+            if block_id % num_workers != worker_id:
+                continue
+            for row in self.dataset.__getitems__(list(range(start, stop))):
+                yield row
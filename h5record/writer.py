@@ -0,0 +1,147 @@
+import os
+import time
+
+from .attributes import write_schema
+from .backend import BACKENDS, HDF5Backend, backend_name
+
+
+class H5Writer:
+    '''
+        Bulk writer which keeps a single file handle open for the whole ingest, 
+        columns are stored through a Backend, HDF5 by default
+
+        Rows are transformed and collected into per attribute buffers, every
+        buffer_size rows each column is flushed with one resize and one slab write
+
+        with H5Writer(schema, 'data.h5', buffer_size=1000) as writer:
+            for row in data_iter:
+                writer.write(row)
+
+        swmr: enable single writer multiple reader mode so readers can open the file during ingest,
+            HDF5 then writes every partially filled chunk on each flush, which grows compressed files
+        append: open an existing file and add rows after the stored ones, the schema is checked
+            against the stored columns, a new file is created when it does not exist
+        flush_interval: with swmr, buffered rows are also flushed once this many seconds passed
+            since the last flush, which bounds how long readers wait for slow ingest
+        backend: 'hdf5' or 'lmdb', picked from the filename when None, see backend.backend_name
+    '''
+    def __init__(self, schema, save_filename, compression=None,
+        data_length=None, chunk_size='auto', buffer_size=1000, rdcc_nbytes=64*1024*1024,
+        swmr=False, append=False, flush_interval=None, backend=None):
+
+        if isinstance(schema, list) or isinstance(schema, tuple):
+            schema = {  s.name: s  for s in schema }
+        assert buffer_size > 0, "buffer size must be a positive number"
+        self.schema = schema
+        self.save_filename = save_filename
+        self.compression = compression
+        self.data_length = data_length
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.rdcc_nbytes = rdcc_nbytes
+        self.swmr = swmr
+        self.append = append
+        self.flush_interval = flush_interval
+        self.last_flush = time.time()
+        self.backend = backend_name(save_filename, backend)
+
+        self.store = None
+        self.initialized = False
+        self.num_entries = 0
+        self.buffers = {}
+        self.buffered = 0
+        self.capacity = None
+
+    def open_store(self, mode):
+        # partially filled chunks stay in the chunk cache until full, 
+        # otherwise compressed chunks are rewritten on every flush and the file keeps the stale copies
+        if self.backend == 'hdf5':
+            self.store = HDF5Backend(self.save_filename, rdcc_nbytes=self.rdcc_nbytes, rdcc_nslots=10007)
+        else:
+            self.store = BACKENDS[self.backend](self.save_filename)
+        self.store.open(mode)
+
+    def open(self):
+        # a new file is only created by the first row, so an empty ingest leaves no file behind
+        if not (self.append and os.path.exists(self.save_filename)):
+            return self
+        self.open_store('a')
+        if len(self.store.keys()) > 0:
+            self.num_entries = self.store.check_schema(self.schema)
+            self.capacity = self.store.capacity()
+            self.buffers = { key: [] for key in self.store.keys() }
+            self.initialized = True
+            if 'schema' not in self.store.attrs:
+                # file written before the schema was stored
+                write_schema(self.store, self.schema, list(self.buffers.keys()))
+            if self.swmr:
+                self.store.start_swmr()
+        return self
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data, transformed=False):
+        '''
+            data: row dictionary of column name to value
+            transformed: values already went through Attribute.transform, 
+                such as rows preprocessed in worker processes, not allowed for the first row
+        '''
+        if not self.initialized:
+            assert not transformed, "first row creates the datasets and must not be transformed"
+            if self.store is None:
+                self.open_store('w')
+            # first row decide the dataset shape, same as the previous per row ingest
+            for key, value in data.items():
+                self.store.create_column(self.schema[key], value,
+                    self.compression, self.data_length, self.chunk_size)
+            write_schema(self.store, self.schema, list(data.keys()))
+            self.buffers = { key: [] for key in data.keys() }
+            self.capacity = self.store.capacity()
+            self.initialized = True
+            if self.swmr:
+                self.store.start_swmr()
+        else:
+            if self.capacity is not None and self.num_entries >= self.capacity:
+                # rejected before buffering so every column keeps the same number of rows
+                raise ValueError("{} is full, data_length of the file is {} rows".format(
+                    self.save_filename, self.capacity))
+            if data.keys() != self.buffers.keys():
+                raise KeyError("row has columns {}, expected {}".format(
+                    sorted(data.keys()), sorted(self.buffers.keys())))
+            for key, value in data.items():
+                attribute = self.schema[key]
+                self.buffers[key].append(value if transformed else attribute.transform(value))
+            self.buffered += 1
+
+        self.num_entries += 1
+        if self.buffered >= self.buffer_size:
+            self.flush()
+        elif self.swmr and self.flush_interval is not None and \
+            time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        # write buffered rows to the datasets, HDF5 writes them to disk on close
+        if self.buffered > 0:
+            for key, values in self.buffers.items():
+                attribute = self.schema[key]
+                self.store.append(attribute, attribute.stack(values))
+                values.clear()
+            self.buffered = 0
+            if self.swmr:
+                # readers only see rows once the metadata is written
+                self.store.flush()
+        self.last_flush = time.time()
+
+    def close(self):
+        if self.store is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.store.close()
+            self.store = None
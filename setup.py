@@ -46,6 +46,12 @@ setup(
         'h5py',
         'numpy'
     ],
+    extras_require={
+        'lmdb': ['lmdb'],
+    },
+    entry_points={
+        'console_scripts': ['h5record-benchmark=h5record.benchmark:main'],
+    },
     tests_require=test_requirements,
     license='MIT License',
     classifiers=[
@@ -0,0 +1,58 @@
+'''
+    Compare file size and read speed of raw Image against EncodedImage
+
+    python -m test.benchmark_encoded_image
+'''
+import os
+import time
+import numpy as np
+
+from h5record import H5Dataset, Image, EncodedImage
+
+
+image_paths = [
+    'test/images/1.jpeg',
+    'test/images/2.jpeg',
+    'test/images/3.jpeg',
+    'test/images/4.jpeg',
+    'test/images/5.jpeg',
+]
+
+def benchmark(name, attribute, images, compression=None, batch_size=64):
+    filename = 'benchmark_image.h5'
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    start = time.time()
+    dataset = H5Dataset([ attribute ], filename,
+        ( { attribute.name: image } for image in images ), compression=compression)
+    write_speed = len(images) / (time.time() - start)
+    file_size = os.path.getsize(filename) / 1024 / 1024
+
+    indices = np.random.permutation(len(dataset))
+    start = time.time()
+    for idx in indices:
+        dataset[int(idx)]
+    random_speed = len(indices) / (time.time() - start)
+
+    start = time.time()
+    for batch_start in range(0, len(indices), batch_size):
+        dataset[indices[batch_start:batch_start+batch_size]]
+    batch_speed = len(indices) / (time.time() - start)
+
+    print('{:<20} {:>8.2f} MB {:>10.2f} write rows/s {:>10.2f} random rows/s {:>10.2f} batched rows/s'.format(
+        name, file_size, write_speed, random_speed, batch_speed))
+    dataset.close()
+    os.remove(filename)
+
+
+if __name__ == "__main__":
+    data_size = 2000
+    reader = Image(name='image', h=224, w=224)
+    images = [ reader.read_image(path) for path in image_paths ]
+    images = [ images[idx % len(images)] for idx in range(data_size) ]
+
+    benchmark('Image', Image(name='image', h=224, w=224), images)
+    benchmark('Image gzip', Image(name='image', h=224, w=224), images, compression='gzip')
+    for codec in ['jpeg', 'webp', 'png']:
+        benchmark('EncodedImage ' + codec, EncodedImage(name='image', h=224, w=224, codec=codec), images)
@@ -0,0 +1,66 @@
+'''
+    Compare ingest speed of the previous per row writer against H5Writer
+
+    python -m test.benchmark_writer
+'''
+import os
+import time
+import h5py as h5
+import numpy as np
+
+from h5record import H5Writer, String, Integer, Sequence
+
+
+schema = (
+    String(name='sentence'),
+    Integer(name='label'),
+    Sequence(name='tokens'),
+)
+
+def text_iter(data_size):
+    for idx in range(data_size):
+        yield {
+            'sentence': 'The quick brown fox jumps over the lazy dog {}'.format(idx),
+            'label': idx % 2,
+            'tokens': np.arange(idx % 64 + 1),
+        }
+
+def per_row_ingest(filename, data_iter):
+    # reopen file and append each column for every row
+    for idx, data in enumerate(data_iter):
+        if idx == 0:
+            with h5.File(filename, 'w', libver='latest') as fout:
+                fout.swmr_mode = True
+                for key, value in data.items():
+                    attribute = [ s for s in schema if s.name == key ][0]
+                    attribute.init_attributes(fout, value, None, None)
+        else:
+            with h5.File(filename, 'a', libver='latest') as fout:
+                fout.swmr_mode = True
+                for key, value in data.items():
+                    attribute = [ s for s in schema if s.name == key ][0]
+                    attribute.append(fout, attribute.transform(value))
+
+def buffered_ingest(filename, data_iter, buffer_size):
+    with H5Writer(schema, filename, buffer_size=buffer_size) as writer:
+        for data in data_iter:
+            writer.write(data)
+
+def benchmark(name, func, data_size):
+    filename = 'benchmark_writer.h5'
+    if os.path.exists(filename):
+        os.remove(filename)
+    start = time.time()
+    func(filename, text_iter(data_size))
+    elapsed = time.time() - start
+    print('{:<24} {:>10.2f} rows/s'.format(name, data_size / elapsed))
+    os.remove(filename)
+
+
+if __name__ == "__main__":
+    data_size = 20000
+    benchmark('per row', per_row_ingest, data_size)
+    for buffer_size in [100, 1000, 10000]:
+        benchmark('buffered ({})'.format(buffer_size),
+            lambda filename, data_iter: buffered_ingest(filename, data_iter, buffer_size),
+            data_size)
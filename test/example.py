@@ -24,8 +24,7 @@ schema = (
 # this would provide faster index access
 dataset = H5Dataset(schema, 'mnist.h5', 
     mnist_generator(), 
-    data_length=60000, chunk_size=300, 
-    multiprocess=True)
+    data_length=60000, chunk_size=300)
 
 
 print('Data size ', len(dataset))
@@ -0,0 +1,100 @@
+import unittest
+import os
+import multiprocessing as mp
+import numpy as np
+from h5record.dataset import H5Dataset
+from h5record.writer import H5Writer
+from h5record.attributes import Integer, String, Sequence
+
+def rows(start, stop):
+    for idx in range(start, stop):
+        yield {
+            'label': idx,
+            'text': 'row {}'.format(idx),
+            'tokens': np.arange(idx % 5 + 1),
+        }
+
+def schema(storage='vlen'):
+    return ( Integer(name='label'), String(name='text', storage=storage),
+        Sequence(name='tokens', storage=storage) )
+
+def tail_reader(storage, ready, go, result):
+    dataset = H5Dataset(schema(storage), './append.h5')
+    ready.put(len(dataset))
+    go.get(timeout=30)
+    size = dataset.refresh()
+    result.put((size, [ dataset[idx]['text'] for idx in range(size) ]))
+
+class TestAppend(unittest.TestCase):
+
+
+    def setUp(self):
+        if os.path.exists('append.h5'):
+            os.remove('append.h5')
+
+    def tearDown(self):
+        if os.path.exists('append.h5'):
+            os.remove('append.h5')
+
+    def check_rows(self, dataset, size):
+        assert len(dataset) == size
+        for idx in range(size):
+            row = dataset[idx]
+            assert row['label'] == idx
+            assert row['text'] == 'row {}'.format(idx)
+            assert (row['tokens'][0] == np.arange(idx % 5 + 1)).all()
+
+    def test_append_mode(self):
+        for storage in ['vlen', 'flat']:
+            H5Dataset(schema(storage), './append.h5', rows(0, 10), chunk_size=4, buffer_size=3)
+            dataset = H5Dataset(schema(storage), './append.h5', rows(10, 23), append_mode=True, buffer_size=4)
+            self.check_rows(dataset, 23)
+            # without data_iter the file is opened as is
+            self.check_rows(H5Dataset(schema(storage), './append.h5', append_mode=True), 23)
+            os.remove('append.h5')
+
+    def test_schema_mismatch(self):
+        H5Dataset(schema(), './append.h5', rows(0, 5))
+        with self.assertRaises(ValueError):
+            H5Dataset(schema('flat'), './append.h5', rows(5, 8), append_mode=True)
+        with self.assertRaises(ValueError):
+            H5Dataset(( Integer(name='label'), ), './append.h5', rows(5, 8), append_mode=True)
+        self.check_rows(H5Dataset(schema(), './append.h5'), 5)
+
+    def test_data_length(self):
+        H5Dataset(schema('flat'), './append.h5', rows(0, 5), data_length=12, chunk_size=4)
+        with self.assertRaises(ValueError):
+            H5Dataset(schema('flat'), './append.h5', rows(5, 20), append_mode=True, buffer_size=3)
+        # rows up to data_length are kept and every column has the same length
+        self.check_rows(H5Dataset(schema('flat'), './append.h5'), 12)
+
+    def test_refresh(self):
+        dataset = H5Dataset(schema(), './append.h5', rows(0, 10))
+        assert dataset[9]['label'] == 9
+        dataset.close()
+        H5Dataset(schema(), './append.h5', rows(10, 15), append_mode=True)
+        assert dataset.refresh() == 15
+        self.check_rows(dataset, 15)
+
+    def test_swmr_reader(self):
+        ctx = mp.get_context('spawn')
+        for storage in ['vlen', 'flat']:
+            H5Dataset(schema(storage), './append.h5', rows(0, 10), chunk_size=4)
+            ready, go, result = ctx.Queue(), ctx.Queue(), ctx.Queue()
+            with H5Writer(schema(storage), './append.h5', append=True, swmr=True, buffer_size=4) as writer:
+                # readers open the file after the writer switched to SWMR mode
+                reader = ctx.Process(target=tail_reader, args=(storage, ready, go, result))
+                reader.start()
+                assert ready.get(timeout=60) == 10
+                for row in rows(10, 21):
+                    writer.write(row)
+                writer.flush()
+                go.put(True)
+                size, texts = result.get(timeout=60)
+                reader.join(timeout=60)
+            assert size == 21
+            assert texts == [ 'row {}'.format(idx) for idx in range(21) ]
+            os.remove('append.h5')
+
+if __name__ == "__main__":
+    unittest.main()
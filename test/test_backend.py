@@ -0,0 +1,174 @@
+import unittest
+import os
+import shutil
+import numpy as np
+from h5record.dataset import H5Dataset
+from h5record.attributes import (Image, EncodedImage, ImageSequence, Integer, Float,
+    String, Sequence, FloatSequence)
+
+try:
+    import lmdb
+except ImportError:
+    lmdb = None
+
+def make_schema():
+    return (
+        Image(name='image', h=8, w=8),
+        EncodedImage(name='thumb', h=8, w=8, codec='png'),
+        ImageSequence(name='clip', h=4, w=4),
+        Integer(name='label'),
+        Float(name='score'),
+        String(name='text'),
+        String(name='title', storage='flat'),
+        Sequence(name='tokens'),
+        FloatSequence(name='weights', storage='flat'),
+    )
+
+def make_row(idx):
+    return {
+        'image': np.full((3, 8, 8), idx, dtype=np.uint8),
+        'thumb': np.full((3, 8, 8), idx * 3, dtype=np.uint8),
+        'clip': np.full(3 * 4 * 4 * (idx % 3 + 1), idx, dtype=np.uint8),
+        'label': idx,
+        'score': idx / 4,
+        'text': 'row {}'.format(idx),
+        'title': 'título {}'.format(idx),
+        'tokens': np.arange(idx + 1),
+        'weights': np.ones(idx % 4 + 1, dtype=np.float32) * idx,
+    }
+
+class TestBackend(unittest.TestCase):
+
+
+    def setUp(self):
+        self.size = 13
+        self.tearDown()
+
+    def tearDown(self):
+        for filename in ['backend.h5', 'converted.h5']:
+            if os.path.exists(filename):
+                os.remove(filename)
+        for dirname in ['backend.lmdb', 'backend.numpy']:
+            if os.path.exists(dirname):
+                shutil.rmtree(dirname)
+
+    def check_rows(self, dataset, size=None):
+        size = self.size if size is None else size
+        assert len(dataset) == size
+        for idx in range(size):
+            row, expected = dataset[idx], make_row(idx)
+            assert (row['image'] == expected['image']).all()
+            assert (row['thumb'] == expected['thumb']).all()
+            assert row['clip'].shape == (3, 4, 4, idx % 3 + 1)
+            assert row['label'] == idx
+            assert abs(row['score'] - idx / 4) < 1e-6
+            assert row['text'] == expected['text']
+            assert row['title'] == expected['title']
+            assert (row['tokens'][0] == expected['tokens']).all()
+            assert (row['weights'][0] == expected['weights']).all()
+        batch = dataset[[7, 2, 7]]
+        assert list(batch['label']) == [7, 2, 7]
+        assert list(batch['title']) == [ make_row(idx)['title'] for idx in [7, 2, 7] ]
+        assert (batch['image'][1] == make_row(2)['image']).all()
+
+    def test_backend_name(self):
+        from h5record.backend import backend_name
+        assert backend_name('data.h5') == 'hdf5'
+        assert backend_name('data.lmdb') == 'lmdb'
+        assert backend_name('data', 'lmdb') == 'lmdb'
+        assert backend_name('data.numpy') == 'numpy'
+        with self.assertRaises(ValueError):
+            backend_name('data.h5', 'zarr')
+
+    def test_convert_hdf5(self):
+        from h5record.convert import convert
+        H5Dataset(make_schema(), './backend.h5', ( make_row(idx) for idx in range(self.size) ))
+        assert convert('backend.h5', 'converted.h5', block_rows=4, compression='gzip') == self.size
+        self.check_rows(H5Dataset.open('converted.h5'))
+
+    @unittest.skipIf(lmdb is None, "lmdb is not installed")
+    def test_lmdb(self):
+        dataset = H5Dataset(make_schema(), './backend.lmdb', ( make_row(idx) for idx in range(self.size) ),
+            buffer_size=4)
+        self.check_rows(dataset)
+        self.check_rows(H5Dataset.open('backend.lmdb'))
+        self.check_rows(H5Dataset.open('backend.lmdb', to_memory=True))
+
+        # append to the existing database
+        H5Dataset(make_schema(), './backend.lmdb', ( make_row(idx) for idx in range(self.size, self.size + 3) ),
+            append_mode=True)
+        dataset = H5Dataset.open('backend.lmdb')
+        assert len(dataset) == self.size + 3
+        assert dataset[self.size + 2]['text'] == 'row {}'.format(self.size + 2)
+
+    @unittest.skipIf(lmdb is None, "lmdb is not installed")
+    def test_lmdb_handles(self):
+        from torch.utils.data import DataLoader, BatchSampler, SequentialSampler
+        from h5record.prefetch import H5PrefetchDataset
+        dataset = H5Dataset(make_schema(), './backend.lmdb', ( make_row(idx) for idx in range(self.size) ))
+        assert dataset[0]['label'] == 0
+        view = dataset.select(['label', 'text'])
+        assert view[3]['text'] == 'row 3'
+
+        # forked workers open their own environment after the parent has read rows
+        labels = []
+        for batch in DataLoader(view, batch_size=4, num_workers=2):
+            labels += batch['label'].tolist()
+        assert sorted(labels) == list(range(self.size))
+
+        batches = BatchSampler(SequentialSampler(range(self.size)), batch_size=3, drop_last=False)
+        prefetch = H5PrefetchDataset(view, batches, depth=2, num_threads=2)
+        labels = [ row['label'] for rows in prefetch for row in rows ]
+        assert labels == list(range(self.size))
+        for worker_batches in DataLoader(prefetch, batch_size=None, num_workers=2):
+            assert len(worker_batches) > 0
+        dataset.close()
+        view.close()
+
+    @unittest.skipIf(lmdb is None, "lmdb is not installed")
+    def test_convert_lmdb(self):
+        from h5record.convert import convert
+        H5Dataset(make_schema(), './backend.h5', ( make_row(idx) for idx in range(self.size) ))
+        convert('backend.h5', 'backend.lmdb', block_rows=5)
+        self.check_rows(H5Dataset.open('backend.lmdb'))
+        convert('backend.lmdb', 'converted.h5', block_rows=5)
+        self.check_rows(H5Dataset.open('converted.h5'))
+
+    def test_numpy(self):
+        dataset = H5Dataset(make_schema(), './backend.numpy', ( make_row(idx) for idx in range(self.size) ),
+            buffer_size=4)
+        assert os.path.exists('backend.numpy/image.data.bin')
+        assert os.path.exists('backend.numpy/tokens.offsets.bin')
+        self.check_rows(dataset)
+        self.check_rows(H5Dataset.open('backend.numpy'))
+
+        memory = H5Dataset.open('backend.numpy', to_memory=True)
+        assert not isinstance(memory.memory['image'], np.memmap)
+        self.check_rows(memory)
+        shared = H5Dataset.open('backend.numpy', to_memory=True, shared_memory=True)
+        self.check_rows(shared)
+        shared.release_memory()
+
+        # append to the existing directory
+        H5Dataset(make_schema(), './backend.numpy', ( make_row(idx) for idx in range(self.size, self.size + 3) ),
+            append_mode=True)
+        self.check_rows(H5Dataset.open('backend.numpy'), self.size + 3)
+
+    def test_convert_numpy(self):
+        from torch.utils.data import DataLoader
+        from h5record.convert import convert
+        H5Dataset(make_schema(), './backend.h5', ( make_row(idx) for idx in range(self.size) ))
+        assert convert('backend.h5', 'backend.numpy', block_rows=5) == self.size
+        dataset = H5Dataset.open('backend.numpy')
+        self.check_rows(dataset)
+
+        labels = []
+        for batch in DataLoader(dataset.select(['label']), batch_size=4, num_workers=2):
+            labels += batch['label'].tolist()
+        assert sorted(labels) == list(range(self.size))
+
+        convert('backend.numpy', 'converted.h5', block_rows=5)
+        self.check_rows(H5Dataset.open('converted.h5'))
+
+if __name__ == "__main__":
+    unittest.main()
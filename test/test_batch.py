@@ -0,0 +1,77 @@
+import unittest
+import os
+import numpy as np
+import torch
+from h5record.dataset import H5Dataset
+
+class TestBatch(unittest.TestCase):
+
+
+    def setUp(self):
+        from h5record.attributes import String, Integer, Image, Sequence, ImageSequence
+        self.schema = (
+            Image(name='image', h=4, w=4),
+            Integer(name='label'),
+            String(name='sentence'),
+            Sequence(name='tokens'),
+            ImageSequence(name='gif', h=4, w=4),
+        )
+        self.data_size = 20
+
+        def pair_iter():
+            for idx in range(self.data_size):
+                yield {
+                    'image': np.full((3, 4, 4), idx, dtype='uint8'),
+                    'label': idx,
+                    'sentence': 'sentence {}'.format(idx),
+                    'tokens': np.arange(idx+1),
+                    'gif': np.full((3, 4, 4, idx % 3 + 1), idx, dtype='uint8').flatten(),
+                }
+        if os.path.exists('batch.h5'):
+            os.remove('batch.h5')
+        self.dataset = H5Dataset(self.schema, './batch.h5', pair_iter(), chunk_size=4)
+
+    def tearDown(self):
+        os.remove('batch.h5')
+
+    def test_list_index(self):
+        from h5record.dataset import contiguous_runs
+        assert contiguous_runs(np.array([1, 2, 3, 7, 8, 10])) == [(1, 4), (7, 9), (10, 11)]
+
+        indices = [7, 3, 3, 12, 8, 19, 0, -1]
+        batch = self.dataset[indices]
+        expected = [ idx % self.data_size for idx in indices ]
+        assert (batch['label'] == np.array(expected)).all()
+        assert batch['image'].shape == (len(indices), 3, 4, 4)
+        for pos, idx in enumerate(expected):
+            assert (batch['image'][pos] == idx).all()
+            assert batch['sentence'][pos] == 'sentence {}'.format(idx)
+            assert (batch['tokens'][pos][0] == np.arange(idx+1)).all()
+            assert batch['gif'][pos].shape == (3, 4, 4, idx % 3 + 1)
+
+        with self.assertRaises(IndexError):
+            self.dataset[[0, self.data_size]]
+
+    def test_slice_index(self):
+        batch = self.dataset[2:10:3]
+        assert (batch['label'] == np.array([2, 5, 8])).all()
+        assert list(batch['sentence']) == [ 'sentence 2', 'sentence 5', 'sentence 8' ]
+        assert len(self.dataset[5:5]['label']) == 0
+
+    def test_getitems(self):
+        indices = [4, 1, 15, 2]
+        rows = self.dataset.__getitems__(indices)
+        for idx, row in zip(indices, rows):
+            single = self.dataset[idx]
+            assert row['label'] == single['label']
+            assert row['sentence'] == single['sentence']
+            assert (row['image'] == single['image']).all()
+            assert (row['tokens'][0] == single['tokens'][0]).all()
+            assert (row['gif'] == single['gif']).all()
+
+        dataloader = torch.utils.data.DataLoader(
+            H5Dataset(self.schema, './batch.h5',
+                transform=lambda row: { 'label': row['label'], 'image': row['image'] }),
+            batch_size=8, shuffle=False)
+        labels = torch.cat([ batch['label'] for batch in dataloader ])
+        assert (labels.numpy() == np.arange(self.data_size)).all()
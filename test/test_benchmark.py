@@ -0,0 +1,41 @@
+import unittest
+import os
+import json
+from h5record.benchmark import run_benchmark, main, MODALITIES, OPERATIONS
+
+class TestBenchmark(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tearDown()
+
+    def tearDown(self):
+        if os.path.exists('benchmark.json'):
+            os.remove('benchmark.json')
+
+    def test_run(self):
+        report = run_benchmark(num_rows=24, compressions=[None, 'lzf'], to_memory=(False, True),
+            batch_size=8, image_size=8)
+        assert report['environment']['h5py']
+        # one write plus every read per modality, compression and chunk size
+        assert len(report['results']) == len(MODALITIES) * 2 * (1 + 2 * len(OPERATIONS))
+        for result in report['results']:
+            assert result['rows'] == 24
+            assert result['rows_per_second'] > 0
+            assert result['file_bytes'] > 0
+        assert { result['operation'] for result in report['results'] } == { 'write' } | set(OPERATIONS)
+        json.dumps(report)
+
+    def test_cli(self):
+        main(['--modalities', 'string', 'sequence', '--rows', '16', '--compression', 'none',
+            '{"compression": "gzip", "shuffle": true}', '--chunk-size', '4', '--workers', '0', '1',
+            '--operations', 'batched', '--output', 'benchmark.json'])
+        with open('benchmark.json', 'r') as f:
+            report = json.load(f)
+        assert report['config']['chunk_sizes'] == [4]
+        reads = [ result for result in report['results'] if result['operation'] == 'batched' ]
+        assert len(reads) == 2 * 2 * 2
+        assert { result['num_workers'] for result in reads } == { 0, 1 }
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import os
+import numpy as np
+from h5record.dataset import H5Dataset
+
+class TestChunkCache(unittest.TestCase):
+
+
+    def setUp(self):
+        from h5record.attributes import String, Integer, Image
+        self.schema = (
+            Image(name='image', h=8, w=8),
+            Integer(name='label'),
+            String(name='sentence'),
+        )
+        self.data_size = 18
+
+        def pair_iter():
+            for idx in range(self.data_size):
+                yield {
+                    'image': np.full((3, 8, 8), idx, dtype='uint8'),
+                    'label': idx,
+                    'sentence': 'sentence {}'.format(idx),
+                }
+        if os.path.exists('cache.h5'):
+            os.remove('cache.h5')
+        H5Dataset(self.schema, './cache.h5', pair_iter(), chunk_size=4, compression='gzip')
+
+    def tearDown(self):
+        os.remove('cache.h5')
+
+    def test_cached_read(self):
+        dataset = H5Dataset(self.schema, './cache.h5', chunk_cache_nbytes=1024*1024)
+        for idx in range(self.data_size):
+            row = dataset[idx]
+            assert row['label'] == idx
+            assert (row['image'] == idx).all()
+            assert row['sentence'] == 'sentence {}'.format(idx)
+
+        stats = dataset.cache_stats()
+        num_chunks = 5
+        assert stats['misses'] == num_chunks * len(self.schema)
+        assert stats['hits'] == self.data_size * len(self.schema) - stats['misses']
+
+        batch = dataset[[17, 2, 3, 9]]
+        assert (batch['label'] == np.array([17, 2, 3, 9])).all()
+        assert list(batch['sentence']) == [ 'sentence {}'.format(idx) for idx in [17, 2, 3, 9] ]
+        assert dataset.cache_stats()['misses'] == num_chunks * len(self.schema)
+
+        # returned rows must not share memory with the cache
+        dataset[0]['image'][:] = 255
+        assert (dataset[0]['image'] == 0).all()
+
+    def test_eviction(self):
+        # budget of a single image chunk
+        dataset = H5Dataset(self.schema, './cache.h5', chunk_cache_nbytes=4*3*8*8)
+        for idx in range(self.data_size):
+            assert dataset[idx]['label'] == idx
+        stats = dataset.cache_stats()
+        assert stats['evictions'] > 0
+        assert stats['nbytes'] <= stats['capacity']
+
+    def test_rdcc(self):
+        dataset = H5Dataset(self.schema, './cache.h5', rdcc_nbytes=4*1024*1024, rdcc_nslots=10007)
+        _, nslots, nbytes, _ = dataset.reader.id.get_access_plist().get_cache()
+        assert nslots == 10007
+        assert nbytes == 4*1024*1024
+        assert dataset.cache_stats() is None
@@ -0,0 +1,64 @@
+import unittest
+import os
+import h5py as h5
+import numpy as np
+from h5record.dataset import H5Dataset
+
+class TestChunk(unittest.TestCase):
+
+
+    def test_auto_chunk_size(self):
+        from h5record.attributes import auto_chunk_size
+        assert auto_chunk_size(8) == 1024 * 1024 // 8
+        assert auto_chunk_size(3 * 224 * 224) == 6
+        # row larger than the chunk budget
+        assert auto_chunk_size(4 * 1024 * 1024) == 1
+        assert auto_chunk_size(8, data_length=100) == 100
+        assert auto_chunk_size(100, max_nbytes=1000) == 10
+
+    def test_chunk_layout(self):
+        from h5record.attributes import String, Integer, Image, Sequence, ImageSequence
+        schema = (
+            Image(name='image', h=32, w=32),
+            Integer(name='label', chunk_size=2),
+            String(name='sentence'),
+            Sequence(name='tokens'),
+            ImageSequence(name='gif', h=4, w=4, chunk_size=3),
+        )
+        data_size = 10
+
+        def pair_iter():
+            for idx in range(data_size):
+                yield {
+                    'image': np.zeros((3, 32, 32), dtype='uint8'),
+                    'label': idx,
+                    'sentence': str(idx),
+                    'tokens': np.arange(idx+1),
+                    'gif': np.zeros((3, 4, 4, 2), dtype='uint8').flatten(),
+                }
+        if os.path.exists('chunk.h5'):
+            os.remove('chunk.h5')
+
+        dataset = H5Dataset(schema, './chunk.h5', pair_iter(), chunk_size=4)
+        with h5.File('chunk.h5', 'r') as f:
+            assert f['image'].chunks == (4, 3, 32, 32)
+            assert f['label'].chunks == (2, )
+            assert f['sentence'].chunks == (4, 1)
+            assert f['tokens'].chunks == (4, 1)
+            assert f['gif'].chunks == (3, 1)
+        for idx in range(data_size):
+            assert dataset[idx]['label'] == idx
+        os.remove('chunk.h5')
+
+        dataset = H5Dataset(schema, './chunk.h5', pair_iter())
+        with h5.File('chunk.h5', 'r') as f:
+            assert f['image'].chunks == (1024 * 1024 // (3 * 32 * 32), 3, 32, 32)
+            assert f['sentence'].chunks == (1024 * 1024 // 16, 1)
+        os.remove('chunk.h5')
+
+        # chunk can not be larger than the fixed maximum size
+        dataset = H5Dataset(schema, './chunk.h5', pair_iter(), data_length=data_size)
+        with h5.File('chunk.h5', 'r') as f:
+            assert f['image'].chunks == (data_size, 3, 32, 32)
+        assert len(dataset) == data_size
+        os.remove('chunk.h5')
@@ -0,0 +1,72 @@
+import unittest
+import os
+import numpy as np
+from h5record.dataset import H5Dataset, read_columns
+from h5record.attributes import Image, Integer, String
+
+class TestColumns(unittest.TestCase):
+
+
+    def setUp(self):
+        self.schema = ( Image(name='image', h=8, w=8), Integer(name='label'), String(name='text', storage='flat') )
+        if os.path.exists('columns.h5'):
+            os.remove('columns.h5')
+        rows = ( { 'image': np.full((3, 8, 8), idx, dtype=np.uint8), 'label': idx, 'text': 'row {}'.format(idx) }
+            for idx in range(20) )
+        H5Dataset(self.schema, './columns.h5', rows, chunk_size=4)
+
+    def tearDown(self):
+        if os.path.exists('columns.h5'):
+            os.remove('columns.h5')
+
+    def test_projection(self):
+        dataset = H5Dataset(self.schema, './columns.h5', columns=['label', 'text'], to_memory=True)
+        assert len(dataset) == 20
+        assert set(dataset[3].keys()) == {'label', 'text'}
+        assert dataset[3]['text'] == 'row 3'
+        assert list(dataset[[5, 1]]['label']) == [5, 1]
+        assert dataset.memory_report()['on_disk'] == []
+        assert set(dataset.memory.keys()) == {'label', 'text'}
+
+        # schema only needs the requested columns
+        dataset = H5Dataset(( Integer(name='label'), ), './columns.h5')
+        assert [ dataset[idx]['label'] for idx in range(20) ] == list(range(20))
+        assert set(dataset.columns.keys()) == {'label'}
+
+        with self.assertRaises(KeyError):
+            H5Dataset(self.schema, './columns.h5', columns=['label', 'missing'])
+
+    def test_select(self):
+        dataset = H5Dataset(self.schema, './columns.h5', to_memory=['label'])
+        view = dataset.select(['label'])
+        assert set(view[7].keys()) == {'label'}
+        assert list(view[2:5]['label']) == [2, 3, 4]
+        assert list(view.memory.keys()) == ['label']
+        assert set(view.columns.keys()) == set()
+        # the original dataset still reads every column
+        assert set(dataset[7].keys()) == {'image', 'label', 'text'}
+        with self.assertRaises(KeyError):
+            view.select(['image'])
+
+    def test_select_shared(self):
+        dataset = H5Dataset(self.schema, './columns.h5', to_memory=['label', 'text'], shared_memory=True)
+        view = dataset.select(['label', 'image'])
+        report = view.memory_report()
+        assert list(report['columns'].keys()) == ['label'] and report['on_disk'] == ['image']
+        assert view[6]['label'] == 6
+        # the view releases its own mapping, the dataset keeps its columns
+        view.release_memory()
+        assert dataset[6]['text'] == 'row 6' and list(dataset[[6]]['label']) == [6]
+        assert set(dataset.memory_report()['columns'].keys()) == {'label', 'text'}
+        dataset.release_memory()
+
+    def test_read_columns(self):
+        columns = read_columns('columns.h5')
+        assert columns['image']['storage'] == 'dataset'
+        assert columns['image']['shape'] == (20, 3, 8, 8)
+        assert columns['text']['storage'] == 'flat'
+        assert columns['text']['rows'] == 20
+        assert columns['text']['kind'] == 'bytes'
+
+if __name__ == "__main__":
+    unittest.main()
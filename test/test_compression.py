@@ -0,0 +1,126 @@
+import unittest
+import os
+import h5py as h5
+import numpy as np
+from h5record.dataset import H5Dataset, read_columns
+from h5record.attributes import Integer, Float, String, FloatSequence
+
+class TestCompression(unittest.TestCase):
+
+
+    def setUp(self):
+        self.data_size = 300
+        self.tearDown()
+
+    def tearDown(self):
+        if os.path.exists('compression.h5'):
+            os.remove('compression.h5')
+
+    def pair_iter(self):
+        for idx in range(self.data_size):
+            yield {
+                'label': idx % 7,
+                'score': idx / 8,
+                'text': 'sentence {}'.format(idx % 5),
+                'weights': np.ones(idx % 4 + 1, dtype=np.float32) * idx,
+            }
+
+    def make_schema(self):
+        return (
+            Integer(name='label', compression={ 'compression': 'gzip', 'compression_opts': 9, 'scaleoffset': 0 }),
+            Float(name='score', compression=False),
+            String(name='text', storage='flat', compression='lzf'),
+            FloatSequence(name='weights', storage='flat'),
+        )
+
+    def test_per_column(self):
+        dataset = H5Dataset(self.make_schema(), './compression.h5', self.pair_iter(),
+            compression={ 'compression': 'gzip', 'compression_opts': 1, 'shuffle': True })
+        with h5.File('compression.h5', 'r') as fin:
+            assert fin['label'].compression_opts == 9 and fin['label'].scaleoffset == 0
+            assert fin['score'].compression is None
+            assert fin['text/values'].compression == 'lzf'
+            assert fin['weights/values'].compression_opts == 1 and fin['weights/values'].shuffle
+
+        columns = read_columns('compression.h5')
+        assert columns['score']['compression'] is None
+        assert columns['weights']['compression'] == { 'compression': 'gzip', 'compression_opts': 1, 'shuffle': True }
+        # the setting is stored with the schema
+        assert H5Dataset.open('compression.h5').schema['text'].compression == 'lzf'
+
+        for idx in [0, 17, 299]:
+            row = dataset[idx]
+            assert row['label'] == idx % 7
+            assert row['text'] == 'sentence {}'.format(idx % 5)
+            assert (row['weights'][0] == idx).all()
+
+    def test_dataset_scaleoffset(self):
+        # dataset level scaleoffset must not round float columns
+        rng = np.random.default_rng(0)
+        scores = rng.random(self.data_size).astype(np.float32)
+        schema = ( Integer(name='label'), Float(name='score') )
+        dataset = H5Dataset(schema, './compression.h5',
+            ( { 'label': idx, 'score': scores[idx] } for idx in range(self.data_size) ),
+            compression={ 'compression': 'gzip', 'compression_opts': 4, 'shuffle': True, 'scaleoffset': 0 })
+        with h5.File('compression.h5', 'r') as fin:
+            assert fin['label'].scaleoffset == 0
+            assert fin['score'].scaleoffset is None
+        batch = dataset[list(range(self.data_size))]
+        assert (batch['score'] == scores).all()
+        assert list(batch['label']) == list(range(self.data_size))
+
+    def test_fletcher32(self):
+        # vlen columns can not be checksummed, the setting is dropped for them only
+        schema = ( Integer(name='label'), Float(name='score'), String(name='text'),
+            FloatSequence(name='weights'), String(name='flat_text', storage='flat') )
+        rows = ( dict(row, flat_text=row['text']) for row in self.pair_iter() )
+        dataset = H5Dataset(schema, './compression.h5', rows,
+            compression={ 'compression': 'gzip', 'fletcher32': True })
+        with h5.File('compression.h5', 'r') as fin:
+            assert fin['label'].fletcher32 and fin['flat_text/values'].fletcher32
+            assert not fin['text'].fletcher32 and not fin['weights'].fletcher32
+        row = dataset[17]
+        assert row['text'] == row['flat_text'] == 'sentence 2'
+        assert (row['weights'][0] == 17).all()
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            H5Dataset(self.make_schema(), './compression.h5', self.pair_iter(), compression='snappy')
+        with self.assertRaises(ValueError):
+            H5Dataset(self.make_schema(), './compression.h5', self.pair_iter(), compression={ 'level': 4 })
+
+    def test_advise(self):
+        from h5record.compression import advise_compression, available_filters
+        assert 'gzip' in available_filters()
+        dataset = H5Dataset(self.make_schema(), './compression.h5', self.pair_iter())
+        advice = advise_compression(dataset, target_ratio=0.5, repeats=1)
+        assert set(advice) == { 'label', 'score', 'text', 'weights' }
+        # labels in [0, 7) compress well below the target
+        assert advice['label']['ratio'] <= 0.5
+        assert advice['label']['compression'] is not None
+        for column in advice.values():
+            assert len(column['candidates']) > 0
+
+        # no setting reaches 1% of the raw size, the smallest one is picked
+        advice = advise_compression(dataset, columns=['score'], target_ratio=0.01,
+            candidates=[ None, 'gzip' ], repeats=1)
+        assert advice['score']['ratio'] == min( c['ratio'] for c in advice['score']['candidates'] )
+
+    def test_apply_advice(self):
+        from h5record.compression import advise_compression
+        dataset = H5Dataset(self.make_schema(), './compression.h5', self.pair_iter())
+        advice = advise_compression(dataset, columns=['label'], candidates=[ None ], repeats=1)
+        assert advice['label']['compression'] is False
+        dataset.close()
+        os.remove('compression.h5')
+
+        # uncompressed advice holds under a dataset compression
+        schema = self.make_schema()
+        schema[0].compression = advice['label']['compression']
+        H5Dataset(schema, './compression.h5', self.pair_iter(), compression='gzip')
+        with h5.File('compression.h5', 'r') as fin:
+            assert fin['label'].compression is None and fin['label'].scaleoffset is None
+            assert fin['weights/values'].compression == 'gzip'
+
+if __name__ == "__main__":
+    unittest.main()
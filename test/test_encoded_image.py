@@ -0,0 +1,75 @@
+import unittest
+import os
+import pickle
+import h5py as h5
+import numpy as np
+from h5record.dataset import H5Dataset
+
+class TestEncodedImage(unittest.TestCase):
+
+
+    def setUp(self):
+        self.image_paths = [
+            'test/images/1.jpeg',
+            'test/images/2.jpeg',
+            'test/images/3.jpeg',
+            'test/images/4.jpeg',
+            'test/images/5.jpeg',
+        ]
+        if os.path.exists('encoded.h5'):
+            os.remove('encoded.h5')
+
+    def tearDown(self):
+        if os.path.exists('encoded.h5'):
+            os.remove('encoded.h5')
+
+    def build(self, attribute):
+        from h5record.attributes import Integer
+        images = [ attribute.read_image(path) for path in self.image_paths ]
+        def pair_iter():
+            for idx, image in enumerate(images):
+                yield { 'image': image, 'label': idx }
+        dataset = H5Dataset([ attribute, Integer(name='label') ], './encoded.h5', pair_iter(), buffer_size=2)
+        return dataset, images
+
+    def test_lossless(self):
+        from h5record.attributes import EncodedImage
+        dataset, images = self.build(EncodedImage(name='image', h=32, w=48, codec='png'))
+        for idx, image in enumerate(images):
+            row = dataset[idx]
+            assert row['image'].shape == (3, 32, 48)
+            assert row['image'].dtype == np.uint8
+            assert (row['image'] == image).all()
+
+        batch = dataset[[4, 0, 2]]
+        assert batch['image'].shape == (3, 3, 32, 48)
+        for pos, idx in enumerate([4, 0, 2]):
+            assert (batch['image'][pos] == images[idx]).all()
+
+        with h5.File('encoded.h5', 'r') as f:
+            assert f['image/values'].dtype == np.uint8
+            assert f['image/offsets'].shape == (len(images) + 1, )
+
+    def test_lossy(self):
+        from h5record.attributes import EncodedImage
+        for codec in ['jpeg', 'webp']:
+            attribute = EncodedImage(name='image', h=64, w=64, codec=codec, quality=95)
+            dataset, images = self.build(attribute)
+            for kwargs in [ {}, { 'to_memory': True } ]:
+                dataset = H5Dataset([ attribute ], './encoded.h5', **kwargs)
+                batch = dataset[0:len(images)]
+                for idx, image in enumerate(images):
+                    error = np.abs(batch['image'][idx].astype(np.float32) - image).mean()
+                    assert error < 8
+            os.remove('encoded.h5')
+
+        # encoded bytes can be stored directly
+        attribute = EncodedImage(name='image', h=32, w=32)
+        with open(self.image_paths[0], 'rb') as f:
+            raw = f.read()
+        dataset = H5Dataset([ attribute ], './encoded.h5', iter([ { 'image': raw } ]))
+        assert dataset[0]['image'].shape == (3, 32, 32)
+
+        # thread pool is not pickled
+        clone = pickle.loads(pickle.dumps(attribute))
+        assert clone._pool is None
@@ -0,0 +1,75 @@
+import unittest
+import os
+import h5py as h5
+import numpy as np
+from h5record.dataset import H5Dataset
+
+class TestFlatSequence(unittest.TestCase):
+
+
+    def setUp(self):
+        self.data = [ np.arange(idx % 7) * (idx + 1) for idx in range(30) ]
+        if os.path.exists('flat.h5'):
+            os.remove('flat.h5')
+
+    def tearDown(self):
+        if os.path.exists('flat.h5'):
+            os.remove('flat.h5')
+
+    def pair_iter(self):
+        for idx, seq in enumerate(self.data):
+            yield { 'seq': seq, 'label': idx }
+
+    def check_rows(self, dataset, dtype=np.int32):
+        assert len(dataset) == len(self.data)
+        for idx, seq in enumerate(self.data):
+            row = dataset[idx]
+            assert row['label'] == idx
+            assert row['seq'][0].dtype == dtype
+            assert (row['seq'][0] == seq).all()
+        indices = [ 29, 0, 6, 7, 8, 6 ]
+        batch = dataset[indices]
+        for pos, idx in enumerate(indices):
+            assert (batch['seq'][pos][0] == self.data[idx]).all()
+
+    def test_flat_layout(self):
+        from h5record.attributes import Sequence, Integer
+        schema = ( Sequence(name='seq', storage='flat'), Integer(name='label') )
+        dataset = H5Dataset(schema, './flat.h5', self.pair_iter(), buffer_size=4,
+            chunk_size=8, compression='gzip')
+        self.check_rows(dataset)
+
+        with h5.File('flat.h5', 'r') as f:
+            assert isinstance(f['seq'], h5.Group)
+            assert f['seq/offsets'].dtype == np.int64
+            assert f['seq/offsets'].shape == (len(self.data) + 1, )
+            assert f['seq/values'].shape == (sum( len(seq) for seq in self.data ), )
+            assert f['seq/offsets'].chunks == (8, )
+            assert f['seq/values'].compression == 'gzip'
+
+        for kwargs in [ { 'to_memory': True }, { 'to_memory': True, 'shared_memory': True },
+            { 'chunk_cache_nbytes': 1024 * 1024 } ]:
+            dataset = H5Dataset(schema, './flat.h5', **kwargs)
+            self.check_rows(dataset)
+            dataset.release_memory()
+        os.remove('flat.h5')
+
+        dataset = H5Dataset(schema, './flat.h5', self.pair_iter(), data_length=len(self.data))
+        self.check_rows(dataset)
+        dataset = H5Dataset(schema, './flat.h5', mmap=True)
+        self.check_rows(dataset)
+
+    def test_float_sequence(self):
+        from h5record.attributes import FloatSequence, Float16Sequence, Integer
+        for attribute, dtype in [ (FloatSequence, np.float32), (Float16Sequence, np.float16) ]:
+            schema = ( attribute(name='seq', storage='flat'), Integer(name='label') )
+            dataset = H5Dataset(schema, './flat.h5', self.pair_iter())
+            self.check_rows(dataset, dtype=dtype)
+            os.remove('flat.h5')
+
+    def test_read_vlen_file(self):
+        from h5record.attributes import Sequence, Integer
+        H5Dataset(( Sequence(name='seq'), Integer(name='label') ), './flat.h5', self.pair_iter())
+        # schema with flat storage still reads files written as vlen
+        dataset = H5Dataset(( Sequence(name='seq', storage='flat'), Integer(name='label') ), './flat.h5')
+        self.check_rows(dataset)
@@ -0,0 +1,63 @@
+import unittest
+import os
+import h5py as h5
+import numpy as np
+from h5record.dataset import H5Dataset
+
+class TestFlatString(unittest.TestCase):
+
+
+    def setUp(self):
+        self.data = [
+            ['HDF5 supports chunking and compression.', 'You may want to experiment'],
+            ['小明去學校', '結果已經下課了'],
+            ['', 'empty sentence on the left'],
+        ] * 5
+        if os.path.exists('flat_string.h5'):
+            os.remove('flat_string.h5')
+
+    def tearDown(self):
+        if os.path.exists('flat_string.h5'):
+            os.remove('flat_string.h5')
+
+    def pair_iter(self):
+        for sent1, sent2 in self.data:
+            yield { 'sentence1': sent1, 'sentence2': sent2 }
+
+    def check_rows(self, dataset):
+        assert len(dataset) == len(self.data)
+        for idx, (sent1, sent2) in enumerate(self.data):
+            row = dataset[idx]
+            assert row['sentence1'] == sent1
+            assert row['sentence2'] == sent2
+        indices = [ 14, 0, 1, 2, 3, 9 ]
+        batch = dataset[indices]
+        assert list(batch['sentence1']) == [ self.data[idx][0] for idx in indices ]
+        assert list(batch['sentence2']) == [ self.data[idx][1] for idx in indices ]
+
+    def test_flat_string(self):
+        from h5record.attributes import String
+        schema = ( String(name='sentence1', storage='flat'), String(name='sentence2', storage='flat') )
+        dataset = H5Dataset(schema, './flat_string.h5', self.pair_iter(), buffer_size=4,
+            chunk_size=4, compression='gzip')
+        self.check_rows(dataset)
+
+        with h5.File('flat_string.h5', 'r') as f:
+            assert f['sentence1/values'].dtype == np.uint8
+            assert f['sentence1/offsets'].dtype == np.uint64
+            assert f['sentence1/values'].shape == (sum( len(row[0].encode('utf-8')) for row in self.data ), )
+
+        for kwargs in [ { 'to_memory': True }, { 'to_memory': True, 'shared_memory': True },
+            { 'chunk_cache_nbytes': 1024 * 1024 }, { 'mmap': True } ]:
+            dataset = H5Dataset(schema, './flat_string.h5', **kwargs)
+            self.check_rows(dataset)
+            dataset.release_memory()
+
+    def test_mixed_storage(self):
+        from h5record.attributes import String
+        schema = ( String(name='sentence1', storage='flat'), String(name='sentence2') )
+        dataset = H5Dataset(schema, './flat_string.h5', self.pair_iter(), data_length=len(self.data))
+        self.check_rows(dataset)
+        rows = dataset.__getitems__([1, 2])
+        assert rows[0]['sentence1'] == self.data[1][0]
+        assert rows[1]['sentence2'] == self.data[2][1]
@@ -0,0 +1,70 @@
+import unittest
+import os
+import h5py as h5
+import numpy as np
+from h5record.dataset import H5Dataset
+
+class TestMemmap(unittest.TestCase):
+
+
+    def setUp(self):
+        from h5record.attributes import String, Integer, Image
+        self.schema = (
+            Image(name='image', h=8, w=8),
+            Integer(name='label'),
+            String(name='sentence'),
+        )
+        self.data_size = 19
+
+    def pair_iter(self):
+        for idx in range(self.data_size):
+            yield {
+                'image': np.full((3, 8, 8), idx, dtype='uint8'),
+                'label': idx,
+                'sentence': 'sentence {}'.format(idx),
+            }
+
+    def test_chunked_memmap(self):
+        from h5record.memmap import ChunkedMemmap
+        if os.path.exists('memmap.h5'):
+            os.remove('memmap.h5')
+        H5Dataset(self.schema, './memmap.h5', self.pair_iter(), chunk_size=4)
+
+        dataset = H5Dataset(self.schema, './memmap.h5', mmap=True)
+        for idx in range(self.data_size):
+            row = dataset[idx]
+            assert row['label'] == idx
+            assert (row['image'] == idx).all()
+            assert row['sentence'] == 'sentence {}'.format(idx)
+        assert isinstance(dataset.column('image'), ChunkedMemmap)
+        assert isinstance(dataset.column('label'), ChunkedMemmap)
+        assert not isinstance(dataset.column('sentence'), ChunkedMemmap)
+
+        # zero copy, rows are read only views of the file
+        assert not dataset[0]['image'].flags.writeable
+
+        batch = dataset[[18, 1, 2, 3, 4, 5]]
+        assert (batch['label'] == np.array([18, 1, 2, 3, 4, 5])).all()
+        assert (batch['image'][:, 0, 0, 0] == batch['label']).all()
+        dataset.close()
+        os.remove('memmap.h5')
+
+        # compressed column falls back to h5py
+        H5Dataset(self.schema, './memmap.h5', self.pair_iter(), chunk_size=4, compression='gzip')
+        dataset = H5Dataset(self.schema, './memmap.h5', mmap=True)
+        assert isinstance(dataset.column('image'), h5.Dataset)
+        assert (dataset[7]['image'] == 7).all()
+        dataset.close()
+        os.remove('memmap.h5')
+
+    def test_contiguous_memmap(self):
+        from h5record.attributes import Integer
+        if os.path.exists('memmap.h5'):
+            os.remove('memmap.h5')
+        with h5.File('memmap.h5', 'w', libver='latest') as f:
+            f.create_dataset('label', data=np.arange(self.data_size, dtype='int64'))
+        dataset = H5Dataset([ Integer(name='label') ], './memmap.h5', mmap=True)
+        assert isinstance(dataset.column('label'), np.memmap)
+        assert (dataset[3:9]['label'] == np.arange(3, 9)).all()
+        dataset.close()
+        os.remove('memmap.h5')
@@ -0,0 +1,77 @@
+import unittest
+import os
+import h5py as h5
+import numpy as np
+from h5record.dataset import H5Dataset
+
+class TestPartialMemory(unittest.TestCase):
+
+
+    def setUp(self):
+        from h5record.attributes import String, Integer, Image
+        self.schema = (
+            Image(name='image', h=32, w=32),
+            Integer(name='label'),
+            String(name='sentence'),
+        )
+        self.data_size = 20
+
+        def pair_iter():
+            for idx in range(self.data_size):
+                yield {
+                    'image': np.full((3, 32, 32), idx, dtype='uint8'),
+                    'label': idx,
+                    'sentence': 'sentence {}'.format(idx),
+                }
+        if os.path.exists('partial.h5'):
+            os.remove('partial.h5')
+        H5Dataset(self.schema, './partial.h5', pair_iter(), chunk_size=4)
+
+    def tearDown(self):
+        os.remove('partial.h5')
+
+    def check_rows(self, dataset):
+        for idx in range(self.data_size):
+            row = dataset[idx]
+            assert row['label'] == idx
+            assert (row['image'] == idx).all()
+            assert row['sentence'] == 'sentence {}'.format(idx)
+        batch = dataset[[3, 1, 19]]
+        assert (batch['label'] == np.array([3, 1, 19])).all()
+        assert list(batch['sentence']) == [ 'sentence 3', 'sentence 1', 'sentence 19' ]
+
+    def test_column_list(self):
+        dataset = H5Dataset(self.schema, './partial.h5', to_memory=['label', 'sentence'])
+        self.check_rows(dataset)
+        report = dataset.memory_report()
+        assert sorted(report['columns']) == ['label', 'sentence']
+        assert report['columns']['label'] == self.data_size * 8
+        assert report['on_disk'] == ['image']
+        assert isinstance(dataset.column('image'), h5.Dataset)
+        assert isinstance(dataset.column('label'), np.ndarray)
+
+        with self.assertRaises(KeyError):
+            H5Dataset(self.schema, './partial.h5', to_memory=['missing'])
+
+        dataset = H5Dataset(self.schema, './partial.h5', to_memory=['label', 'sentence'],
+            shared_memory=True)
+        self.check_rows(dataset)
+        assert dataset.memory_report()['on_disk'] == ['image']
+        dataset.release_memory()
+
+    def test_byte_budget(self):
+        # large enough for label and sentence, image takes 20 x 3072 bytes
+        dataset = H5Dataset(self.schema, './partial.h5', to_memory=4096)
+        self.check_rows(dataset)
+        report = dataset.memory_report()
+        assert sorted(report['columns']) == ['label', 'sentence']
+        assert report['budget'] == 4096
+        assert report['on_disk'] == ['image']
+
+        dataset = H5Dataset(self.schema, './partial.h5', to_memory=0)
+        assert dataset.memory_report()['nbytes'] == 0
+        self.check_rows(dataset)
+
+        dataset = H5Dataset(self.schema, './partial.h5', to_memory=True)
+        assert dataset.memory_report()['on_disk'] == []
+        self.check_rows(dataset)
@@ -0,0 +1,52 @@
+import unittest
+import os
+from h5record.dataset import H5Dataset
+from h5record.attributes import Image, Integer, String
+
+img_attr = Image(name='image', h=16, w=16)
+
+def read_item(item):
+    idx, path = item
+    if idx == 3:
+        # skipped item
+        return None
+    return {
+        'image': img_attr.read_image(path),
+        'label': idx,
+        'path': path,
+    }
+
+class TestPipeline(unittest.TestCase):
+
+
+    def setUp(self):
+        self.items = [ (idx, 'test/images/{}.jpeg'.format(idx % 5 + 1)) for idx in range(23) ]
+        self.schema = ( img_attr, Integer(name='label'), String(name='path') )
+        if os.path.exists('pipeline.h5'):
+            os.remove('pipeline.h5')
+
+    def tearDown(self):
+        if os.path.exists('pipeline.h5'):
+            os.remove('pipeline.h5')
+
+    def test_ordered(self):
+        from h5record.pipeline import build_dataset
+        progress = build_dataset(self.schema, 'pipeline.h5', iter(self.items), read_item,
+            num_workers=2, max_in_flight=2, items_per_task=3, buffer_size=4, verbose=0)
+        assert progress.rows == len(self.items) - 1
+
+        dataset = H5Dataset(self.schema, './pipeline.h5')
+        labels = [ idx for idx, _ in self.items if idx != 3 ]
+        assert len(dataset) == len(labels)
+        for row_idx, idx in enumerate(labels):
+            row = dataset[row_idx]
+            assert row['label'] == idx
+            assert row['path'] == self.items[idx][1]
+            assert (row['image'] == img_attr.read_image(self.items[idx][1])).all()
+
+    def test_unordered(self):
+        from h5record.pipeline import build_dataset
+        build_dataset(self.schema, 'pipeline.h5', self.items, read_item,
+            num_workers=2, items_per_task=2, ordered=False, verbose=0)
+        dataset = H5Dataset(self.schema, './pipeline.h5')
+        assert sorted(dataset[:]['label'].tolist()) == [ idx for idx, _ in self.items if idx != 3 ]
@@ -0,0 +1,56 @@
+import unittest
+import os
+from torch.utils.data import DataLoader, BatchSampler, SequentialSampler
+from torch.utils.data._utils.collate import default_collate
+from h5record.dataset import H5Dataset
+from h5record.attributes import Integer, String, Float
+
+def add_one(row):
+    row['label'] = row['label'] + 1
+    return row
+
+class TestPrefetch(unittest.TestCase):
+
+
+    def setUp(self):
+        self.schema = ( Integer(name='label'), String(name='text'), Float(name='score') )
+        self.size = 57
+        if os.path.exists('prefetch.h5'):
+            os.remove('prefetch.h5')
+        rows = ( { 'label': idx, 'text': 'row {}'.format(idx), 'score': idx / 2 } for idx in range(self.size) )
+        H5Dataset(self.schema, './prefetch.h5', rows, chunk_size=8)
+
+    def tearDown(self):
+        if os.path.exists('prefetch.h5'):
+            os.remove('prefetch.h5')
+
+    def test_order(self):
+        from h5record.prefetch import H5PrefetchDataset
+        from h5record.sampler import H5ChunkShuffleSampler
+        dataset = H5Dataset(self.schema, './prefetch.h5', chunk_cache_nbytes=1024 * 1024)
+        batches = BatchSampler(H5ChunkShuffleSampler(dataset, window=2), batch_size=5, drop_last=False)
+        for thread_handles in [ True, False ]:
+            prefetch = H5PrefetchDataset(dataset, batches, depth=3, num_threads=2, thread_handles=thread_handles)
+            output = list(prefetch)
+            assert len(output) == len(prefetch)
+            # same batches in the same order as reading them directly
+            for indices, rows in zip(batches, output):
+                assert [ int(row['label']) for row in rows ] == indices
+                assert [ row['text'] for row in rows ] == [ 'row {}'.format(idx) for idx in indices ]
+
+    def test_dataloader(self):
+        from h5record.prefetch import H5PrefetchDataset
+        dataset = H5Dataset(self.schema, './prefetch.h5', transform=add_one)
+        batches = BatchSampler(SequentialSampler(range(self.size)), batch_size=4, drop_last=False)
+        prefetch = H5PrefetchDataset(dataset, batches, depth=2, collate_fn=default_collate)
+        loader = DataLoader(prefetch, batch_size=None, num_workers=2)
+        labels = sorted( label for batch in loader for label in batch['label'].tolist() )
+        assert labels == list(range(1, self.size + 1))
+
+        # stopping early does not wait for the remaining batches
+        for batch in prefetch:
+            break
+        assert batch['label'].tolist() == [1, 2, 3, 4]
+
+if __name__ == "__main__":
+    unittest.main()
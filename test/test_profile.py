@@ -0,0 +1,83 @@
+import unittest
+import os
+import io
+import numpy as np
+from torch.utils.data import DataLoader
+from h5record.dataset import H5Dataset
+from h5record.attributes import Image, Integer, String
+from h5record.profile import format_profile, ProfileReporter
+
+def collate_rows(rows):
+    return rows
+
+class TestProfile(unittest.TestCase):
+
+
+    def setUp(self):
+        self.schema = (
+            Image(name='image', h=8, w=8),
+            Integer(name='label'),
+            String(name='text', storage='flat'),
+        )
+        self.data_size = 40
+        self.tearDown()
+        H5Dataset(self.schema, './profile.h5', self.pair_iter(), chunk_size=8)
+
+    def tearDown(self):
+        if os.path.exists('profile.h5'):
+            os.remove('profile.h5')
+
+    def pair_iter(self):
+        for idx in range(self.data_size):
+            yield {
+                'image': np.full((3, 8, 8), idx, dtype='uint8'),
+                'label': idx,
+                'text': 'row {}'.format(idx),
+            }
+
+    def test_disabled(self):
+        dataset = H5Dataset.open('profile.h5')
+        assert dataset.profile is None and dataset.profile_stats() is None
+        assert dataset[3]['label'] == 3
+
+    def test_single_process(self):
+        dataset = H5Dataset.open('profile.h5', profile=True, chunk_cache_nbytes=1 << 20,
+            transform=lambda row: dict(row, label=row['label'] * 2))
+        for idx in range(10):
+            row = dataset[idx]
+            assert row['label'] == idx * 2
+            assert row['text'] == 'row {}'.format(idx)
+        rows = dataset.__getitems__([12, 11, 30])
+        assert [ row['label'] for row in rows ] == [24, 22, 60]
+
+        stats = dataset.profile_stats()
+        image = stats['columns']['image']
+        assert image['calls'] == 11 and image['rows'] == 13
+        assert image['bytes'] >= 13 * 3 * 8 * 8
+        assert image['read_seconds'] <= image['seconds']
+        assert sum(image['histogram'].values()) == 11
+        assert stats['columns']['text']['bytes'] > 0
+        assert stats['transform']['calls'] == 13
+        assert stats['cache']['hits'] > 0 and stats['cache']['misses'] > 0
+        assert format_profile(stats).startswith('rows=13 image')
+
+        dataset.reset_profile()
+        assert dataset.profile_stats()['rows'] == 0
+
+    def test_workers(self):
+        dataset = H5Dataset.open('profile.h5', profile=4)
+        loader = DataLoader(dataset, batch_size=5, num_workers=2, collate_fn=collate_rows)
+        stream = io.StringIO()
+        with ProfileReporter(dataset, interval=0.01, stream=stream):
+            labels = [ row['label'] for batch in loader for row in batch ]
+        assert sorted(labels) == list(range(self.data_size))
+
+        stats = dataset.profile_stats(per_worker=True)
+        assert stats['rows'] == self.data_size
+        assert stats['columns']['label']['calls'] == self.data_size // 5
+        assert set(stats['workers']) == { 'worker_0', 'worker_1' }
+        assert stats['workers']['worker_0']['rows'] == self.data_size // 2
+        assert all( line.startswith('rows=') for line in stream.getvalue().splitlines() )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import os
+import numpy as np
+import torch
+from h5record.dataset import H5Dataset
+
+class TestSampler(unittest.TestCase):
+
+
+    def setUp(self):
+        from h5record.attributes import Integer
+        self.schema = ( Integer(name='label'), )
+        self.data_size = 103
+
+        def pair_iter():
+            for idx in range(self.data_size):
+                yield { 'label': idx }
+        if os.path.exists('sampler.h5'):
+            os.remove('sampler.h5')
+        self.dataset = H5Dataset(self.schema, './sampler.h5', pair_iter(), chunk_size=10)
+
+    def tearDown(self):
+        os.remove('sampler.h5')
+
+    def test_chunk_locality(self):
+        from h5record.sampler import H5ChunkShuffleSampler
+        sampler = H5ChunkShuffleSampler(self.dataset, window=2)
+        assert sampler.chunk_size == 10
+        indices = list(sampler)
+        assert sorted(indices) == list(range(self.data_size))
+
+        # rows of a chunk are consumed within a window of 2 chunks
+        positions = np.argsort(indices)
+        for start in range(0, self.data_size, 10):
+            chunk_positions = positions[start:start+10]
+            assert chunk_positions.max() - chunk_positions.min() < 20
+
+        # same epoch gives same order, new epoch reshuffle
+        assert indices == list(sampler)
+        sampler.set_epoch(1)
+        assert indices != list(sampler)
+
+    def test_mixed_chunks(self):
+        from h5record.attributes import Image, Integer, String
+        from h5record.sampler import H5ChunkShuffleSampler, chunk_rows
+        schema = (
+            Image(name='image', h=8, w=8, chunk_size=4),
+            Integer(name='label', chunk_size=64),
+            String(name='text', storage='flat', chunk_size=16),
+        )
+        def pair_iter():
+            for idx in range(self.data_size):
+                yield { 'image': np.full((3, 8, 8), idx, dtype='uint8'), 'label': idx, 'text': 'row' }
+        if os.path.exists('sampler_mixed.h5'):
+            os.remove('sampler_mixed.h5')
+        dataset = H5Dataset(schema, './sampler_mixed.h5', pair_iter())
+
+        # image rows (192 bytes) dominate the reads, not the 64 rows chunks of label
+        sampler = H5ChunkShuffleSampler(dataset, window=2)
+        assert sampler.chunk_size == 4
+        indices = list(sampler)
+        assert sorted(indices) == list(range(self.data_size))
+        positions = np.argsort(indices)
+        for start in range(0, self.data_size, 4):
+            chunk_positions = positions[start:start+4]
+            assert chunk_positions.max() - chunk_positions.min() < 8
+
+        assert H5ChunkShuffleSampler(dataset, columns=['label']).chunk_size == 64
+        assert chunk_rows(dataset.select(['label'])) == 64
+
+        dataset.close()
+        os.remove('sampler_mixed.h5')
+
+        # auto chunks hold about 1MB of every column, image still sets the unit
+        schema = ( Image(name='image', h=64, w=64), Integer(name='label') )
+        dataset = H5Dataset(schema, './sampler_mixed.h5',
+            ( { 'image': np.zeros((3, 64, 64), dtype='uint8'), 'label': idx } for idx in range(10) ))
+        assert chunk_rows(dataset) == dataset.reader['image'].chunks[0] < 100
+        dataset.close()
+        os.remove('sampler_mixed.h5')
+
+    def test_distributed(self):
+        from h5record.sampler import H5ChunkShuffleSampler
+        samplers = [ H5ChunkShuffleSampler(self.dataset, window=2, num_replicas=3, rank=rank)
+            for rank in range(3) ]
+        indices = [ list(sampler) for sampler in samplers ]
+        assert all( len(idx) == len(samplers[0]) == 35 for idx in indices )
+        assert set(sum(indices, [])) == set(range(self.data_size))
+
+        samplers = [ H5ChunkShuffleSampler(self.dataset, num_replicas=3, rank=rank, drop_last=True)
+            for rank in range(3) ]
+        indices = sum([ list(sampler) for sampler in samplers ], [])
+        assert len(indices) == len(set(indices)) == 102
+
+        dataloader = torch.utils.data.DataLoader(self.dataset, batch_size=16,
+            sampler=H5ChunkShuffleSampler(self.dataset))
+        labels = torch.cat([ batch['label'] for batch in dataloader ])
+        assert sorted(labels.tolist()) == list(range(self.data_size))
@@ -0,0 +1,91 @@
+import unittest
+import os
+import json
+import h5py as h5
+import numpy as np
+from h5record.dataset import H5Dataset, read_columns
+from h5record.attributes import (Image, EncodedImage, Integer, Float16, String,
+    Sequence, FloatSequence, read_schema)
+
+class TestSchemaFile(unittest.TestCase):
+
+
+    def setUp(self):
+        self.schema = (
+            Image(name='image', h=8, w=6, c=3),
+            EncodedImage(name='thumb', h=8, w=8, codec='png'),
+            Integer(name='label'),
+            Float16(name='score', chunk_size=16),
+            String(name='text', storage='flat'),
+            Sequence(name='tokens'),
+            FloatSequence(name='weights', storage='flat'),
+        )
+        if os.path.exists('schema_file.h5'):
+            os.remove('schema_file.h5')
+        rows = ( {
+            'image': np.full((3, 8, 6), idx, dtype=np.uint8),
+            'thumb': np.full((3, 8, 8), idx * 10, dtype=np.uint8),
+            'label': idx,
+            'score': idx / 4,
+            'text': 'row {}'.format(idx),
+            'tokens': np.arange(idx + 1),
+            'weights': np.ones(idx % 3 + 1, dtype=np.float32),
+        } for idx in range(12) )
+        self.dataset = H5Dataset(self.schema, './schema_file.h5', rows, chunk_size=4)
+
+    def tearDown(self):
+        if os.path.exists('schema_file.h5'):
+            os.remove('schema_file.h5')
+
+    def test_stored_schema(self):
+        with h5.File('schema_file.h5', 'r') as fin:
+            configs = json.loads(fin.attrs['schema'])
+            schema = read_schema(fin)
+        assert [ config['class'] for config in configs ] == [ 'Image', 'EncodedImage', 'Integer',
+            'Float16', 'String', 'Sequence', 'FloatSequence' ]
+        assert configs[4]['storage'] == 'flat' and configs[4]['encoding'] == 'utf-8'
+        assert configs[5]['dtype'] == 'vlen:int32'
+        assert configs[3]['args']['chunk_size'] == 16
+        for attribute in self.schema:
+            rebuilt = schema[attribute.name]
+            assert type(rebuilt) is type(attribute)
+            assert rebuilt.config() == attribute.config()
+        assert read_columns('schema_file.h5')['thumb']['config']['args']['codec'] == 'png'
+
+    def test_open(self):
+        dataset = H5Dataset.open('schema_file.h5')
+        assert len(dataset) == 12
+        for idx in range(12):
+            row, expected = dataset[idx], self.dataset[idx]
+            assert row.keys() == expected.keys()
+            assert (row['image'] == expected['image']).all()
+            assert (row['thumb'] == expected['thumb']).all()
+            assert row['text'] == expected['text']
+            assert (row['tokens'][0] == expected['tokens'][0]).all()
+        dataset = H5Dataset.open('schema_file.h5', columns=['label'], to_memory=True)
+        assert list(dataset[[3, 1]].keys()) == ['label']
+
+    def test_open_subset(self):
+        # unselected columns are not built, their class may be missing in the reading process
+        with h5.File('schema_file.h5', 'a') as fout:
+            configs = json.loads(fout.attrs['schema'])
+            configs[4]['class'] = 'MissingText'
+            fout.attrs['schema'] = json.dumps(configs)
+        with self.assertRaises(ValueError):
+            H5Dataset.open('schema_file.h5')
+        dataset = H5Dataset.open('schema_file.h5', columns=['label', 'tokens'])
+        assert list(dataset.schema.keys()) == ['label', 'tokens']
+        row = dataset[5]
+        assert row['label'] == 5 and (row['tokens'][0] == np.arange(6)).all()
+
+    def test_missing_schema(self):
+        with h5.File('schema_file.h5', 'a') as fout:
+            del fout.attrs['schema']
+        with self.assertRaises(ValueError):
+            H5Dataset.open('schema_file.h5')
+        # appending restores the schema of older files
+        H5Dataset(self.schema, './schema_file.h5', iter([]), append_mode=True)
+        assert len(H5Dataset.open('schema_file.h5')) == 12
+
+if __name__ == "__main__":
+    unittest.main()
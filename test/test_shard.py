@@ -0,0 +1,93 @@
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from h5record.dataset import H5Dataset
+from h5record.attributes import Float, Integer, String, Sequence
+
+def make_row(idx):
+    return {
+        'label': idx,
+        'score': idx * 0.5,
+        'text': 'row {}'.format(idx) * (idx % 3 + 1),
+        'tokens': np.arange(idx % 7 + 1),
+    }
+
+class TestShard(unittest.TestCase):
+
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.schema = ( Integer(name='label'), Float(name='score'),
+            String(name='text'), Sequence(name='tokens', storage='flat') )
+        self.shard_items = [ [ make_row(idx) for idx in range(start, start + size) ]
+            for start, size in ((0, 11), (11, 7), (18, 13)) ]
+        self.filename = os.path.join(self.tmp_dir, 'data.h5')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def check_rows(self, dataset, size=31):
+        assert len(dataset) == size
+        for idx in range(size):
+            row = dataset[idx]
+            expected = make_row(idx)
+            assert row['label'] == idx
+            assert row['text'] == expected['text']
+            assert (row['tokens'][0] == expected['tokens']).all()
+
+    def test_build(self):
+        from h5record.shard import build_sharded_dataset, read_shards
+        build_sharded_dataset(self.schema, self.filename, self.shard_items,
+            num_workers=2, buffer_size=4, chunk_size=5)
+        for idx in range(3):
+            assert os.path.exists(os.path.join(self.tmp_dir, 'data-{:05d}-of-00003.h5'.format(idx)))
+
+        shards = read_shards(self.filename)
+        assert [ (shard['start'], shard['stop']) for shard in shards ] == [(0, 11), (11, 18), (18, 31)]
+
+        dataset = H5Dataset(self.schema, self.filename)
+        self.check_rows(dataset)
+        batch = dataset[[30, 0, 12]]
+        assert list(batch['label']) == [30, 0, 12]
+        # schema of the shards is copied to the index file
+        self.check_rows(H5Dataset.open(self.filename))
+
+    def test_relocate(self):
+        from h5record.shard import build_sharded_dataset
+        build_sharded_dataset(self.schema, self.filename, self.shard_items, num_workers=1)
+        # index and shards moved together still resolve the relative shard paths
+        moved = tempfile.mkdtemp()
+        try:
+            for name in os.listdir(self.tmp_dir):
+                shutil.move(os.path.join(self.tmp_dir, name), moved)
+            self.check_rows(H5Dataset(self.schema, os.path.join(moved, 'data.h5')))
+        finally:
+            shutil.rmtree(moved)
+
+    def test_sampler(self):
+        from h5record.shard import build_sharded_dataset, H5ShardSampler, read_shards
+        build_sharded_dataset(self.schema, self.filename, self.shard_items, num_workers=1)
+        dataset = H5Dataset(self.schema, self.filename)
+        shards = read_shards(self.filename)
+        sampler = H5ShardSampler(dataset, batch_size=4, num_workers=2, seed=1)
+        batches = list(sampler)
+        assert len(batches) == len(sampler)
+        indices = sorted( idx for batch in batches for idx in batch )
+        assert indices == list(range(len(dataset)))
+
+        def shard_of(idx):
+            for shard_id, shard in enumerate(shards):
+                if shard['start'] <= idx < shard['stop']:
+                    return shard_id
+        # worker 0 owns shards 0 and 2, worker 1 owns shard 1 until it runs out
+        for position, batch in enumerate(batches[:4]):
+            worker_id = position % 2
+            assert all( shard_of(idx) % 2 == worker_id for idx in batch )
+
+        sampler.set_epoch(1)
+        assert list(sampler) != batches
+
+if __name__ == "__main__":
+    unittest.main()
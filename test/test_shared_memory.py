@@ -0,0 +1,71 @@
+import unittest
+import os
+import numpy as np
+import torch
+from h5record.dataset import H5Dataset
+
+class TestSharedMemory(unittest.TestCase):
+
+
+    def setUp(self):
+        from h5record.attributes import String, Integer, Image, Sequence, ImageSequence
+        self.schema = (
+            Image(name='image', h=8, w=8),
+            Integer(name='label'),
+            String(name='sentence'),
+            Sequence(name='tokens'),
+            ImageSequence(name='gif', h=4, w=4),
+        )
+        self.data_size = 24
+
+        def pair_iter():
+            for idx in range(self.data_size):
+                yield {
+                    'image': np.full((3, 8, 8), idx, dtype='uint8'),
+                    'label': idx,
+                    'sentence': '句子 {}'.format(idx),
+                    'tokens': np.arange(idx+1),
+                    'gif': np.full((3, 4, 4, idx % 3 + 1), idx, dtype='uint8').flatten(),
+                }
+        if os.path.exists('shared.h5'):
+            os.remove('shared.h5')
+        H5Dataset(self.schema, './shared.h5', pair_iter(), chunk_size=4, compression='lzf')
+
+    def tearDown(self):
+        os.remove('shared.h5')
+
+    def test_shared_columns(self):
+        dataset = H5Dataset(self.schema, './shared.h5', to_memory=True, shared_memory=True)
+        for idx in range(self.data_size):
+            row = dataset[idx]
+            assert row['label'] == idx
+            assert (row['image'] == idx).all()
+            assert row['sentence'] == '句子 {}'.format(idx)
+            assert (row['tokens'][0] == np.arange(idx+1)).all()
+            assert row['gif'].shape == (3, 4, 4, idx % 3 + 1)
+
+        batch = dataset[[5, 3, 3]]
+        assert list(batch['sentence']) == [ '句子 5', '句子 3', '句子 3' ]
+
+        names = [ shared.name for spec in dataset.memory.arrays.values() for shared in spec[1:] ]
+        assert all( os.path.exists('/dev/shm/' + name) for name in names )
+        del row, batch
+        dataset.release_memory()
+        assert not any( os.path.exists('/dev/shm/' + name) for name in names )
+
+    def test_dataloader_workers(self):
+        dataset = H5Dataset(self.schema, './shared.h5', to_memory=True, shared_memory=True,
+            transform=lambda row: { 'label': row['label'], 'image': row['image'], 'sentence': row['sentence'] })
+        for context in ['fork', 'spawn']:
+            if context == 'spawn':
+                # lambda transform can not be pickled
+                dataset.transform = None
+                dataset.schema = { key: dataset.schema[key] for key in ['label', 'image'] }
+            dataloader = torch.utils.data.DataLoader(dataset, batch_size=4,
+                shuffle=True, num_workers=2, multiprocessing_context=context)
+            labels = []
+            for batch in dataloader:
+                assert (batch['image'][:, 0, 0, 0] == batch['label']).all()
+                labels += batch['label'].tolist()
+            assert sorted(labels) == list(range(self.data_size))
+        dataset.release_memory()
@@ -0,0 +1,83 @@
+import unittest
+import os
+import numpy as np
+from torch.utils.data import DataLoader
+from h5record.dataset import H5Dataset
+from h5record.attributes import Integer, String, Float
+
+def collate(rows):
+    return rows
+
+class TestStream(unittest.TestCase):
+
+
+    def setUp(self):
+        self.schema = ( Integer(name='label'), String(name='text'), Float(name='score') )
+        self.size = 103
+        self.tearDown()
+        rows = ( { 'label': idx, 'text': 'row {}'.format(idx), 'score': idx / 2 } for idx in range(self.size) )
+        self.dataset = H5Dataset(self.schema, './stream.h5', rows, chunk_size=8, buffer_size=10)
+
+    def tearDown(self):
+        for filename in ['stream.h5', 'stream_mixed.h5']:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def test_sequential(self):
+        from h5record.stream import H5IterableDataset
+        stream = H5IterableDataset(self.dataset, block_rows=20)
+        # rounded down to chunk size
+        assert stream.block_rows == 16
+        rows = list(stream)
+        assert len(rows) == len(stream) == self.size
+        for idx, row in enumerate(rows):
+            assert row['label'] == idx
+            assert row['text'] == 'row {}'.format(idx)
+            assert abs(row['score'] - idx / 2) < 1e-6
+
+    def test_partition(self):
+        from h5record.stream import H5IterableDataset
+        labels = []
+        for rank in range(2):
+            stream = H5IterableDataset(self.dataset, block_rows=8, num_replicas=2, rank=rank)
+            rank_labels = [ int(row['label']) for row in stream ]
+            assert len(rank_labels) == len(stream)
+            labels += rank_labels
+        assert sorted(labels) == list(range(self.size))
+
+        stream = H5IterableDataset(self.dataset, block_rows=8)
+        loader = DataLoader(stream, batch_size=None, num_workers=2, collate_fn=collate)
+        labels = [ int(row['label']) for row in loader ]
+        assert sorted(labels) == list(range(self.size))
+
+    def test_shuffle_buffer(self):
+        from h5record.stream import H5IterableDataset
+        stream = H5IterableDataset(self.dataset, block_rows=8, shuffle_buffer=16, seed=3)
+        first = [ int(row['label']) for row in stream ]
+        assert sorted(first) == list(range(self.size))
+        assert first != list(range(self.size))
+        assert [ int(row['label']) for row in stream ] == first
+        stream.set_epoch(1)
+        assert [ int(row['label']) for row in stream ] != first
+
+    def test_mixed_chunks(self):
+        from h5record.stream import H5IterableDataset
+        from h5record.attributes import Image
+        # auto chunks of label hold far more rows than the 8 requested
+        schema = ( Image(name='image', h=32, w=32), Integer(name='label') )
+        rows = ( { 'image': np.full((3, 32, 32), idx, dtype='uint8'), 'label': idx } for idx in range(self.size) )
+        dataset = H5Dataset(schema, './stream_mixed.h5', rows)
+        assert dataset.reader['label'].chunks[0] > 8
+        stream = H5IterableDataset(dataset, block_rows=8)
+        assert stream.block_rows == 8
+        assert all( stop - start <= 8 for start, stop in stream.blocks() )
+        labels = [ int(row['label']) for row in stream ]
+        assert labels == list(range(self.size))
+
+        image_chunk = dataset.reader['image'].chunks[0]
+        stream = H5IterableDataset(dataset, block_rows=image_chunk * 2 + 1)
+        assert stream.block_rows == image_chunk * 2
+        dataset.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -77,3 +77,23 @@ class TestSWRM(unittest.TestCase):
 
         os.remove('gif_dataset.h5')
 
+    @unittest.skipIf(not os.path.exists('/proc/self/fd'), 'needs /proc to count file descriptors')
+    def test_multiprocessing_close(self):
+        from h5record.dataset import H5Dataset
+        from h5record.attributes import Integer, Sequence
+        schema = [ Integer(name='label'), Sequence(name='tokens') ]
+        if os.path.exists('fd_dataset.h5'):
+            os.remove('fd_dataset.h5')
+        rows = ( { 'label': idx, 'tokens': np.arange(idx + 1) } for idx in range(5) )
+        dataset = H5Dataset(schema, './fd_dataset.h5', rows, multiprocess=True)
+
+        num_fds = len(os.listdir('/proc/self/fd'))
+        for _ in range(20):
+            dataset.refresh()
+            assert dataset[4]['label'] == 4
+        dataset.close()
+        # the file descriptor of AtomicFile is closed with the dataset
+        assert len(os.listdir('/proc/self/fd')) == num_fds
+
+        os.remove('fd_dataset.h5')
+
@@ -0,0 +1,73 @@
+import unittest
+import os
+import time
+import multiprocessing as mp
+import numpy as np
+from torch.utils.data import DataLoader
+from h5record.dataset import H5Dataset
+from h5record.writer import H5Writer
+from h5record.attributes import Integer, String, Sequence
+
+def make_schema():
+    return ( Integer(name='label'), String(name='text', storage='flat'),
+        Sequence(name='tokens', storage='flat') )
+
+def make_row(idx):
+    return { 'label': idx, 'text': 'row {}'.format(idx), 'tokens': np.arange(idx % 5 + 1) }
+
+def slow_writer(size, ready):
+    with H5Writer(make_schema(), './tail.h5', swmr=True, buffer_size=1000, flush_interval=0.05) as writer:
+        for idx in range(size):
+            writer.write(make_row(idx))
+            if idx == 0:
+                ready.put(True)
+            time.sleep(0.01)
+
+def collate(rows):
+    return rows
+
+class TestTail(unittest.TestCase):
+
+
+    def setUp(self):
+        if os.path.exists('tail.h5'):
+            os.remove('tail.h5')
+
+    def tearDown(self):
+        if os.path.exists('tail.h5'):
+            os.remove('tail.h5')
+
+    def test_tail_writer(self):
+        from h5record.tail import H5TailDataset
+        ctx = mp.get_context('spawn')
+        ready = ctx.Queue()
+        writer = ctx.Process(target=slow_writer, args=(60, ready))
+        writer.start()
+        try:
+            ready.get(timeout=60)
+            dataset = H5Dataset(make_schema(), './tail.h5')
+            stream = H5TailDataset(dataset, block_rows=8, poll_interval=0.05, timeout=3)
+            labels = []
+            for row in stream:
+                assert row['text'] == 'row {}'.format(row['label'])
+                labels.append(int(row['label']))
+        finally:
+            writer.join(timeout=60)
+        # rows arrive in order while the writer is running, including the partial last block
+        assert labels == list(range(60))
+
+    def test_max_rows_workers(self):
+        from h5record.tail import H5TailDataset
+        dataset = H5Dataset(make_schema(), './tail.h5', ( make_row(idx) for idx in range(30) ))
+        stream = H5TailDataset(dataset, start=2, block_rows=4, poll_interval=0.01, max_rows=25)
+        assert [ int(row['label']) for row in stream ] == list(range(2, 25))
+
+        loader = DataLoader(stream, batch_size=None, num_workers=2, collate_fn=collate)
+        labels = sorted( int(row['label']) for row in loader )
+        assert labels == list(range(2, 25))
+
+        stream = H5TailDataset(dataset, block_rows=4, poll_interval=0.01, timeout=0.1)
+        assert len(list(stream)) == 30
+
+if __name__ == "__main__":
+    unittest.main()
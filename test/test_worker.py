@@ -0,0 +1,56 @@
+import unittest
+import os
+import pickle
+import numpy as np
+import torch
+from h5record.dataset import H5Dataset, worker_init_fn
+
+class TestWorker(unittest.TestCase):
+
+
+    def setUp(self):
+        from h5record.attributes import String, Integer, Image
+        self.schema = (
+            Image(name='image', h=8, w=8),
+            Integer(name='label'),
+            String(name='sentence'),
+        )
+        self.data_size = 32
+
+        def pair_iter():
+            for idx in range(self.data_size):
+                yield {
+                    'image': np.full((3, 8, 8), idx, dtype='uint8'),
+                    'label': idx,
+                    'sentence': 'sentence {}'.format(idx),
+                }
+        if os.path.exists('worker.h5'):
+            os.remove('worker.h5')
+        self.dataset = H5Dataset(self.schema, './worker.h5', pair_iter(), chunk_size=4, compression='gzip')
+
+    def tearDown(self):
+        self.dataset.close()
+        os.remove('worker.h5')
+
+    def test_lazy_reader(self):
+        assert self.dataset._reader is None
+        assert self.dataset[3]['label'] == 3
+        assert self.dataset._reader_pid == os.getpid()
+
+        clone = pickle.loads(pickle.dumps(self.dataset))
+        assert clone._reader is None
+        assert clone[5]['sentence'] == 'sentence 5'
+        clone.close()
+
+    def test_dataloader_workers(self):
+        # read once in main process so forked workers inherit an open handle
+        assert self.dataset[0]['label'] == 0
+        for context in ['fork', 'spawn']:
+            dataloader = torch.utils.data.DataLoader(self.dataset, batch_size=4,
+                shuffle=True, num_workers=2, worker_init_fn=worker_init_fn,
+                multiprocessing_context=context)
+            labels = []
+            for batch in dataloader:
+                assert (batch['image'][:, 0, 0, 0] == batch['label']).all()
+                labels += batch['label'].tolist()
+            assert sorted(labels) == list(range(self.data_size))
@@ -0,0 +1,86 @@
+import unittest
+import os
+import numpy as np
+from h5record.dataset import H5Dataset
+
+class TestWriter(unittest.TestCase):
+
+
+    def test_buffered_flush(self):
+        from h5record.attributes import String, Integer, Float, Sequence
+        schema = (
+            String(name='sentence'),
+            Integer(name='label'),
+            Float(name='score'),
+            Sequence(name='tokens'),
+        )
+        data_size = 11
+
+        def pair_iter():
+            for idx in range(data_size):
+                yield {
+                    'sentence': 'sentence {}'.format(idx),
+                    'label': idx,
+                    'score': idx / 10,
+                    'tokens': np.arange(idx+1),
+                }
+        if os.path.exists('buffered.h5'):
+            os.remove('buffered.h5')
+
+        # buffer size which does not divide data size, last flush happens on close
+        dataset = H5Dataset(schema, './buffered.h5', pair_iter(), buffer_size=3)
+        assert len(dataset) == data_size
+
+        for idx in range(data_size):
+            row = dataset[idx]
+            assert row['sentence'] == 'sentence {}'.format(idx)
+            assert row['label'] == idx
+            assert abs(row['score'] - idx / 10) < 1e-6
+            assert (row['tokens'][0] == np.arange(idx+1)).all()
+
+        os.remove('buffered.h5')
+
+    def test_writer_context(self):
+        from h5record.writer import H5Writer
+        from h5record.attributes import Image, ImageSequence
+        schema = (
+            Image(name='image', h=8, w=8),
+            ImageSequence(name='gif', h=8, w=8),
+        )
+        images = [ np.random.randint(0, 255, (3, 8, 8)).astype('uint8') for _ in range(5) ]
+        gifs = [ np.random.randint(0, 255, (3, 8, 8, idx+1)).astype('uint8').flatten() for idx in range(5) ]
+        if os.path.exists('writer.h5'):
+            os.remove('writer.h5')
+
+        with H5Writer(schema, 'writer.h5', buffer_size=2) as writer:
+            for image, gif in zip(images, gifs):
+                writer.write({ 'image': image, 'gif': gif })
+        assert writer.num_entries == len(images)
+
+        dataset = H5Dataset(schema, './writer.h5')
+        assert len(dataset) == len(images)
+        for idx in range(len(images)):
+            row = dataset[idx]
+            assert (row['image'] == images[idx]).all()
+            assert row['gif'].shape == (3, 8, 8, idx+1)
+            assert (row['gif'].flatten() == gifs[idx]).all()
+
+        os.remove('writer.h5')
+
+    def test_empty_ingest(self):
+        from h5record.attributes import Integer
+        schema = ( Integer(name='label'), )
+        if os.path.exists('empty.h5'):
+            os.remove('empty.h5')
+
+        # no row, no file left behind which would skip the next ingest
+        with self.assertRaises(TypeError):
+            H5Dataset(schema, './empty.h5', None)
+        assert not os.path.exists('empty.h5')
+        with self.assertRaises(FileNotFoundError):
+            H5Dataset(schema, './empty.h5', iter([]))
+        assert not os.path.exists('empty.h5')
+
+        dataset = H5Dataset(schema, './empty.h5', ( { 'label': idx } for idx in range(3) ))
+        assert len(dataset) == 3 and dataset[2]['label'] == 2
+        os.remove('empty.h5')